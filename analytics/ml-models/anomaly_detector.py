@@ -10,13 +10,57 @@ import numpy as np
 import pandas as pd
 from sklearn.ensemble import IsolationForest
 from sklearn.neighbors import LocalOutlierFactor
-from sklearn.cluster import DBSCAN
 from sklearn.preprocessing import StandardScaler
 from sklearn.decomposition import PCA
-from neo4j import GraphDatabase
 import logging
 from typing import Dict, List, Tuple, Optional
 import json
+from datetime import datetime, timezone
+
+from density_clustering import ChunkedDBSCAN, GraphHDBSCAN
+from detection_results import DetectionResult, RiskScores
+from ensemble import run_methods
+from explanations import EXPLAIN_PRINT_LIMIT, ReasonRule, explain
+from graph_source import GraphSource, Neo4jGraphSource
+from model_registry import (ANOMALY_MODEL_DIR, ModelBundle, ModelRegistry, drift_reference, feature_hashes,
+                            retrain_reason)
+from neighbor_lof import NeighborLOF
+
+# Registry name of the saved Isolation Forest
+ISOLATION_FOREST_MODEL = 'isolation_forest'
+
+# Populations from which LOF switches to NeighborLOF's chunked tree queries
+CHUNKED_LOF_MIN_USERS = 100000
+
+# Detection methods run_ensemble schedules by default
+ENSEMBLE_METHODS = ('isolation_forest_detection', 'local_outlier_factor_detection', 'clustering_analysis')
+
+# Composite risk added by each method that flags a user; other methods add 0
+METHOD_RISK_WEIGHTS = {
+    'Isolation Forest': 3,      # Global anomalies are high priority
+    'DBSCAN Clustering': 2,     # Outliers are medium-high priority
+    'HDBSCAN Clustering': 2,
+    'Local Outlier Factor': 2,  # Context anomalies are medium-high priority
+}
+# Risk levels by composite score: [0, 2) LOW, [2, 4) MEDIUM, [4, 6) HIGH, 6+ CRITICAL
+RISK_LEVEL_BINS = [-np.inf, 2, 4, 6, np.inf]
+RISK_LEVELS = ['LOW', 'MEDIUM', 'HIGH', 'CRITICAL']
+
+# Why a user stands out, per method (see explanations.explain)
+ISOLATION_FOREST_REASONS = [
+    ReasonRule("Extremely high access activity", 'total_access_count', 1, 2),
+    ReasonRule("Above-average sensitive data access", 'sensitive_data_reachable', 1, 1),
+    ReasonRule("Accessing unusually diverse resources", 'target_diversity', 1, 1),
+]
+LOCAL_OUTLIER_REASONS = [
+    ReasonRule("High access for {group} role", 'total_access_count', 1.5),
+    ReasonRule("Above-average sensitive access for role", 'sensitive_data_reachable', 1.5),
+]
+CLUSTER_OUTLIER_RISK_FACTORS = [
+    ReasonRule("Access activity over twice the average", 'total_access_count', 2),
+    ReasonRule("Sensitive access over twice the average", 'sensitive_data_reachable', 2),
+    ReasonRule("Unusually diverse resources", 'target_diversity', 1.5),
+]
 
 class EducationalAnomalyDetector:
     """
@@ -31,7 +75,9 @@ class EducationalAnomalyDetector:
     
     def __init__(self, neo4j_uri: str = "bolt://neo4j:7687", 
                  neo4j_user: str = "neo4j", 
-                 neo4j_password: str = "cloudsecurity"):
+                 neo4j_password: str = "cloudsecurity",
+                 source: Optional[GraphSource] = None,
+                 registry: Optional[ModelRegistry] = None):
         """
         Initialize the educational anomaly detection system
         
@@ -39,12 +85,20 @@ class EducationalAnomalyDetector:
             neo4j_uri: Neo4j database connection string
             neo4j_user: Database username
             neo4j_password: Database password
+            source: Where features are read from; defaults to the Neo4j database above
+            registry: Where trained models are saved and reloaded; None retrains every run
         """
-        self.driver = GraphDatabase.driver(neo4j_uri, auth=(neo4j_user, neo4j_password))
+        self.source = source or Neo4jGraphSource(neo4j_uri, neo4j_user, neo4j_password)
         self.scaler = StandardScaler()
         self.models = {}
         self.explanations = {}
         self.feature_names = []
+        # (feature DataFrame, its scaled float32 matrix), shared by every detection method
+        self._snapshot = None
+        self.registry = registry
+        # The saved model scoring the current snapshot, when the registry had a usable one
+        self.model_bundle: Optional[ModelBundle] = None
+        self._training_stats = None  # drift reference of the current snapshot
         
         # Configure logging for educational purposes
         logging.basicConfig(level=logging.INFO)
@@ -69,47 +123,7 @@ class EducationalAnomalyDetector:
         print("=" * 50)
         print("Converting security concepts into machine learning features...")
         
-        query = """
-        MATCH (user:User)
-        OPTIONAL MATCH (user)-[access_rel]->(target)
-        WITH user,
-             count(access_rel) as total_access_count,
-             count(DISTINCT target) as unique_targets_accessed,
-             collect(DISTINCT labels(target)[0]) as target_types,
-             collect(DISTINCT type(access_rel)) as access_methods
-        
-        OPTIONAL MATCH (user)-[*1..3]->(sensitive)
-        WHERE sensitive.contains_pii = true OR sensitive.type = 'S3Bucket'
-        WITH user, total_access_count, unique_targets_accessed, 
-             target_types, access_methods,
-             count(DISTINCT sensitive) as sensitive_data_reachable
-        
-        OPTIONAL MATCH (user)-[:ASSUMES_ROLE]->(role:Role)
-        WITH user, total_access_count, unique_targets_accessed,
-             target_types, access_methods, sensitive_data_reachable,
-             count(role) as roles_assumed
-        
-        RETURN 
-            user.name as user_name,
-            user.access_level as access_level,
-            total_access_count,
-            unique_targets_accessed,
-            size(target_types) as target_diversity,
-            size(access_methods) as access_method_diversity,
-            sensitive_data_reachable,
-            roles_assumed,
-            CASE user.access_level
-                WHEN 'administrator' THEN 5
-                WHEN 'developer' THEN 3
-                ELSE 1
-            END as privilege_level
-        """
-        
-        with self.driver.session() as session:
-            result = session.run(query)
-            data = [dict(record) for record in result]
-        
-        df = pd.DataFrame(data)
+        df = pd.DataFrame(self.source.security_feature_columns(), copy=False)
         
         # Educational feature explanations
         feature_explanations = {
@@ -128,9 +142,124 @@ class EducationalAnomalyDetector:
                 print(f"• {feature}: {explanation}")
         
         self.feature_names = [col for col in df.columns if col not in ['user_name', 'access_level']]
+        self._snapshot = None
         
         return df
     
+    def feature_matrix(self, df: pd.DataFrame) -> np.ndarray:
+        """
+        Scaled feature matrix for a feature snapshot, built once and reused
+        
+        Every detection method works on the same standardized features, so the
+        matrix is built as one contiguous float32 array per DataFrame returned
+        by extract_security_features and cached until the next extraction.
+        
+        Args:
+            df: DataFrame with security features
+            
+        Returns:
+            C-contiguous float32 array, one row per user in df order
+        """
+        if self._snapshot is not None and self._snapshot[0] is df:
+            return self._snapshot[1]
+        
+        X = np.ascontiguousarray(df[self.feature_names].fillna(0).to_numpy(dtype=np.float32))
+        self.model_bundle = None
+        if self.registry is not None:
+            self._training_stats = drift_reference(X)
+            self.model_bundle = self._reusable_model(X)
+        # A reused model keeps the scaling it was trained with
+        if self.model_bundle is not None:
+            self.scaler = self.model_bundle.scaler
+        else:
+            self.scaler.fit(X)
+        # Scale in place; StandardScaler keeps float32 input as float32
+        self.scaler.transform(X, copy=False)
+        self._snapshot = (df, X)
+        return X
+    
+    def _reusable_model(self, X: np.ndarray) -> Optional[ModelBundle]:
+        """The saved Isolation Forest if it still fits this population, else None"""
+        bundle = self.registry.load(ISOLATION_FOREST_MODEL)
+        if bundle is None:
+            print("\n💾 No saved model yet; training a new one")
+            return None
+        reason = retrain_reason(bundle, self.feature_names, X)
+        if reason:
+            print(f"\n🔁 Retraining saved model: {reason}")
+            return None
+        print(f"\n♻️ Reusing saved model trained {bundle.trained_at} on {bundle.n_samples} users")
+        return bundle
+    
+    def _save_model(self, model, contamination, n_samples: int) -> None:
+        drift_edges, drift_expected = self._training_stats
+        self.model_bundle = ModelBundle(model, self.scaler, list(self.feature_names), contamination,
+                                        datetime.now(timezone.utc).isoformat(), n_samples,
+                                        drift_edges, drift_expected)
+        path = self.registry.save(ISOLATION_FOREST_MODEL, self.model_bundle)
+        print(f"\n💾 Saved model to {path}")
+    
+    @classmethod
+    def for_worker(cls, state: dict, df: pd.DataFrame, X: np.ndarray) -> 'EducationalAnomalyDetector':
+        """
+        Rebuild a detector in an ensemble worker from another detector's state
+        
+        The copy has no graph source and starts with the feature snapshot
+        (df, X) already scaled, so its detection methods skip straight to
+        fitting their models.
+        """
+        detector = cls.__new__(cls)
+        detector.__dict__.update(state)
+        detector.source = None
+        detector.models = {}
+        detector._snapshot = (df, X)
+        return detector
+    
+    def run_ensemble(self, df: pd.DataFrame,
+                     methods: Optional[Dict[str, dict]] = None,
+                     max_workers: Optional[int] = None) -> List[Dict]:
+        """
+        Run several detection methods at once, each in its own process
+        
+        The feature matrix is scaled here once and shared with the workers
+        through shared memory; each method's report is printed in method
+        order once all of them have finished. Workers are spawned and
+        re-import the calling script, so call this under
+        `if __name__ == "__main__":`; without the guard the pool fails and
+        the methods run one after another instead.
+        
+        Args:
+            df: DataFrame with security features
+            methods: Detection method name -> keyword arguments, e.g.
+                {'isolation_forest_detection': {'n_jobs': 4}, 'clustering_analysis': {'n_jobs': 4}};
+                defaults to ENSEMBLE_METHODS
+            max_workers: Worker processes; defaults to one per method
+            
+        Returns:
+            One result per method, in order, ready for generate_comprehensive_report
+        """
+        if methods is None:
+            methods = {method: {} for method in ENSEMBLE_METHODS}
+        
+        X = self.feature_matrix(df)
+        # Everything a worker needs except what it reads from shared memory
+        state = {key: value for key, value in self.__dict__.items()
+                 if key not in ('source', 'models', '_snapshot')}
+        
+        print(f"\n⚡ Running {len(methods)} detection methods concurrently on {len(df)} users")
+        outcomes = run_methods(type(self), state, df, X, list(methods.items()), max_workers)
+        
+        results = []
+        for outcome in outcomes:
+            print(outcome.output, end='')
+            self.models.update(outcome.models)
+            # Keep a model the Isolation Forest worker trained and saved
+            if outcome.model_bundle is not None and (self.model_bundle is None or
+                                                     outcome.model_bundle.trained_at != self.model_bundle.trained_at):
+                self.model_bundle = outcome.model_bundle
+            results.append(DetectionResult(outcome.result, features=df))
+        return results
+    
     def explain_algorithm(self, algorithm_name: str, purpose: str, how_it_works: str, 
                          security_applications: List[str]) -> None:
         """
@@ -152,13 +281,15 @@ class EducationalAnomalyDetector:
         print("=" * 60)
     
     def isolation_forest_detection(self, df: pd.DataFrame, 
-                                 contamination: float = 0.1) -> Dict:
+                                 contamination: float = 0.1,
+                                 n_jobs: Optional[int] = None) -> Dict:
         """
         Isolation Forest anomaly detection with educational explanations
         
         Args:
             df: DataFrame with security features
             contamination: Expected percentage of anomalies
+            n_jobs: Parallel jobs for fitting and scoring the trees
             
         Returns:
             Dictionary with results and explanations
@@ -187,71 +318,146 @@ class EducationalAnomalyDetector:
             ]
         )
         
-        # Prepare features
-        X = df[self.feature_names].fillna(0)
-        X_scaled = self.scaler.fit_transform(X)
+        X_scaled = self.feature_matrix(df)
         
-        # Train model
-        model = IsolationForest(
-            contamination=contamination,
-            random_state=42,
-            n_estimators=100
-        )
-        
-        predictions = model.fit_predict(X_scaled)
+        model = None
+        if self.model_bundle is not None:
+            reason = retrain_reason(self.model_bundle, self.feature_names, contamination=contamination)
+            if reason:
+                print(f"\n🔁 Retraining saved model: {reason}")
+            else:
+                model = self.model_bundle.model
+                # Parallelism is the caller's choice, not part of the saved model
+                model.n_jobs = n_jobs
+        if model is None:
+            # Train model
+            model = IsolationForest(
+                contamination=contamination,
+                random_state=42,
+                n_estimators=100,
+                n_jobs=n_jobs
+            )
+            model.fit(X_scaled)
+            if self.registry is not None:
+                self._save_model(model, contamination, len(X_scaled))
+        
+        # predict() is decision_function() < 0; score once and derive the flags
         anomaly_scores = model.decision_function(X_scaled)
-        
-        # Add results to dataframe
-        results_df = df.copy()
-        results_df['is_anomaly'] = predictions == -1
-        results_df['anomaly_score'] = anomaly_scores
+        is_anomaly = anomaly_scores < 0
+        if self.registry is not None:
+            self.registry.save_scored_hashes(ISOLATION_FOREST_MODEL, feature_hashes(df, self.feature_names))
         
         # Educational analysis
-        anomalies = results_df[results_df['is_anomaly']]
-        normal_users = results_df[~results_df['is_anomaly']]
+        anomaly_rows = np.flatnonzero(is_anomaly)
+        normal_count = len(df) - len(anomaly_rows)
         
         print(f"\n🎯 Isolation Forest Results:")
-        print(f"• Anomalies detected: {len(anomalies)} ({len(anomalies)/len(results_df)*100:.1f}%)")
-        print(f"• Normal users: {len(normal_users)}")
+        print(f"• Anomalies detected: {len(anomaly_rows)} ({len(anomaly_rows)/len(df)*100:.1f}%)")
+        print(f"• Normal users: {normal_count}")
+        
+        # Reasons for every anomaly at once, against the normal users' statistics
+        ranked = anomaly_rows[np.argsort(anomaly_scores[anomaly_rows], kind='stable')]
+        reasons = explain(df, ranked, ISOLATION_FOREST_REASONS, reference=~is_anomaly)
         
         # Detailed anomaly analysis
-        if len(anomalies) > 0:
+        if len(ranked) > 0:
             print(f"\n🚨 Security Anomalies Detected:")
-            for _, user in anomalies.sort_values('anomaly_score').iterrows():
+            for i, row in enumerate(ranked[:EXPLAIN_PRINT_LIMIT]):
+                user = df.iloc[row]
                 print(f"\n🔍 {user['user_name']} ({user['access_level']})")
-                print(f"   • Anomaly Score: {user['anomaly_score']:.3f} (lower = more suspicious)")
+                print(f"   • Anomaly Score: {anomaly_scores[row]:.3f} (lower = more suspicious)")
                 print(f"   • Access Activity: {user['total_access_count']} resources")
                 print(f"   • Sensitive Access: {user['sensitive_data_reachable']} resources")
                 
-                # Generate educational explanation
-                reasons = []
-                if user['total_access_count'] > normal_users['total_access_count'].mean() + 2*normal_users['total_access_count'].std():
-                    reasons.append("Extremely high access activity")
-                if user['sensitive_data_reachable'] > normal_users['sensitive_data_reachable'].mean() + normal_users['sensitive_data_reachable'].std():
-                    reasons.append("Above-average sensitive data access")
-                if user['target_diversity'] > normal_users['target_diversity'].mean() + normal_users['target_diversity'].std():
-                    reasons.append("Accessing unusually diverse resources")
-                
-                if reasons:
-                    print(f"   • Likely reasons: {'; '.join(reasons)}")
+                # Educational explanation
+                user_reasons = reasons.reason_text(i)
+                if user_reasons:
+                    print(f"   • Likely reasons: {'; '.join(user_reasons)}")
                 else:
                     print(f"   • Complex anomaly pattern - requires investigation")
+            if len(ranked) > EXPLAIN_PRINT_LIMIT:
+                print(f"\n   ... and {len(ranked) - EXPLAIN_PRINT_LIMIT} more anomalies (see the returned reasons)")
         
         # Store model and results
         self.models['isolation_forest'] = model
         
-        return {
+        return DetectionResult({
             'model': model,
-            'results': results_df,
-            'anomalies': anomalies,
-            'normal_users': normal_users,
+            'features': df,
+            'is_anomaly': is_anomaly,
+            'anomaly_score': anomaly_scores,
+            'flags': is_anomaly,
+            'reasons': reasons,
             'method': 'Isolation Forest',
             'explanation': 'Global anomaly detection using random isolation'
-        }
+        })
+    
+    def score_new_users(self, df: pd.DataFrame) -> Dict:
+        """
+        Score only new and changed users against the saved Isolation Forest
+        
+        Users whose features hash the same as when they were last scored are
+        skipped, and nothing is refit, so a daily delta of a few thousand
+        users takes milliseconds. When the saved model is due for retraining
+        (schema change, age or drift over the whole population), it is refit
+        and every user is scored instead.
+        
+        Args:
+            df: DataFrame with security features for the current population
+            
+        Returns:
+            Dictionary with results for the new and changed users, or for
+            every user after a refit
+        """
+        bundle = self.model_bundle or (self.registry.load(ISOLATION_FOREST_MODEL) if self.registry else None)
+        if bundle is None:
+            raise ValueError("No trained Isolation Forest to score against; run isolation_forest_detection first")
+        
+        X = np.ascontiguousarray(df[self.feature_names].fillna(0).to_numpy(dtype=np.float32))
+        reason = retrain_reason(bundle, self.feature_names, X)
+        if reason:
+            print(f"\n🔁 Retraining saved model: {reason}")
+            # Rebuild the snapshot so feature_matrix checks the saved model against this population
+            self._snapshot = None
+            return self.isolation_forest_detection(df, contamination=bundle.contamination)
+        
+        hashes = feature_hashes(df, bundle.feature_names)
+        previous = self.registry.scored_hashes(ISOLATION_FOREST_MODEL) if self.registry else None
+        if previous is None or previous.empty:
+            changed = np.ones(len(df), dtype=bool)
+        else:
+            changed = previous.reindex(hashes.index, fill_value=0).to_numpy() != hashes.to_numpy()
+        rows = np.flatnonzero(changed)
+        delta = df.iloc[rows]
+        
+        X = X[rows]
+        is_anomaly = np.zeros(len(delta), dtype=bool)
+        anomaly_scores = np.zeros(len(delta), dtype=np.float64)
+        if len(delta):
+            bundle.scaler.transform(X, copy=False)
+            anomaly_scores = bundle.model.decision_function(X)
+            is_anomaly = anomaly_scores < 0
+        if self.registry is not None:
+            self.registry.save_scored_hashes(ISOLATION_FOREST_MODEL, hashes)
+        
+        print(f"\n🎯 Incremental Scoring: {len(delta)} new or changed users of {len(df)}")
+        print(f"• Anomalies among them: {int(is_anomaly.sum())}")
+        
+        return DetectionResult({
+            'model': bundle.model,
+            'features': delta,
+            'is_anomaly': is_anomaly,
+            'anomaly_score': anomaly_scores,
+            'flags': is_anomaly,
+            'method': 'Isolation Forest',
+            'explanation': 'New and changed users scored against the saved model'
+        })
     
     def local_outlier_factor_detection(self, df: pd.DataFrame,
                                      n_neighbors: int = 5,
-                                     contamination: float = 0.15) -> Dict:
+                                     contamination: float = 0.15,
+                                     neighbor_index: Optional[str] = None,
+                                     n_jobs: Optional[int] = None) -> Dict:
         """
         Local Outlier Factor detection with educational explanations
         
@@ -259,6 +465,10 @@ class EducationalAnomalyDetector:
             df: DataFrame with security features
             n_neighbors: Number of neighbors to consider
             contamination: Expected percentage of outliers
+            neighbor_index: 'kd_tree' or 'ball_tree' to score with NeighborLOF in bounded
+                memory, 'exact' for sklearn's LocalOutlierFactor; None picks NeighborLOF
+                from CHUNKED_LOF_MIN_USERS users up
+            n_jobs: Parallel jobs for the neighbor queries
             
         Returns:
             Dictionary with results and explanations
@@ -288,145 +498,212 @@ class EducationalAnomalyDetector:
             ]
         )
         
-        # Prepare features
-        X = df[self.feature_names].fillna(0)
-        X_scaled = self.scaler.fit_transform(X)
+        X_scaled = self.feature_matrix(df)
         
         # Adjust n_neighbors based on dataset size
-        n_neighbors = min(n_neighbors, len(X) - 1)
+        n_neighbors = min(n_neighbors, len(X_scaled) - 1)
         
-        # Train model
-        lof = LocalOutlierFactor(
-            n_neighbors=n_neighbors,
-            contamination=contamination
-        )
+        if neighbor_index is None:
+            neighbor_index = 'kd_tree' if len(X_scaled) >= CHUNKED_LOF_MIN_USERS else 'exact'
         
-        predictions = lof.fit_predict(X_scaled)
+        # Train model
+        if neighbor_index == 'exact':
+            lof = LocalOutlierFactor(
+                n_neighbors=n_neighbors,
+                contamination=contamination,
+                n_jobs=n_jobs
+            )
+        else:
+            # Same scores from a prebuilt tree queried in chunks; also scores new users later
+            lof = NeighborLOF(n_neighbors=n_neighbors, contamination=contamination, index=neighbor_index,
+                              n_jobs=n_jobs)
+        
+        is_local_outlier = lof.fit_predict(X_scaled) == -1
         outlier_scores = lof.negative_outlier_factor_
         
-        # Add results to dataframe
-        results_df = df.copy()
-        results_df['is_local_outlier'] = predictions == -1
-        results_df['lof_score'] = outlier_scores
-        
         # Educational analysis
-        local_outliers = results_df[results_df['is_local_outlier']]
-        normal_users = results_df[~results_df['is_local_outlier']]
+        outlier_rows = np.flatnonzero(is_local_outlier)
         
         print(f"\n🎯 Local Outlier Factor Results:")
-        print(f"• Local outliers: {len(local_outliers)} ({len(local_outliers)/len(results_df)*100:.1f}%)")
-        print(f"• Normal in context: {len(normal_users)}")
+        print(f"• Local outliers: {len(outlier_rows)} ({len(outlier_rows)/len(df)*100:.1f}%)")
+        print(f"• Normal in context: {len(df) - len(outlier_rows)}")
         
-        if len(local_outliers) > 0:
+        # Reasons for every outlier at once, against statistics per access level
+        ranked = outlier_rows[np.argsort(outlier_scores[outlier_rows], kind='stable')]
+        reasons = explain(df, ranked, LOCAL_OUTLIER_REASONS, group_by='access_level', min_group_size=2)
+        
+        if len(ranked) > 0:
             print(f"\n🔍 Contextual Security Anomalies:")
-            for _, user in local_outliers.sort_values('lof_score').iterrows():
+            for i, row in enumerate(ranked[:EXPLAIN_PRINT_LIMIT]):
+                user = df.iloc[row]
                 print(f"\n🚨 {user['user_name']} ({user['access_level']})")
-                print(f"   • LOF Score: {user['lof_score']:.3f} (more negative = more unusual)")
+                print(f"   • LOF Score: {outlier_scores[row]:.3f} (more negative = more unusual)")
                 
                 # Context-specific analysis
-                same_level_users = results_df[results_df['access_level'] == user['access_level']]
-                if len(same_level_users) > 1:
-                    level_avg_access = same_level_users['total_access_count'].mean()
-                    print(f"   • Access vs {user['access_level']} peers: {user['total_access_count']} (avg: {level_avg_access:.1f})")
-                    
-                    # Context reasons
-                    context_reasons = []
-                    if user['total_access_count'] > level_avg_access * 1.5:
-                        context_reasons.append(f"High access for {user['access_level']} role")
-                    if user['sensitive_data_reachable'] > same_level_users['sensitive_data_reachable'].mean() * 1.5:
-                        context_reasons.append(f"Above-average sensitive access for role")
+                if reasons.has_reference[i]:
+                    print(f"   • Access vs {user['access_level']} peers: {user['total_access_count']} (avg: {reasons.reference_mean[i, 0]:.1f})")
                     
+                    context_reasons = reasons.reason_text(i)
                     if context_reasons:
                         print(f"   • Context reasons: {'; '.join(context_reasons)}")
+            if len(ranked) > EXPLAIN_PRINT_LIMIT:
+                print(f"\n   ... and {len(ranked) - EXPLAIN_PRINT_LIMIT} more local outliers (see the returned reasons)")
         
         # Store model and results
         self.models['local_outlier_factor'] = lof
         
-        return {
+        return DetectionResult({
             'model': lof,
-            'results': results_df,
-            'outliers': local_outliers,
-            'normal_users': normal_users,
+            'features': df,
+            'is_local_outlier': is_local_outlier,
+            'lof_score': outlier_scores,
+            'flags': is_local_outlier,
+            'reasons': reasons,
             'method': 'Local Outlier Factor',
             'explanation': 'Context-aware anomaly detection within peer groups'
-        }
+        })
+    
+    def local_outlier_novelty(self, df: pd.DataFrame) -> Dict:
+        """
+        Score users against the users LOF was last fitted on, without refitting
+        
+        Newly discovered users are compared with the fitted reference set's
+        neighborhoods, so a daily run adds them without rebuilding the index.
+        
+        Args:
+            df: DataFrame with security features of the users to score
+            
+        Returns:
+            Dictionary with the same keys as local_outlier_factor_detection, minus the reasons
+        """
+        lof = self.models.get('local_outlier_factor')
+        if not isinstance(lof, NeighborLOF):
+            raise ValueError("No NeighborLOF reference set; run local_outlier_factor_detection with a neighbor_index first")
+        
+        # Scale with the reference set's scaler; feature_matrix would refit it on these users
+        X = np.ascontiguousarray(df[self.feature_names].fillna(0).to_numpy(dtype=np.float32))
+        outlier_scores = np.zeros(len(X), dtype=np.float64)
+        if len(X):
+            self.scaler.transform(X, copy=False)
+            outlier_scores = lof.score_samples(X)
+        is_local_outlier = outlier_scores < lof.offset_
+        
+        print(f"\n🎯 LOF Novelty Scoring: {len(df)} users against {lof.n_samples_fit_} reference users")
+        print(f"• Local outliers among them: {int(is_local_outlier.sum())}")
+        
+        return DetectionResult({
+            'model': lof,
+            'features': df,
+            'is_local_outlier': is_local_outlier,
+            'lof_score': outlier_scores,
+            'flags': is_local_outlier,
+            'method': 'Local Outlier Factor',
+            'explanation': 'New users scored against the fitted reference neighborhoods'
+        })
     
     def clustering_analysis(self, df: pd.DataFrame,
                           eps: float = 0.8,
-                          min_samples: int = 2) -> Dict:
+                          min_samples: int = 2,
+                          algorithm: str = 'dbscan',
+                          min_cluster_size: int = 5,
+                          n_jobs: Optional[int] = None) -> Dict:
         """
         DBSCAN clustering analysis with educational explanations
         
+        Both algorithms work on chunks of the feature matrix against a KD-tree,
+        so memory stays bounded on large populations, and print progress as
+        they go.
+        
         Args:
             df: DataFrame with security features
-            eps: Distance threshold for clustering
-            min_samples: Minimum samples per cluster
+            eps: Distance threshold for clustering (DBSCAN only)
+            min_samples: Minimum samples per cluster (DBSCAN only)
+            algorithm: 'dbscan', or 'hdbscan' for the hierarchical variant that needs no eps
+            min_cluster_size: Smallest cluster HDBSCAN reports (HDBSCAN only)
+            n_jobs: Parallel jobs for the neighbor queries
             
         Returns:
             Dictionary with clustering results and explanations
         """
         
-        self.explain_algorithm(
-            "DBSCAN Clustering",
-            "Groups users by similar behavior patterns and identifies isolated outliers",
-            """
-            Imagine organizing users into behavioral groups at a security conference:
-            - Group 1: Normal office workers (low access, standard patterns)
-            - Group 2: System administrators (high access, varied patterns)
-            - Group 3: Developers (moderate access, code-focused)
-            - Outliers: Users who don't fit any group (potential threats!)
+        if algorithm == 'hdbscan':
+            self.explain_algorithm(
+                "HDBSCAN Clustering",
+                "Groups users by similar behavior at every density level and identifies isolated outliers",
+                """
+                DBSCAN needs one distance 'eps' that suits every group, but
+                administrators and readers are spread out very differently.
+                HDBSCAN tries every distance at once:
+                
+                1. Measure how crowded each user's neighborhood is
+                2. Link users from the most crowded areas outwards, building a tree of groups
+                3. Keep the groups that persist over the widest range of distances
+                4. Users that never settle into a lasting group become outliers
+                """,
+                [
+                    "Establishing baselines for roles with very different activity levels",
+                    "Identifying users who don't fit normal patterns without tuning a distance",
+                    "Finding small, tight groups inside large, loose ones"
+                ]
+            )
+        elif algorithm == 'dbscan':
+            self.explain_algorithm(
+                "DBSCAN Clustering",
+                "Groups users by similar behavior patterns and identifies isolated outliers",
+                """
+                Imagine organizing users into behavioral groups at a security conference:
+                - Group 1: Normal office workers (low access, standard patterns)
+                - Group 2: System administrators (high access, varied patterns)
+                - Group 3: Developers (moderate access, code-focused)
+                - Outliers: Users who don't fit any group (potential threats!)
             
-            DBSCAN Process:
-            1. For each user, count nearby users within distance 'eps'
-            2. If user has enough neighbors (min_samples), start a cluster
-            3. Expand cluster by adding nearby users
-            4. Users with too few neighbors become outliers
+                DBSCAN Process:
+                1. For each user, count nearby users within distance 'eps'
+                2. If user has enough neighbors (min_samples), start a cluster
+                3. Expand cluster by adding nearby users
+                4. Users with too few neighbors become outliers
             
-            Outliers often represent the most interesting security cases.
-            """,
-            [
-                "Establishing behavioral baselines for different user types",
-                "Identifying users who don't fit normal patterns",
-                "Creating role-based security policies",
-                "Detecting coordinated attacks (multiple users, similar unusual patterns)"
-            ]
-        )
-        
-        # Prepare features
-        X = df[self.feature_names].fillna(0)
-        X_scaled = self.scaler.fit_transform(X)
+                Outliers often represent the most interesting security cases.
+                """,
+                [
+                    "Establishing behavioral baselines for different user types",
+                    "Identifying users who don't fit normal patterns",
+                    "Creating role-based security policies",
+                    "Detecting coordinated attacks (multiple users, similar unusual patterns)"
+                ]
+            )
+        else:
+            raise ValueError(f"Unknown clustering algorithm {algorithm!r}; expected 'dbscan' or 'hdbscan'")
+        
+        X_scaled = self.feature_matrix(df)
         
         # Train model
-        dbscan = DBSCAN(eps=eps, min_samples=min_samples)
+        print(f"\n⏳ Clustering {len(X_scaled)} users:")
+        if algorithm == 'hdbscan':
+            dbscan = GraphHDBSCAN(min_cluster_size=min_cluster_size, progress=self._print_progress, n_jobs=n_jobs)
+        else:
+            dbscan = ChunkedDBSCAN(eps=eps, min_samples=min_samples, progress=self._print_progress, n_jobs=n_jobs)
         cluster_labels = dbscan.fit_predict(X_scaled)
         
-        # Add results to dataframe
-        results_df = df.copy()
-        results_df['cluster'] = cluster_labels
-        results_df['is_outlier'] = cluster_labels == -1
+        is_outlier = cluster_labels == -1
         
         # Educational analysis
-        unique_clusters = set(cluster_labels)
-        outliers = results_df[results_df['is_outlier']]
-        clustered_users = results_df[~results_df['is_outlier']]
+        unique_clusters = set(np.unique(cluster_labels).tolist())
+        outlier_rows = np.flatnonzero(is_outlier)
         
-        print(f"\n🎯 DBSCAN Clustering Results:")
+        method = 'HDBSCAN Clustering' if algorithm == 'hdbscan' else 'DBSCAN Clustering'
+        print(f"\n🎯 {method} Results:")
         print(f"• Clusters found: {len(unique_clusters) - (1 if -1 in unique_clusters else 0)}")
-        print(f"• Users in clusters: {len(clustered_users)}")
-        print(f"• Outliers (security interest): {len(outliers)} ({len(outliers)/len(results_df)*100:.1f}%)")
+        print(f"• Users in clusters: {len(df) - len(outlier_rows)}")
+        print(f"• Outliers (security interest): {len(outlier_rows)} ({len(outlier_rows)/len(df)*100:.1f}%)")
         
-        # Analyze each cluster
+        # Analyze each cluster from one grouped pass over the snapshot
         print(f"\n📊 Cluster Behavior Analysis:")
-        for cluster_id in sorted(unique_clusters):
-            if cluster_id == -1:
-                continue  # Handle outliers separately
-            
-            cluster_users = results_df[results_df['cluster'] == cluster_id]
-            if len(cluster_users) == 0:
-                continue
-            
-            avg_access = cluster_users['total_access_count'].mean()
-            avg_sensitive = cluster_users['sensitive_data_reachable'].mean()
+        by_cluster = df[~is_outlier].groupby(cluster_labels[~is_outlier])
+        cluster_stats = by_cluster[['total_access_count', 'sensitive_data_reachable']].mean()
+        for cluster_id, cluster_users in by_cluster:
+            avg_access = cluster_stats.loc[cluster_id, 'total_access_count']
+            avg_sensitive = cluster_stats.loc[cluster_id, 'sensitive_data_reachable']
             common_level = cluster_users['access_level'].mode()[0] if not cluster_users['access_level'].mode().empty else 'Mixed'
             
             print(f"\n🔍 Cluster {cluster_id} ({len(cluster_users)} users):")
@@ -447,39 +724,41 @@ class EducationalAnomalyDetector:
             
             print(f"   • Type: {cluster_type}")
         
+        # Risk factors for every outlier at once, against the population averages
+        reasons = explain(df, outlier_rows, CLUSTER_OUTLIER_RISK_FACTORS)
+        risk_factors = reasons.counts()
+        risk_levels = np.select([risk_factors >= 3, risk_factors >= 2], ["🔴 HIGH", "🟠 MEDIUM"], default="🟡 LOW")
+        
         # Analyze outliers (most important for security)
-        if len(outliers) > 0:
+        if len(outlier_rows) > 0:
             print(f"\n🚨 Security Outliers (Immediate Investigation Required):")
-            for _, user in outliers.iterrows():
+            for i, row in enumerate(outlier_rows[:EXPLAIN_PRINT_LIMIT]):
+                user = df.iloc[row]
                 print(f"\n🔍 {user['user_name']} ({user['access_level']})")
                 print(f"   • Doesn't fit any behavioral group")
                 print(f"   • Access activity: {user['total_access_count']} resources")
                 print(f"   • Sensitive access: {user['sensitive_data_reachable']} resources")
-                
-                # Risk assessment
-                risk_factors = 0
-                if user['total_access_count'] > results_df['total_access_count'].mean() * 2:
-                    risk_factors += 1
-                if user['sensitive_data_reachable'] > results_df['sensitive_data_reachable'].mean() * 2:
-                    risk_factors += 1
-                if user['target_diversity'] > results_df['target_diversity'].mean() * 1.5:
-                    risk_factors += 1
-                
-                risk_level = "🔴 HIGH" if risk_factors >= 3 else "🟠 MEDIUM" if risk_factors >= 2 else "🟡 LOW"
-                print(f"   • Risk level: {risk_level}")
+                print(f"   • Risk level: {risk_levels[i]}")
+            if len(outlier_rows) > EXPLAIN_PRINT_LIMIT:
+                print(f"\n   ... and {len(outlier_rows) - EXPLAIN_PRINT_LIMIT} more outliers (see the returned reasons)")
         
         # Store model and results
-        self.models['dbscan'] = dbscan
+        self.models[algorithm] = dbscan
         
-        return {
+        return DetectionResult({
             'model': dbscan,
-            'results': results_df,
-            'outliers': outliers,
-            'clustered_users': clustered_users,
+            'features': df,
+            'cluster': cluster_labels,
+            'is_outlier': is_outlier,
+            'flags': is_outlier,
+            'reasons': reasons,
             'n_clusters': len(unique_clusters) - (1 if -1 in unique_clusters else 0),
-            'method': 'DBSCAN Clustering',
+            'method': method,
             'explanation': 'Behavioral grouping with automatic outlier detection'
-        }
+        })
+    
+    def _print_progress(self, stage: str, done: int, total: int) -> None:
+        print(f"   • {stage}: {100 * done // max(total, 1)}%")
     
     def generate_comprehensive_report(self, analysis_results: List[Dict]) -> Dict:
         """
@@ -489,83 +768,64 @@ class EducationalAnomalyDetector:
             analysis_results: List of analysis results from different methods
             
         Returns:
-            Comprehensive security report with recommendations
+            Comprehensive security report with recommendations. user_risk_scores
+            and high_risk_users (its HIGH and CRITICAL users) read as dicts of
+            user_name -> {'risk_score', 'detected_by', 'risk_level'}; their
+            .frame is the DataFrame behind them, indexed by user_name with one
+            flag column per method, risk_score and risk_level
         """
         
         print("\n🎯 COMPREHENSIVE SECURITY ANALYSIS REPORT")
         print("=" * 60)
         
-        # Combine results from all methods
-        all_users = set()
-        anomaly_detections = {}
-        
+        # One boolean column per method, aligned on user name; a later result for the same method wins
+        detections = {}
+        # Results on the same snapshot share one index, so the columns line up without a join
+        user_indexes = {}
         for result in analysis_results:
-            method = result['method']
-            
-            if 'anomalies' in result:
-                anomalous_users = set(result['anomalies']['user_name'].tolist())
-            elif 'outliers' in result:
-                anomalous_users = set(result['outliers']['user_name'].tolist())
-            else:
-                anomalous_users = set()
-            
-            anomaly_detections[method] = anomalous_users
-            all_users.update(result['results']['user_name'].tolist())
-        
-        # Calculate composite risk scores
-        user_risk_scores = {}
-        for user in all_users:
-            risk_score = 0
-            detected_by = []
-            
-            for method, detected_users in anomaly_detections.items():
-                if user in detected_users:
-                    if method == 'Isolation Forest':
-                        risk_score += 3  # Global anomalies are high priority
-                    elif method == 'DBSCAN Clustering':
-                        risk_score += 2  # Outliers are medium-high priority
-                    elif method == 'Local Outlier Factor':
-                        risk_score += 2  # Context anomalies are medium-high priority
-                    detected_by.append(method)
-            
-            user_risk_scores[user] = {
-                'risk_score': risk_score,
-                'detected_by': detected_by,
-                'risk_level': 'CRITICAL' if risk_score >= 6 else 
-                             'HIGH' if risk_score >= 4 else 
-                             'MEDIUM' if risk_score >= 2 else 'LOW'
-            }
+            features = result['features']
+            if id(features) not in user_indexes:
+                user_indexes[id(features)] = pd.Index(features['user_name'].to_numpy(), name='user_name')
+            flags = pd.Series(np.asarray(result['flags'], dtype=bool), index=user_indexes[id(features)])
+            if not flags.index.is_unique:
+                flags = flags.groupby(level=0, sort=False).any()
+            detections[result['method']] = flags
+        
+        # Composite risk: a weighted sum of the flags, binned into levels
+        # Users missing from a method's results come back as NaN, which is not a flag
+        user_risk_scores = pd.concat(detections, axis=1).eq(True)
+        weights = np.array([METHOD_RISK_WEIGHTS.get(method, 0) for method in user_risk_scores.columns], dtype=np.int64)
+        user_risk_scores['risk_score'] = user_risk_scores.to_numpy(dtype=np.int64) @ weights
+        user_risk_scores['risk_level'] = pd.cut(user_risk_scores['risk_score'], RISK_LEVEL_BINS,
+                                                right=False, labels=RISK_LEVELS)
+        total_users = len(user_risk_scores)
+        methods = list(detections)
         
         # Generate recommendations
-        high_risk_users = {user: info for user, info in user_risk_scores.items() 
-                          if info['risk_level'] in ['CRITICAL', 'HIGH']}
+        high_risk_users = user_risk_scores[user_risk_scores['risk_level'].isin(['CRITICAL', 'HIGH'])]
         
         print(f"\n📊 EXECUTIVE SUMMARY:")
-        print(f"• Total users analyzed: {len(all_users)}")
+        print(f"• Total users analyzed: {total_users}")
         print(f"• High-risk users identified: {len(high_risk_users)}")
         
-        risk_distribution = {}
-        for info in user_risk_scores.values():
-            risk_level = info['risk_level']
-            risk_distribution[risk_level] = risk_distribution.get(risk_level, 0) + 1
+        risk_distribution = user_risk_scores['risk_level'].value_counts().reindex(RISK_LEVELS, fill_value=0)
         
         for level in ['CRITICAL', 'HIGH', 'MEDIUM', 'LOW']:
-            count = risk_distribution.get(level, 0)
-            percentage = (count / len(all_users)) * 100
+            count = int(risk_distribution[level])
+            percentage = (count / total_users) * 100
             icon = {'CRITICAL': '🔴', 'HIGH': '🟠', 'MEDIUM': '🟡', 'LOW': '🟢'}[level]
             print(f"• {icon} {level}: {count} users ({percentage:.1f}%)")
         
         # Detailed high-risk analysis
-        if high_risk_users:
+        if len(high_risk_users):
             print(f"\n🚨 HIGH-PRIORITY SECURITY ALERTS:")
-            sorted_high_risk = sorted(high_risk_users.items(), 
-                                    key=lambda x: x[1]['risk_score'], reverse=True)
+            top_alerts = high_risk_users.nlargest(5, 'risk_score')  # Top 5 highest risk
             
-            for user, info in sorted_high_risk[:5]:  # Top 5 highest risk
-                risk_icon = '🔴' if info['risk_level'] == 'CRITICAL' else '🟠'
-                print(f"\n{risk_icon} {info['risk_level']}: {user}")
-                print(f"   • Risk Score: {info['risk_score']}/7")
-                print(f"   • Detected by: {', '.join(info['detected_by'])}")
+            for user, alert in top_alerts.iterrows():
+                risk_icon = '🔴' if alert['risk_level'] == 'CRITICAL' else '🟠'
+                print(f"\n{risk_icon} {alert['risk_level']}: {user}")
+                print(f"   • Risk Score: {alert['risk_score']}/7")
+                print(f"   • Detected by: {', '.join(method for method in methods if alert[method])}")
                 
         # Security recommendations
         print(f"\n🛡️  SECURITY RECOMMENDATIONS:")
@@ -581,11 +841,11 @@ class EducationalAnomalyDetector:
         print(f"• Implement real-time risk scoring for user activities")
         
         return {
-            'user_risk_scores': user_risk_scores,
-            'high_risk_users': high_risk_users,
-            'risk_distribution': risk_distribution,
-            'total_users': len(all_users),
-            'analysis_methods': list(anomaly_detections.keys()),
+            'user_risk_scores': RiskScores(user_risk_scores, methods),
+            'high_risk_users': RiskScores(high_risk_users, methods),
+            'risk_distribution': {level: int(count) for level, count in risk_distribution.items() if count},
+            'total_users': total_users,
+            'analysis_methods': list(detections),
             'recommendations': [
                 "Investigate high-risk user accounts immediately",
                 "Implement enhanced monitoring for anomalies",
@@ -595,27 +855,24 @@ class EducationalAnomalyDetector:
         }
     
     def close(self):
-        """Close database connection"""
-        if self.driver:
-            self.driver.close()
+        """Close the graph source's connection"""
+        if self.source:
+            self.source.close()
             print("✅ Educational anomaly detection session closed")
 
 # Example usage for educational purposes
 if __name__ == "__main__":
     # Initialize the educational system
-    detector = EducationalAnomalyDetector()
+    detector = EducationalAnomalyDetector(registry=ModelRegistry(ANOMALY_MODEL_DIR) if ANOMALY_MODEL_DIR else None)
     
     try:
         # Extract security features
         security_features = detector.extract_security_features()
         
-        # Run different anomaly detection methods
-        isolation_results = detector.isolation_forest_detection(security_features)
-        lof_results = detector.local_outlier_factor_detection(security_features)
-        clustering_results = detector.clustering_analysis(security_features)
+        # Run the different anomaly detection methods side by side
+        all_results = detector.run_ensemble(security_features)
         
         # Generate comprehensive report
-        all_results = [isolation_results, lof_results, clustering_results]
         comprehensive_report = detector.generate_comprehensive_report(all_results)
         
         print("\n🎓 Educational ML Security Analysis Complete!")
@@ -0,0 +1,294 @@
+"""
+Density clustering in bounded memory
+
+sklearn's DBSCAN materializes every user's eps-neighborhood at once before
+it expands clusters, so a dense feature set can exhaust RAM, and it reports
+nothing until it is done. ChunkedDBSCAN works on fixed-size chunks of the
+feature matrix against one KD-tree. Users with identical features (common,
+since the features are small counts) become one point weighted by their
+number, as sklearn's sample_weight would, and then:
+
+1. count each point's neighbors within eps to find the core points
+2. link core points within eps of each other with a vectorized union-find
+3. attach each remaining point to its nearest core point within eps, if any
+
+Chunks are sized from the neighbor counts of pass 1, so the neighborhoods
+held at any time stay within the memory budget however dense the data is.
+Cluster ids and noise (-1) follow sklearn's: clusters are numbered by
+their first core user. A border user reachable from two clusters joins the
+nearest core user's cluster, where sklearn takes whichever expands first.
+
+GraphHDBSCAN is the hierarchical variant that needs no eps: it builds a
+k-nearest-neighbor distance graph with chunked tree queries and runs
+sklearn's HDBSCAN on it as a sparse precomputed metric, so memory grows
+with users x neighbors instead of users squared.
+
+Both take n_jobs to run the chunked tree queries on threads; the chunks in
+flight share the memory budget.
+"""
+
+import os
+from functools import partial
+from typing import Callable, Iterator, Optional, Tuple
+
+import numpy as np
+from scipy import sparse
+from scipy.sparse import csgraph
+from sklearn.cluster import HDBSCAN
+from sklearn.neighbors import KDTree
+
+from neighbor_lof import QUERY_BYTES_PER_NEIGHBOR, map_chunks, query_excluding_self, worker_count
+
+# Memory budget for the neighborhoods held by one chunk, in MB
+CLUSTER_MEMORY_MB = int(os.environ.get("ANOMALY_CLUSTER_MEMORY_MB", "2048"))
+# Bytes per neighbor returned by a radius query: its index, its distance and the edge arrays built from it
+RADIUS_BYTES_PER_NEIGHBOR = 32
+# Neighbors per user in GraphHDBSCAN's distance graph, unless min_samples needs more
+HDBSCAN_GRAPH_NEIGHBORS = 15
+# Distance stored for duplicate users; a sparse graph cannot hold an explicit zero
+DUPLICATE_DISTANCE = 1e-10
+# Progress updates per pass
+PROGRESS_STEPS = 10
+
+# progress(stage, done, total), counted in the stage's own units (users or distinct feature rows)
+Progress = Callable[[str, int, int], None]
+
+
+class _ProgressReporter:
+    """Calls progress at most PROGRESS_STEPS times per stage, and always at the end"""
+
+    def __init__(self, progress: Optional[Progress], stage: str, total: int):
+        self.progress, self.stage, self.total, self.step = progress, stage, total, 0
+
+    def update(self, done: int) -> None:
+        step = done * PROGRESS_STEPS // max(self.total, 1)
+        if self.progress is not None and (step > self.step or done == self.total):
+            self.step = step
+            self.progress(self.stage, done, self.total)
+
+
+def _row_chunks(cost: np.ndarray, budget: int) -> Iterator[Tuple[int, int]]:
+    """(start, stop) ranges of consecutive rows whose summed cost stays within budget, at least one row each"""
+    ends = np.cumsum(cost)
+    start = 0
+    while start < len(cost):
+        base = ends[start - 1] if start else 0
+        stop = max(int(np.searchsorted(ends, base + budget, side='right')), start + 1)
+        yield start, stop
+        start = stop
+
+
+def _flatten(parent: np.ndarray) -> None:
+    """Point every node straight at its root, in place"""
+    while True:
+        grand = parent[parent]
+        if np.array_equal(grand, parent):
+            return
+        parent[:] = grand
+
+
+def _union(parent: np.ndarray, a: np.ndarray, b: np.ndarray) -> None:
+    """Merge the sets of every pair (a[i], b[i]); the smallest index becomes the root
+
+    parent must be flat (every node pointing at its root) and is left flat.
+    """
+    while len(a):
+        root_a, root_b = parent[a], parent[b]
+        apart = root_a != root_b
+        a, b, root_a, root_b = a[apart], b[apart], root_a[apart], root_b[apart]
+        # Several pairs may relink the same root; the smallest target wins and the rest retry
+        np.minimum.at(parent, np.maximum(root_a, root_b), np.minimum(root_a, root_b))
+        # Pointer jumping keeps the trees one level deep, however long the chains of links
+        _flatten(parent)
+
+
+class ChunkedDBSCAN:
+    """DBSCAN over a KD-tree, in chunks bounded by a memory budget"""
+
+    def __init__(self, eps: float = 0.5, min_samples: int = 5, leaf_size: int = 40,
+                 memory_mb: int = CLUSTER_MEMORY_MB, progress: Optional[Progress] = None,
+                 n_jobs: Optional[int] = None):
+        """
+        Args:
+            eps: Distance within which users are neighbors
+            min_samples: Neighbors, the user included, that make a core user
+            leaf_size: Leaf size of the KD-tree
+            memory_mb: Budget for the neighborhoods the chunks in flight hold
+            progress: Called as chunks complete, with the stage and how much of it is done
+            n_jobs: Chunks queried concurrently on threads; the tree query releases the GIL
+        """
+        self.eps = eps
+        self.min_samples = min_samples
+        self.leaf_size = leaf_size
+        self.memory_mb = memory_mb
+        self.progress = progress
+        self.n_jobs = n_jobs
+
+    def _neighbor_budget(self) -> int:
+        """Neighbors one chunk may hold so all concurrent chunks fit in the budget"""
+        return max(1, int(self.memory_mb * 2 ** 20) // RADIUS_BYTES_PER_NEIGHBOR // worker_count(self.n_jobs))
+
+    def _query_radius(self, points: np.ndarray, selection, **kwargs):
+        """query_radius for points[selection], so a chunk's points are copied only while it is queried"""
+        return self.tree_.query_radius(points[selection], self.eps, **kwargs)
+
+    def _neighborhoods(self, points: np.ndarray, rows: np.ndarray, sizes: np.ndarray, stage: str,
+                       return_distance: bool = False) -> Iterator[Tuple[np.ndarray, ...]]:
+        """(row, neighbor[, distance]) arrays for the eps-neighborhoods of rows, a chunk at a time
+
+        sizes holds each point's neighborhood size, so a chunk's rows can be
+        picked to hold at most the budgeted number of neighbors.
+        """
+        reporter = _ProgressReporter(self.progress, stage, len(rows))
+        ranges = list(_row_chunks(sizes[rows], self._neighbor_budget()))
+        queries = map_chunks(self.n_jobs, partial(self._query_radius, return_distance=return_distance),
+                             [(points, rows[start:stop]) for start, stop in ranges])
+        for (start, stop), found in zip(ranges, queries, strict=True):
+            neighbors = found[0] if return_distance else found
+            lengths = np.fromiter((len(n) for n in neighbors), dtype=np.int64, count=len(neighbors))
+            owners = np.repeat(rows[start:stop], lengths)
+            if len(owners):
+                if return_distance:
+                    yield owners, np.concatenate(neighbors), np.concatenate(found[1])
+                else:
+                    yield owners, np.concatenate(neighbors)
+            reporter.update(stop)
+
+    def fit(self, X: np.ndarray) -> 'ChunkedDBSCAN':
+        # Users with identical features share one point, weighted by how many there are
+        points, first_row, inverse, weight = np.unique(X, axis=0, return_index=True, return_inverse=True,
+                                                       return_counts=True)
+        inverse = inverse.reshape(-1)
+        m = len(points)
+        self.tree_ = KDTree(points, leaf_size=self.leaf_size)
+
+        # Pass 1: distinct points within eps, in chunks of fixed size since counting holds no neighborhoods
+        sizes = np.empty(m, dtype=np.int64)
+        count_rows = max(1, min(self._neighbor_budget() // 4, -(-m // PROGRESS_STEPS)))
+        reporter = _ProgressReporter(self.progress, "counting neighbors", m)
+        starts = range(0, m, count_rows)
+        counted = map_chunks(self.n_jobs, partial(self._query_radius, count_only=True),
+                             [(points, slice(start, start + count_rows)) for start in starts])
+        for start, chunk_sizes in zip(starts, counted, strict=True):
+            stop = min(start + count_rows, m)
+            sizes[start:stop] = chunk_sizes
+            reporter.update(stop)
+        # Users within eps, duplicates included
+        counts = sizes
+        if m < len(X):
+            counts = np.zeros(m, dtype=np.int64)
+            for rows, neighbors in self._neighborhoods(points, np.arange(m), sizes, "weighing duplicates"):
+                np.add.at(counts, rows, weight[neighbors])
+        is_core = counts >= self.min_samples
+        core = np.flatnonzero(is_core)
+
+        # Pass 2: link core points within eps of each other, each pair once
+        parent = np.arange(m)
+        for rows, neighbors in self._neighborhoods(points, core, sizes, "linking core users"):
+            pairs = is_core[neighbors] & (neighbors > rows)
+            _union(parent, rows[pairs], neighbors[pairs])
+
+        # Number clusters by their first core user in X, as sklearn does
+        roots, cluster = np.unique(parent[core], return_inverse=True)
+        first_core_row = np.full(len(roots), len(X))
+        np.minimum.at(first_core_row, cluster, first_row[core])
+        labels = np.full(m, -1, dtype=np.int64)
+        labels[core] = np.argsort(np.argsort(first_core_row))[cluster]
+
+        # Pass 3: non-core points join the cluster of their nearest core point within eps
+        candidates = np.flatnonzero(~is_core & (sizes > 1))
+        for rows, neighbors, distances in self._neighborhoods(points, candidates, sizes, "attaching border users",
+                                                              return_distance=True):
+            reach = is_core[neighbors]
+            rows, neighbors, distances = rows[reach], neighbors[reach], distances[reach]
+            order = np.lexsort((distances, rows))
+            nearest_rows, first = np.unique(rows[order], return_index=True)
+            labels[nearest_rows] = labels[neighbors[order][first]]
+
+        self.labels_ = labels[inverse]
+        self.core_sample_indices_ = np.flatnonzero(is_core[inverse])
+        self.n_clusters_ = len(roots)
+        return self
+
+    def fit_predict(self, X: np.ndarray) -> np.ndarray:
+        return self.fit(X).labels_
+
+
+class GraphHDBSCAN:
+    """HDBSCAN on a k-nearest-neighbor distance graph built in chunks"""
+
+    def __init__(self, min_cluster_size: int = 5, min_samples: Optional[int] = None,
+                 n_neighbors: int = HDBSCAN_GRAPH_NEIGHBORS, leaf_size: int = 40,
+                 memory_mb: int = CLUSTER_MEMORY_MB, progress: Optional[Progress] = None,
+                 n_jobs: Optional[int] = None):
+        """
+        Args:
+            min_cluster_size: Smallest group of users that counts as a cluster
+            min_samples: Neighbors that set a user's core distance; defaults to min_cluster_size
+            n_neighbors: Neighbors kept per user in the graph, raised to min_samples if lower
+            leaf_size: Leaf size of the KD-tree
+            memory_mb: Budget for the neighbor queries in flight
+            progress: Called as chunks complete, with the stage and how much of it is done
+            n_jobs: Chunks of the neighbor graph queried concurrently on threads
+        """
+        self.min_cluster_size = min_cluster_size
+        self.min_samples = min_samples
+        self.n_neighbors = n_neighbors
+        self.leaf_size = leaf_size
+        self.memory_mb = memory_mb
+        self.progress = progress
+        self.n_jobs = n_jobs
+
+    def neighbor_graph(self, X: np.ndarray) -> sparse.csr_matrix:
+        """Symmetric, connected k-nearest-neighbor distance graph of X"""
+        n = len(X)
+        k = min(max(self.n_neighbors, self.min_samples or self.min_cluster_size), n - 1)
+        tree = KDTree(X, leaf_size=self.leaf_size)
+        rows = max(1, self.memory_mb * 2 ** 20 // ((k + 1) * QUERY_BYTES_PER_NEIGHBOR * worker_count(self.n_jobs)))
+        distances = np.empty((n, k))
+        indices = np.empty((n, k), dtype=np.int64)
+        reporter = _ProgressReporter(self.progress, "building neighbor graph", n)
+        chunks = [(tree, X, start, min(start + rows, n), k) for start in range(0, n, rows)]
+        for (_, _, start, stop, _), (chunk_distances, chunk_indices) in zip(
+                chunks, map_chunks(self.n_jobs, query_excluding_self, chunks), strict=True):
+            distances[start:stop], indices[start:stop] = chunk_distances, chunk_indices
+            reporter.update(stop)
+
+        graph = sparse.csr_matrix((np.maximum(distances.ravel(), DUPLICATE_DISTANCE),
+                                   (np.repeat(np.arange(n), k), indices.ravel())), shape=(n, n))
+        graph = graph.maximum(graph.T).tocsr()
+        # Far-apart groups can leave the graph disconnected; chain the pieces with their true distances
+        n_components, component = csgraph.connected_components(graph, directed=False)
+        if n_components > 1:
+            _, firsts = np.unique(component, return_index=True)
+            links = np.maximum(np.linalg.norm(X[firsts[1:]] - X[firsts[:-1]], axis=1), DUPLICATE_DISTANCE)
+            chain = sparse.csr_matrix((links, (firsts[:-1], firsts[1:])), shape=(n, n))
+            graph = (graph + chain + chain.T).tocsr()
+        return graph
+
+    def fit(self, X: np.ndarray) -> 'GraphHDBSCAN':
+        n = len(X)
+        # Too few users for any cluster, and for a neighbor graph when there is one user
+        if n < max(self.min_cluster_size, 2):
+            self.model_ = None
+            self.labels_ = np.full(n, -1, dtype=np.int64)
+            self.probabilities_ = np.zeros(n)
+            self.n_clusters_ = 0
+            return self
+        graph = self.neighbor_graph(X)
+        # sklearn counts the user itself among min_samples; the graph has no self-distances.
+        # Small populations hold fewer neighbors per user than min_samples asks for.
+        min_samples = min(max((self.min_samples or self.min_cluster_size) - 1, 1), n - 1)
+        self.model_ = HDBSCAN(min_cluster_size=self.min_cluster_size, min_samples=min_samples,
+                              metric='precomputed', copy=False)
+        if self.progress is not None:
+            self.progress("building cluster hierarchy", 0, len(X))
+        self.labels_ = self.model_.fit_predict(graph)
+        self.probabilities_ = self.model_.probabilities_
+        self.n_clusters_ = int(self.labels_.max()) + 1
+        if self.progress is not None:
+            self.progress("building cluster hierarchy", len(X), len(X))
+        return self
+
+    def fit_predict(self, X: np.ndarray) -> np.ndarray:
+        return self.fit(X).labels_
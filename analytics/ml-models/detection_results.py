@@ -0,0 +1,77 @@
+"""
+Result containers that keep the original result shapes available
+
+Detection methods return per-user arrays aligned with the feature
+DataFrame, and the comprehensive report keeps its per-user scores in one
+DataFrame, so nothing is copied per user or per method. Callers written
+against the earlier shapes still work: DetectionResult builds the
+'results' DataFrame and its flagged and unflagged subsets on first access,
+and RiskScores reads like the earlier dict of per-user dicts while keeping
+the DataFrame as `frame`.
+"""
+
+from collections.abc import Mapping
+from typing import Dict, Iterator, List, Optional
+
+import pandas as pd
+
+# Flag array -> (arrays copied into 'results', key of the flagged rows, key of the other rows)
+LEGACY_VIEWS = {
+    'is_anomaly': (('is_anomaly', 'anomaly_score'), 'anomalies', 'normal_users'),
+    'is_local_outlier': (('is_local_outlier', 'lof_score'), 'outliers', 'normal_users'),
+    'is_outlier': (('cluster', 'is_outlier'), 'outliers', 'clustered_users'),
+}
+
+
+class DetectionResult(dict):
+    """A detection method's result dict; 'results' and its flagged and other rows are built on first access"""
+
+    def _legacy_view(self) -> Optional[tuple]:
+        """(flag, columns, flagged key, other key) for this result, or None if it has no earlier shape"""
+        if not dict.__contains__(self, 'features'):
+            return None
+        return next(((flag,) + view for flag, view in LEGACY_VIEWS.items() if dict.__contains__(self, flag)), None)
+
+    def __missing__(self, key):
+        view = self._legacy_view()
+        if view is None or key not in ('results',) + view[2:]:
+            raise KeyError(key)
+        flag, columns, flagged_key, other_key = view
+        results = self['features'].assign(**{column: self[column] for column in columns})
+        flagged = results[flag]
+        self.update({'results': results, flagged_key: results[flagged], other_key: results[~flagged]})
+        return self[key]
+
+    def __contains__(self, key) -> bool:
+        if dict.__contains__(self, key):
+            return True
+        view = self._legacy_view()
+        return view is not None and key in ('results',) + view[2:]
+
+    def get(self, key, default=None):
+        return self[key] if key in self else default
+
+
+class RiskScores(Mapping):
+    """user_name -> {'risk_score', 'detected_by', 'risk_level'}, read from the report's risk DataFrame"""
+
+    def __init__(self, frame: pd.DataFrame, methods: List[str]):
+        self.frame = frame      # indexed by user_name: one flag column per method, risk_score, risk_level
+        self.methods = methods
+
+    def __getitem__(self, user: str) -> Dict:
+        row = self.frame.loc[user]
+        return {
+            'risk_score': int(row['risk_score']),
+            'detected_by': [method for method in self.methods if row[method]],
+            'risk_level': str(row['risk_level']),
+        }
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self.frame.index)
+
+    def __len__(self) -> int:
+        return len(self.frame)
+
+    def __contains__(self, user) -> bool:
+        return user in self.frame.index
@@ -0,0 +1,153 @@
+"""
+Running detection methods side by side on a process pool
+
+Each detection method runs in its own worker process, so the ensemble
+takes about as long as its slowest method. The scaled feature matrix and
+the numeric feature columns are copied once into shared memory blocks that
+every worker maps; only the small detector state (feature names, scaler,
+saved model) and the text columns travel pickled. Each worker captures
+what its method prints, and the parent prints it in method order once the
+results are in, so the reports never interleave.
+
+Workers are spawned rather than forked: they start from a clean
+interpreter, share nothing but the memory blocks, and behave the same
+wherever the detector runs. Spawning re-imports the caller's __main__, so a
+script must call the ensemble under `if __name__ == "__main__":`; when the
+pool cannot run, the methods run one after another in this process instead.
+"""
+
+import contextlib
+import io
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from multiprocessing.shared_memory import SharedMemory
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+
+class SharedArray(NamedTuple):
+    """Where a worker finds an array: a shared memory block and its layout"""
+    name: str
+    shape: tuple
+    dtype: str
+
+
+class SharedFrame(NamedTuple):
+    """A DataFrame split into shared numeric columns and pickled text columns"""
+    columns: List[str]
+    shared: Dict[str, SharedArray]
+    pickled: Dict[str, np.ndarray]
+
+
+class MethodOutcome(NamedTuple):
+    """What a worker sends back for one detection method"""
+    result: Dict          # the method's result, without the 'features' DataFrame
+    output: str           # everything the method printed
+    models: Dict          # the detector's models dict after the method ran
+    model_bundle: object  # the detector's saved-model bundle after the method ran
+
+
+def share_array(array: np.ndarray) -> Tuple[SharedMemory, SharedArray]:
+    """Copy array into a new shared memory block; the caller closes and unlinks it"""
+    block = SharedMemory(create=True, size=max(array.nbytes, 1))
+    np.ndarray(array.shape, dtype=array.dtype, buffer=block.buf)[...] = array
+    return block, SharedArray(block.name, array.shape, array.dtype.str)
+
+
+def attach_array(spec: SharedArray) -> Tuple[SharedMemory, np.ndarray]:
+    """Map a shared array read-only, without copying it"""
+    # Workers share the parent's resource tracker, so attaching does not hand them ownership of the block
+    block = SharedMemory(name=spec.name)
+    array = np.ndarray(spec.shape, dtype=np.dtype(spec.dtype), buffer=block.buf)
+    array.flags.writeable = False
+    return block, array
+
+
+def share_frame(df: pd.DataFrame) -> Tuple[List[SharedMemory], SharedFrame]:
+    blocks, shared, pickled = [], {}, {}
+    for column in df.columns:
+        values = df[column].to_numpy()
+        if values.dtype.kind in 'biuf':
+            block, shared[column] = share_array(np.ascontiguousarray(values))
+            blocks.append(block)
+        else:
+            pickled[column] = values
+    return blocks, SharedFrame(list(df.columns), shared, pickled)
+
+
+def attach_frame(frame: SharedFrame) -> Tuple[List[SharedMemory], pd.DataFrame]:
+    blocks, columns = [], dict(frame.pickled)
+    for column, spec in frame.shared.items():
+        block, columns[column] = attach_array(spec)
+        blocks.append(block)
+    return blocks, pd.DataFrame({column: columns[column] for column in frame.columns}, copy=False)
+
+
+# Shared memory blocks a worker process has mapped
+_worker_blocks: List[SharedMemory] = []
+
+
+def _run_method(detector_class, state: dict, frame: SharedFrame, matrix: SharedArray,
+                method: str, kwargs: dict) -> MethodOutcome:
+    """Worker entry point: rebuild the detector around the shared data and run one method"""
+    blocks, df = attach_frame(frame)
+    block, X = attach_array(matrix)
+    # Results can still view the mappings (a fitted model may keep its training matrix) until
+    # they are pickled after this returns, so the mappings live as long as the worker
+    _worker_blocks.extend(blocks + [block])
+    return _run_in_process(detector_class, state, df, X, method, kwargs)
+
+
+def _run_in_process(detector_class, state: dict, df: pd.DataFrame, X: np.ndarray,
+                    method: str, kwargs: dict) -> MethodOutcome:
+    """Rebuild the detector around df and X and run one method, capturing what it prints"""
+    detector = detector_class.for_worker(state, df, X)
+    output = io.StringIO()
+    with contextlib.redirect_stdout(output):
+        result = getattr(detector, method)(df, **kwargs)
+    result = {key: value for key, value in result.items() if key != 'features'}
+    return MethodOutcome(result, output.getvalue(), detector.models, detector.model_bundle)
+
+
+def run_methods(detector_class, state: dict, df: pd.DataFrame, X: np.ndarray,
+                methods: List[Tuple[str, dict]], max_workers: Optional[int] = None) -> List[MethodOutcome]:
+    """
+    Run detection methods concurrently, one worker process each
+
+    Workers are spawned and re-import the caller's __main__, so a calling
+    script needs an `if __name__ == "__main__":` guard. If the pool breaks
+    (no guard, or a worker died), every method is run again sequentially
+    in this process.
+
+    Args:
+        detector_class: Detector class whose for_worker(state, df, X) rebuilds it in a worker
+        state: The detector's picklable state
+        df: Feature DataFrame the methods take
+        X: Scaled feature matrix the detector caches for df
+        methods: (method name, keyword arguments) pairs, run in parallel
+        max_workers: Worker processes; defaults to one per method
+
+    Returns:
+        One outcome per method, in the order given
+    """
+    blocks, frame = share_frame(df)
+    try:
+        block, matrix = share_array(X)
+        blocks.append(block)
+        try:
+            with ProcessPoolExecutor(max_workers=max_workers or len(methods),
+                                     mp_context=multiprocessing.get_context('spawn')) as pool:
+                futures = [pool.submit(_run_method, detector_class, state, frame, matrix, method, kwargs)
+                           for method, kwargs in methods]
+                return [future.result() for future in futures]
+        except BrokenProcessPool:
+            print("⚠️ Worker processes failed (scripts must run the ensemble under "
+                  "`if __name__ == \"__main__\":`); running the methods one after another")
+    finally:
+        for block in blocks:
+            block.close()
+            block.unlink()
+    return [_run_in_process(detector_class, state, df, X, method, kwargs) for method, kwargs in methods]
@@ -0,0 +1,95 @@
+"""
+Batch explanations for flagged users
+
+Each detection method explains its flagged users with a few rules of the
+form "feature above a multiple of the reference mean plus a multiple of
+its standard deviation". The reference statistics are computed once, for
+the whole reference population or once per peer group, and every rule is
+evaluated for all flagged users at once. The result is a boolean matrix
+(flagged user x rule) instead of per-user reason lists, so explaining 50k
+users costs a few array operations rather than 50k DataFrame filters.
+"""
+
+from typing import List, NamedTuple, Optional
+
+import numpy as np
+import pandas as pd
+
+# Flagged users printed in detail per method; every user is still explained in the returned arrays
+EXPLAIN_PRINT_LIMIT = 25
+
+
+class ReasonRule(NamedTuple):
+    """Reason holds when feature > mean_factor * reference mean + std_factor * reference std"""
+    reason: str  # may name the row's peer group as {group}
+    feature: str
+    mean_factor: float = 1.0
+    std_factor: float = 0.0
+
+
+class Explanations(NamedTuple):
+    """Reasons for a set of flagged rows, aligned with `rows`"""
+    rows: np.ndarray             # positions of the flagged users in the feature DataFrame
+    rules: List[ReasonRule]
+    reasons: np.ndarray          # bool (len(rows), len(rules))
+    reference_mean: np.ndarray   # float (len(rows), len(rules)), mean of each rule's feature for the row's reference
+    has_reference: np.ndarray    # bool (len(rows),), False when the row's peer group is too small
+    groups: Optional[np.ndarray] = None  # peer group of each row, when explained per group
+
+    def reason_text(self, i: int) -> List[str]:
+        """The reasons that hold for the i-th flagged row, as text"""
+        group = self.groups[i] if self.groups is not None else None
+        return [rule.reason.format(group=group) for rule, holds in zip(self.rules, self.reasons[i]) if holds]
+
+    def counts(self) -> np.ndarray:
+        """Number of reasons that hold per flagged row"""
+        return self.reasons.sum(axis=1)
+
+
+def explain(df: pd.DataFrame, rows: np.ndarray, rules: List[ReasonRule],
+            reference: Optional[np.ndarray] = None, group_by: Optional[str] = None,
+            min_group_size: int = 1) -> Explanations:
+    """
+    Evaluate every rule for the flagged `rows` of df in one pass
+
+    Args:
+        df: Feature DataFrame the rows index into
+        rows: Positions of the flagged users
+        rules: Reasons to evaluate
+        reference: Boolean mask of the rows the statistics come from; all rows if None
+        group_by: Column whose values form peer groups, each with its own statistics
+        min_group_size: Peer groups smaller than this explain nothing
+    """
+    features = list(dict.fromkeys(rule.feature for rule in rules))
+    mean_factor = np.array([rule.mean_factor for rule in rules])
+    std_factor = np.array([rule.std_factor for rule in rules])
+    columns = [features.index(rule.feature) for rule in rules]
+
+    values = df[features].to_numpy(dtype=np.float64)
+    reference_values = values if reference is None else values[reference]
+    flagged = values[rows][:, columns]
+
+    if group_by is None:
+        groups = None
+        mean = np.broadcast_to(reference_values.mean(axis=0)[columns], flagged.shape)
+        # Sample standard deviation, as pandas computes it; undefined below two rows
+        spread = reference_values.std(axis=0, ddof=1) if len(reference_values) > 1 else np.full(len(features), np.nan)
+        std = np.broadcast_to(spread[columns], flagged.shape)
+        has_reference = np.full(len(rows), len(reference_values) >= min_group_size)
+    else:
+        keys = df[group_by].to_numpy()
+        reference_keys = keys if reference is None else keys[reference]
+        stats = pd.DataFrame(reference_values, columns=features).groupby(reference_keys).agg(['mean', 'std', 'size'])
+        groups = keys[rows]
+        # Align each flagged row with its group's statistics; unknown groups come back as NaN
+        per_row = stats.reindex(groups)
+        mean = per_row.xs('mean', axis=1, level=1)[features].to_numpy()[:, columns]
+        std = per_row.xs('std', axis=1, level=1)[features].to_numpy()[:, columns]
+        size = per_row[(features[0], 'size')].fillna(0).to_numpy()
+        has_reference = size >= min_group_size
+
+    with np.errstate(invalid='ignore'):
+        # Rules without a std term must not inherit NaN from an undefined deviation
+        threshold = mean_factor * mean + np.where(std_factor != 0, std_factor * std, 0.0)
+        reasons = (flagged > threshold) & has_reference[:, None]
+    return Explanations(rows, list(rules), reasons, np.asarray(mean), has_reference, groups)
@@ -0,0 +1,229 @@
+"""
+Graph sources: where the anomaly detector reads its security features
+
+A source exports the graph once into compressed sparse row (CSR) arrays:
+each node's outgoing edges are targets[indptr[n]:indptr[n + 1]]. Every
+per-user feature is then computed for all users at once with NumPy, and
+k-hop reachability to sensitive data comes from boolean sparse matrix
+products over the adjacency, frontier by frontier. Nothing expands
+variable-length paths per user, so dense graphs no longer time out.
+
+Neo4jGraphSource streams nodes and relationships out of the database;
+InMemoryGraphSource reads the arrays of an in-process graph (the discovery
+simulator's InMemoryGraph), so the detector also runs without Neo4j.
+"""
+
+from array import array
+from typing import Dict, NamedTuple
+
+import numpy as np
+from neo4j import GraphDatabase
+from scipy import sparse
+
+# Every node with what the features need; User properties only for users
+NODE_EXPORT_QUERY = """
+MATCH (n)
+RETURN id(n) AS id,
+       labels(n)[0] AS label,
+       n:User AS is_user,
+       n:Role AS is_role,
+       (n.contains_pii = true OR n.type = 'S3Bucket') AS sensitive,
+       CASE WHEN n:User THEN n.name END AS user_name,
+       CASE WHEN n:User THEN n.access_level END AS access_level
+"""
+
+EDGE_EXPORT_QUERY = """
+MATCH (a)-[r]->(b)
+RETURN id(a) AS source, id(b) AS target, type(r) AS type
+"""
+
+# privilege_level by access_level; anything else is 1
+PRIVILEGE_LEVELS = {'administrator': 5, 'developer': 3}
+# Hops followed when counting reachable sensitive data
+SENSITIVE_REACH_HOPS = 3
+# Users whose reachable sets are expanded together; bounds the reach matrix held in memory
+REACH_CHUNK_USERS = 50000
+
+
+class GraphExport(NamedTuple):
+    """A graph in CSR form, with the node attributes the security features use
+
+    Node positions run from 0 to len(labels) - 1. Deleted or unused
+    positions have label -1 and no edges.
+    """
+    indptr: np.ndarray     # int64, len(labels) + 1
+    targets: np.ndarray    # int64, target position per edge, grouped by source
+    types: np.ndarray      # int64, relationship type id per edge
+    labels: np.ndarray     # int64, first label id per node
+    sensitive: np.ndarray  # bool, contains_pii = true or type = 'S3Bucket'
+    roles: np.ndarray      # bool, node is a Role
+    users: np.ndarray      # int64, positions of the User nodes
+    user_names: list
+    access_levels: list
+    assumes_role: int      # type id of ASSUMES_ROLE, -1 when the graph has none
+
+
+def csr_from_edges(sources: np.ndarray, targets: np.ndarray, types: np.ndarray, node_count: int) -> tuple:
+    """Group edges by source: returns (indptr, targets, types)"""
+    order = np.argsort(sources, kind='stable')
+    indptr = np.zeros(node_count + 1, dtype=np.int64)
+    np.cumsum(np.bincount(sources, minlength=node_count), out=indptr[1:])
+    return indptr, targets[order], types[order]
+
+
+def sensitive_reach_counts(graph: GraphExport, hops: int = SENSITIVE_REACH_HOPS,
+                           chunk_users: int = REACH_CHUNK_USERS) -> np.ndarray:
+    """Distinct sensitive nodes each user reaches over 1..hops relationships
+
+    For a chunk of users, the first frontier is their adjacency rows; each
+    further hop multiplies the frontier by the adjacency matrix and keeps
+    only nodes not reached before, so every node is expanded at most once
+    per user. A user counts itself only when a cycle leads back to it, as
+    with the Cypher pattern (user)-[*1..3]->(sensitive).
+    """
+    node_count = len(graph.labels)
+    adjacency = sparse.csr_matrix((np.ones(len(graph.targets), dtype=bool), graph.targets, graph.indptr),
+                                  shape=(node_count, node_count))
+    counts = np.zeros(len(graph.users), dtype=np.int64)
+    for start in range(0, len(graph.users), chunk_users):
+        frontier = adjacency[graph.users[start:start + chunk_users]]
+        reached = frontier
+        for _ in range(hops - 1):
+            if frontier.nnz == 0:
+                break
+            frontier = (frontier @ adjacency) > reached
+            reached = reached + frontier
+        reached = reached.tocsr()
+        rows = np.repeat(np.arange(reached.shape[0]), np.diff(reached.indptr))
+        counts[start:start + reached.shape[0]] = np.bincount(rows[graph.sensitive[reached.indices]],
+                                                             minlength=reached.shape[0])
+    return counts
+
+
+def _distinct_per_row(rows: np.ndarray, values: np.ndarray, row_count: int) -> np.ndarray:
+    """Number of distinct values per row for parallel (row, value) arrays"""
+    if len(rows) == 0:
+        return np.zeros(row_count, dtype=np.int64)
+    width = int(values.max()) + 1
+    return np.bincount(np.unique(rows * width + values) // width, minlength=row_count)
+
+
+def security_feature_columns(graph: GraphExport) -> Dict[str, np.ndarray]:
+    """The detector's feature columns, one array each with a row per User, computed for all users at once"""
+    user_count = len(graph.users)
+    degree = graph.indptr[graph.users + 1] - graph.indptr[graph.users]
+    # The users' outgoing edges, flattened, with the user row each belongs to
+    rows = np.repeat(np.arange(user_count), degree)
+    offsets = np.cumsum(degree) - degree
+    edges = np.arange(len(rows)) - offsets[rows] + graph.indptr[graph.users][rows]
+    targets = graph.targets[edges]
+    types = graph.types[edges]
+
+    unique_targets = _distinct_per_row(rows, targets, user_count)
+    target_diversity = _distinct_per_row(rows, graph.labels[targets], user_count)
+    access_methods = _distinct_per_row(rows, types, user_count)
+    roles_assumed = np.bincount(rows[(types == graph.assumes_role) & graph.roles[targets]], minlength=user_count)
+    reach = sensitive_reach_counts(graph)
+
+    return {
+        'user_name': np.array(graph.user_names, dtype=object),
+        'access_level': np.array(graph.access_levels, dtype=object),
+        'total_access_count': degree.astype(np.int64),
+        'unique_targets_accessed': unique_targets,
+        'target_diversity': target_diversity,
+        'access_method_diversity': access_methods,
+        'sensitive_data_reachable': reach,
+        'roles_assumed': roles_assumed.astype(np.int64),
+        'privilege_level': np.fromiter((PRIVILEGE_LEVELS.get(level, 1) for level in graph.access_levels),
+                                       dtype=np.int64, count=user_count)
+    }
+
+
+class GraphSource:
+    """Read side of a graph backend, as the anomaly detector uses it"""
+
+    def export(self) -> GraphExport:
+        raise NotImplementedError
+
+    def security_feature_columns(self) -> Dict[str, np.ndarray]:
+        """Activity, breadth, reachability and privilege features, one array per column with a row per User"""
+        return security_feature_columns(self.export())
+
+    def close(self):
+        pass
+
+
+class Neo4jGraphSource(GraphSource):
+    """Exports the graph from Neo4j with two streaming scans, nodes then relationships"""
+
+    def __init__(self, neo4j_uri: str, neo4j_user: str, neo4j_password: str):
+        self.driver = GraphDatabase.driver(neo4j_uri, auth=(neo4j_user, neo4j_password))
+
+    def export(self) -> GraphExport:
+        label_ids: Dict[str, int] = {}
+        type_ids: Dict[str, int] = {}
+        node_ids, labels = array('q'), array('q')
+        sensitive, roles = array('b'), array('b')
+        users, user_names, access_levels = array('q'), [], []
+        sources, targets, types = array('q'), array('q'), array('q')
+        with self.driver.session() as session:
+            for position, record in enumerate(session.run(NODE_EXPORT_QUERY)):
+                node_ids.append(record['id'])
+                labels.append(label_ids.setdefault(record['label'], len(label_ids)))
+                sensitive.append(bool(record['sensitive']))
+                roles.append(record['is_role'])
+                if record['is_user']:
+                    users.append(position)
+                    user_names.append(record['user_name'])
+                    access_levels.append(record['access_level'])
+            for record in session.run(EDGE_EXPORT_QUERY):
+                sources.append(record['source'])
+                targets.append(record['target'])
+                types.append(type_ids.setdefault(record['type'], len(type_ids)))
+
+        # Database ids are sparse; map them to dense positions
+        node_ids = np.frombuffer(node_ids, dtype=np.int64)
+        order = np.argsort(node_ids)
+
+        def position(ids: np.ndarray) -> np.ndarray:
+            return order[np.searchsorted(node_ids, ids, sorter=order)]
+
+        node_count = len(node_ids)
+        indptr, edge_targets, edge_types = csr_from_edges(
+            position(np.frombuffer(sources, dtype=np.int64)), position(np.frombuffer(targets, dtype=np.int64)),
+            np.frombuffer(types, dtype=np.int64), node_count)
+        return GraphExport(indptr, edge_targets, edge_types, np.frombuffer(labels, dtype=np.int64),
+                           np.frombuffer(sensitive, dtype=bool), np.frombuffer(roles, dtype=bool),
+                           np.frombuffer(users, dtype=np.int64), user_names, access_levels,
+                           type_ids.get('ASSUMES_ROLE', -1))
+
+    def close(self):
+        self.driver.close()
+
+
+class InMemoryGraphSource(GraphSource):
+    """Reads an in-process graph's arrays directly
+
+    `graph` provides node_count, node(id) -> properties or None,
+    node_labels() -> label id per node, label_id(name), type_id(name) and
+    adjacency() -> (indptr, targets, type ids, edge ids), as cartography's
+    InMemoryGraph does.
+    """
+
+    def __init__(self, graph):
+        self.graph = graph
+
+    def export(self) -> GraphExport:
+        graph = self.graph
+        indptr, targets, types, _ = graph.adjacency()
+        labels = graph.node_labels()
+        props = [graph.node(node_id) or {} for node_id in range(graph.node_count)]
+        sensitive = np.fromiter((p.get('contains_pii') is True or p.get('type') == 'S3Bucket' for p in props),
+                                dtype=bool, count=len(props))
+        user_label, role_label, assumes_role = graph.label_id('User'), graph.label_id('Role'), \
+            graph.type_id('ASSUMES_ROLE')
+        users = np.flatnonzero(labels == user_label) if user_label is not None else np.empty(0, dtype=np.int64)
+        return GraphExport(indptr, targets, types.astype(np.int64), labels, sensitive,
+                           labels == role_label if role_label is not None else np.zeros(len(labels), dtype=bool),
+                           users, [props[u].get('name') for u in users], [props[u].get('access_level') for u in users],
+                           assumes_role if assumes_role is not None else -1)
@@ -0,0 +1,144 @@
+"""
+Saved anomaly models and the bookkeeping for reusing them
+
+A trained model is saved together with the fitted scaler, the feature
+schema it expects, the contamination it was trained for and per-feature
+reference bins for drift checks. Later runs load it back and score users
+with it instead of refitting; it is retrained only when the schema or the
+requested contamination changes, the model is older than the retrain
+schedule, or the current population has drifted away from the training
+data.
+
+The registry also remembers a hash of each user's features as last
+scored, so a daily run can score just the new and changed users.
+"""
+
+import os
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, NamedTuple, Optional, Union
+
+import joblib
+import numpy as np
+import pandas as pd
+
+# Where models are saved; unset keeps models in memory only
+ANOMALY_MODEL_DIR = os.environ.get("ANOMALY_MODEL_DIR")
+# Days before a saved model is retrained regardless of drift
+RETRAIN_AFTER_DAYS = int(os.environ.get("ANOMALY_RETRAIN_DAYS", "7"))
+# Population stability index above which a feature counts as drifted
+DRIFT_THRESHOLD = float(os.environ.get("ANOMALY_DRIFT_THRESHOLD", "0.2"))
+# Quantile bins per feature for the drift reference
+DRIFT_BINS = 10
+
+
+class ModelBundle(NamedTuple):
+    """A trained model with everything needed to score new users against it"""
+    model: object
+    scaler: object
+    feature_names: List[str]
+    contamination: Union[float, str]  # the model's contamination setting
+    trained_at: str        # ISO-8601, UTC
+    n_samples: int
+    drift_edges: list      # per feature, inner bin edges from the training quantiles
+    drift_expected: list   # per feature, share of training rows in each bin
+
+
+def _bin_shares(values: np.ndarray, edges: np.ndarray) -> np.ndarray:
+    counts = np.bincount(np.searchsorted(edges, values, side='right'), minlength=len(edges) + 1)
+    return counts / max(len(values), 1)
+
+
+def drift_reference(X: np.ndarray) -> tuple:
+    """(inner bin edges, training shares) per feature column of a raw feature matrix"""
+    edges, expected = [], []
+    for column in X.T:
+        inner = np.unique(np.quantile(column, np.linspace(0, 1, DRIFT_BINS + 1)[1:-1]))
+        edges.append(inner)
+        expected.append(_bin_shares(column, inner))
+    return edges, expected
+
+
+def feature_drift(bundle: ModelBundle, X: np.ndarray) -> Dict[str, float]:
+    """Population stability index of each feature between the training data and X"""
+    drift = {}
+    for name, column, edges, expected in zip(bundle.feature_names, X.T, bundle.drift_edges,
+                                             bundle.drift_expected):
+        # A small floor keeps empty bins from dividing by zero
+        actual = np.clip(_bin_shares(column, edges), 1e-4, None)
+        expected = np.clip(expected, 1e-4, None)
+        drift[name] = float(np.sum((actual - expected) * np.log(actual / expected)))
+    return drift
+
+
+def retrain_reason(bundle: ModelBundle, feature_names: List[str], X: Optional[np.ndarray] = None,
+                   contamination: Union[float, str, None] = None,
+                   now: Optional[datetime] = None) -> Optional[str]:
+    """Why the saved model should not be reused, or None if it can be
+
+    The drift check runs only when the raw feature matrix X is given, and
+    the contamination check only when a contamination is requested.
+    """
+    if list(bundle.feature_names) != list(feature_names):
+        return "feature schema changed"
+    if contamination is not None and bundle.contamination != contamination:
+        return f"contamination changed from {bundle.contamination} to {contamination}"
+    age = (now or datetime.now(timezone.utc)) - datetime.fromisoformat(bundle.trained_at)
+    if age > timedelta(days=RETRAIN_AFTER_DAYS):
+        return f"model is {age.days} days old (retrain every {RETRAIN_AFTER_DAYS})"
+    if X is None:
+        return None
+    drifted = {name: psi for name, psi in feature_drift(bundle, X).items() if psi > DRIFT_THRESHOLD}
+    if drifted:
+        return "drift in " + ", ".join(f"{name} (PSI {psi:.2f})" for name, psi in drifted.items())
+    return None
+
+
+def feature_hashes(df: pd.DataFrame, feature_names: List[str]) -> pd.Series:
+    """One 64-bit hash of each user's feature values, indexed by user_name"""
+    hashes = pd.util.hash_pandas_object(df[feature_names], index=False)
+    return pd.Series(hashes.to_numpy(), index=df['user_name'].to_numpy())
+
+
+class ModelRegistry:
+    """Models saved as joblib files under one directory, one file per model name"""
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, name: str) -> str:
+        return os.path.join(self.directory, f"{name}.joblib")
+
+    def _dump(self, value, path: str) -> None:
+        # Write then rename, so a crash never leaves a truncated model behind
+        tmp_path = f"{path}.tmp"
+        joblib.dump(value, tmp_path)
+        os.replace(tmp_path, path)
+
+    def _read(self, path: str):
+        return joblib.load(path) if os.path.exists(path) else None
+
+    def save(self, name: str, bundle: ModelBundle) -> str:
+        path = self._path(name)
+        self._dump(bundle._asdict(), path)
+        return path
+
+    def load(self, name: str) -> Optional[ModelBundle]:
+        """The saved bundle, or None if there is none or it was saved with other fields"""
+        saved = self._read(self._path(name))
+        if not saved or set(saved) != set(ModelBundle._fields):
+            return None
+        return ModelBundle(**saved)
+
+    def scored_hashes(self, name: str) -> pd.Series:
+        """Feature hashes of the users last scored with model `name`, one per user name (the last scored)"""
+        saved = self._read(self._path(f"{name}.scored"))
+        if saved is None:
+            return pd.Series(dtype=np.uint64)
+        hashes = pd.Series(saved['hashes'], index=saved['users'])
+        return hashes[~hashes.index.duplicated(keep='last')]
+
+    def save_scored_hashes(self, name: str, hashes: pd.Series) -> None:
+        # Fixed-width arrays rather than a pickled Series: loads in milliseconds for millions of users
+        self._dump({'users': np.asarray(hashes.index, dtype=str), 'hashes': hashes.to_numpy(dtype=np.uint64)},
+                   self._path(f"{name}.scored"))
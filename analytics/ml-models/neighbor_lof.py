@@ -0,0 +1,182 @@
+"""
+Local Outlier Factor over a prebuilt neighbor index
+
+sklearn's LocalOutlierFactor holds the whole k-nearest-neighbor graph of
+the training set in float64/int64 while it fits, and refits from scratch
+whenever a user is added. NeighborLOF builds a KD-tree or ball tree once
+and queries it in chunks sized from a memory budget. Only two values per
+user are kept between passes, the k-distance and the local reachability
+density (lrd); the neighbor graph itself is cached when it fits in half
+the budget, and re-queried chunk by chunk when it does not.
+
+The fitted index with those two arrays is the reference set: new users are
+scored against it (novelty mode) with one query each, without refitting.
+Scores follow sklearn's definitions, so negative_outlier_factor_, offset_
+and the -1/1 predictions line up with LocalOutlierFactor's.
+"""
+
+import os
+from typing import Iterator, List, Optional, Tuple, Union
+
+import numpy as np
+from joblib import Parallel, delayed
+from sklearn.neighbors import BallTree, KDTree
+
+# Memory budget for neighbor queries and the cached neighbor graph, in MB
+LOF_MEMORY_MB = int(os.environ.get("ANOMALY_LOF_MEMORY_MB", "2048"))
+# Neighbor indexes by name
+NEIGHBOR_INDEXES = {'kd_tree': KDTree, 'ball_tree': BallTree}
+# Bytes per queried neighbor while a chunk is in flight: the tree's float64
+# distances and int64 indices plus the temporaries derived from them
+QUERY_BYTES_PER_NEIGHBOR = 64
+# Added to mean reachability distances, as sklearn does, so duplicates do not divide by zero
+LRD_EPSILON = 1e-10
+
+
+def query_excluding_self(tree, X: np.ndarray, start: int, stop: int, k: int) -> Tuple[np.ndarray, np.ndarray]:
+    """k nearest neighbors of rows start:stop of X in a tree built over X, leaving out each row itself"""
+    # Query one extra neighbor and drop the row itself, or the farthest one
+    # when more than k duplicates leave the row out of its own result
+    distances, indices = tree.query(X[start:stop], k=k + 1)
+    is_self = indices == np.arange(start, stop)[:, None]
+    drop = np.where(is_self.any(axis=1), is_self.argmax(axis=1), k)
+    keep = np.arange(k + 1) != drop[:, None]
+    return distances[keep].reshape(-1, k), indices[keep].reshape(-1, k)
+
+
+def worker_count(n_jobs: Optional[int]) -> int:
+    """Threads that n_jobs runs at once; None and 1 mean one, a negative value every CPU"""
+    if n_jobs in (None, 1):
+        return 1
+    return (os.cpu_count() or 1) if n_jobs < 0 else n_jobs
+
+
+def map_chunks(n_jobs: Optional[int], function, chunks: List[tuple]) -> Iterator:
+    """function(*chunk) for each chunk, in order; on threads when n_jobs asks for more than one
+
+    Read it to the end, e.g. zipped with strict=True against the chunks:
+    joblib warns when its generator is dropped before it finishes.
+    """
+    if n_jobs in (None, 1):
+        return (function(*chunk) for chunk in chunks)
+    return Parallel(n_jobs=n_jobs, prefer='threads', return_as='generator')(
+        delayed(function)(*chunk) for chunk in chunks)
+
+
+class NeighborLOF:
+    """Local Outlier Factor with a tree index and chunked neighbor queries"""
+
+    def __init__(self, n_neighbors: int = 20, contamination: Union[float, str] = 'auto',
+                 index: str = 'kd_tree', leaf_size: int = 40, memory_mb: int = LOF_MEMORY_MB,
+                 n_jobs: Optional[int] = None):
+        """
+        Args:
+            n_neighbors: Neighbors per user (k)
+            contamination: Share of training users flagged, or 'auto' for sklearn's fixed offset of -1.5
+            index: 'kd_tree' or 'ball_tree'
+            leaf_size: Leaf size of the tree
+            memory_mb: Budget for in-flight queries and the cached neighbor graph
+            n_jobs: Chunks queried concurrently on threads; the tree query releases the GIL
+        """
+        if index not in NEIGHBOR_INDEXES:
+            raise ValueError(f"Unknown neighbor index {index!r}; expected one of {', '.join(NEIGHBOR_INDEXES)}")
+        self.n_neighbors = n_neighbors
+        self.contamination = contamination
+        self.index = index
+        self.leaf_size = leaf_size
+        self.memory_mb = memory_mb
+        self.n_jobs = n_jobs
+
+    def _budget_bytes(self) -> int:
+        return self.memory_mb * 2 ** 20
+
+    def _chunk_rows(self) -> int:
+        """Query rows per chunk so all concurrent chunks fit in half the budget"""
+        per_row = worker_count(self.n_jobs) * (self.n_neighbors + 1) * QUERY_BYTES_PER_NEIGHBOR
+        return max(1, self._budget_bytes() // 2 // per_row)
+
+    def _query(self, X: np.ndarray, start: int, stop: int, exclude_self: bool) -> Tuple[np.ndarray, np.ndarray]:
+        """Distances and indices of the k nearest reference users for rows start:stop of X"""
+        if not exclude_self:
+            return self.tree_.query(X[start:stop], k=self.n_neighbors)
+        return query_excluding_self(self.tree_, X, start, stop, self.n_neighbors)
+
+    def _chunks(self, X: np.ndarray, exclude_self: bool) -> Iterator[Tuple[int, np.ndarray, np.ndarray]]:
+        """(start, distances, indices) per chunk of X, in order"""
+        step = self._chunk_rows()
+        chunks = [(X, start, min(start + step, len(X)), exclude_self) for start in range(0, len(X), step)]
+        results = map_chunks(self.n_jobs, self._query, chunks)
+        for (_, start, _, _), (distances, indices) in zip(chunks, results, strict=True):
+            yield start, distances, indices
+
+    def _fit_chunks(self, X: np.ndarray, graph: Optional[tuple]) -> Iterator[Tuple[int, np.ndarray, np.ndarray]]:
+        """Neighbors of the training rows: slices of the cached graph, or a fresh query"""
+        if graph is None:
+            yield from self._chunks(X, exclude_self=True)
+            return
+        step = self._chunk_rows()
+        for start in range(0, len(X), step):
+            yield start, graph[0][start:start + step], graph[1][start:start + step]
+
+    def _local_reachability(self, distances: np.ndarray, indices: np.ndarray) -> np.ndarray:
+        """lrd of the queried rows from their neighbors' k-distances"""
+        reach = np.maximum(distances, self.k_distance_[indices])
+        return 1.0 / (reach.mean(axis=1) + LRD_EPSILON)
+
+    def fit(self, X: np.ndarray) -> 'NeighborLOF':
+        """Build the index over X and score every row of it as the reference set"""
+        n = len(X)
+        if not 0 < self.n_neighbors < n:
+            raise ValueError(f"n_neighbors must be between 1 and {n - 1} for {n} users")
+        self.tree_ = NEIGHBOR_INDEXES[self.index](X, leaf_size=self.leaf_size)
+        self.n_samples_fit_ = n
+
+        # Keep the neighbor graph between passes when it fits in half the budget
+        index_dtype = np.int32 if n < 2 ** 31 else np.int64
+        graph_bytes = n * self.n_neighbors * (8 + np.dtype(index_dtype).itemsize)
+        graph = None
+        if graph_bytes <= self._budget_bytes() // 2:
+            graph = (np.empty((n, self.n_neighbors)), np.empty((n, self.n_neighbors), dtype=index_dtype))
+
+        # Pass 1: distance to the k-th neighbor
+        self.k_distance_ = np.empty(n, dtype=np.float64)
+        for start, distances, indices in self._chunks(X, exclude_self=True):
+            stop = start + len(distances)
+            self.k_distance_[start:stop] = distances[:, -1]
+            if graph is not None:
+                graph[0][start:stop], graph[1][start:stop] = distances, indices
+        # Pass 2: local reachability density, which needs every neighbor's k-distance
+        self.lrd_ = np.empty(n, dtype=np.float64)
+        for start, distances, indices in self._fit_chunks(X, graph):
+            self.lrd_[start:start + len(distances)] = self._local_reachability(distances, indices)
+        # Pass 3: LOF is the neighbors' mean lrd over the row's own
+        self.negative_outlier_factor_ = np.empty(n, dtype=np.float64)
+        for start, _, indices in self._fit_chunks(X, graph):
+            stop = start + len(indices)
+            self.negative_outlier_factor_[start:stop] = -self.lrd_[indices].mean(axis=1) / self.lrd_[start:stop]
+
+        if self.contamination == 'auto':
+            self.offset_ = -1.5
+        else:
+            self.offset_ = np.percentile(self.negative_outlier_factor_, 100.0 * self.contamination)
+        return self
+
+    def fit_predict(self, X: np.ndarray) -> np.ndarray:
+        """Fit on X and return -1 for its outliers and 1 for inliers"""
+        return np.where(self.fit(X).negative_outlier_factor_ < self.offset_, -1, 1)
+
+    def score_samples(self, X: np.ndarray) -> np.ndarray:
+        """Negative LOF of new rows against the reference set, without refitting (lower = more unusual)"""
+        scores = np.empty(len(X), dtype=np.float64)
+        for start, distances, indices in self._chunks(X, exclude_self=False):
+            stop = start + len(indices)
+            scores[start:stop] = -self.lrd_[indices].mean(axis=1) / self._local_reachability(distances, indices)
+        return scores
+
+    def decision_function(self, X: np.ndarray) -> np.ndarray:
+        """score_samples shifted by offset_: negative for outliers"""
+        return self.score_samples(X) - self.offset_
+
+    def predict(self, X: np.ndarray) -> np.ndarray:
+        """-1 for new rows that are outliers against the reference set, 1 otherwise"""
+        return np.where(self.decision_function(X) < 0, -1, 1)
@@ -0,0 +1,22 @@
+"""Puts the ml-models modules on sys.path and gives each test its own model registry"""
+
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from synthetic import FrameSource  # noqa: E402
+
+
+@pytest.fixture
+def detector_for(tmp_path):
+    """Detector factory over a DataFrame; every detector of a test shares one model registry"""
+    from anomaly_detector import EducationalAnomalyDetector
+    from model_registry import ModelRegistry
+
+    def build(df):
+        detector = EducationalAnomalyDetector(source=FrameSource(df), registry=ModelRegistry(str(tmp_path)))
+        return detector, detector.extract_security_features()
+    return build
@@ -0,0 +1,32 @@
+"""Small synthetic user populations and a graph source serving them"""
+
+import numpy as np
+import pandas as pd
+
+from graph_source import GraphSource
+
+
+class FrameSource(GraphSource):
+    """Serves the feature columns of a DataFrame instead of reading the graph"""
+
+    def __init__(self, df: pd.DataFrame):
+        self.df = df
+
+    def security_feature_columns(self):
+        return {column: self.df[column].to_numpy() for column in self.df}
+
+
+def population(n: int = 500, shift: float = 0.0, seed: int = 1) -> pd.DataFrame:
+    """Users with Poisson feature counts; `shift` raises the mean access count"""
+    rng = np.random.default_rng(seed)
+    return pd.DataFrame({
+        'user_name': [f'user{i}' for i in range(n)],
+        'access_level': rng.choice(['administrator', 'developer', 'reader'], n),
+        'total_access_count': rng.poisson(4 + shift, n),
+        'unique_targets_accessed': rng.poisson(3, n),
+        'target_diversity': rng.poisson(2, n),
+        'access_method_diversity': rng.poisson(1, n),
+        'sensitive_data_reachable': rng.poisson(2, n),
+        'roles_assumed': rng.poisson(1, n),
+        'privilege_level': rng.integers(1, 4, n),
+    })
@@ -0,0 +1,26 @@
+"""ChunkedDBSCAN and GraphHDBSCAN"""
+
+import numpy as np
+import pytest
+
+from density_clustering import GraphHDBSCAN
+from synthetic import FrameSource, population
+
+
+@pytest.mark.parametrize('n', [0, 1, 2, 4])
+def test_hdbscan_too_few_users_are_noise(n):
+    X = np.random.default_rng(0).normal(size=(n, 3))
+    model = GraphHDBSCAN(min_cluster_size=5).fit(X)
+    np.testing.assert_array_equal(model.labels_, np.full(n, -1))
+    assert model.n_clusters_ == 0
+
+
+@pytest.mark.parametrize('algorithm', ['dbscan', 'hdbscan'])
+def test_clustering_model_is_kept_under_its_algorithm(algorithm):
+    from anomaly_detector import EducationalAnomalyDetector
+
+    detector = EducationalAnomalyDetector(source=FrameSource(population(1)))
+    features = detector.extract_security_features()
+    result = detector.clustering_analysis(features, algorithm=algorithm)
+    assert list(detector.models) == [algorithm]
+    assert result['is_outlier'].tolist() == [True]
@@ -0,0 +1,92 @@
+"""Saved Isolation Forest models are reused, and retrained when they no longer fit"""
+
+from datetime import datetime, timedelta, timezone
+
+import numpy as np
+import pytest
+
+from anomaly_detector import ISOLATION_FOREST_MODEL
+from synthetic import population
+from model_registry import RETRAIN_AFTER_DAYS, retrain_reason
+
+
+def saved_bundle(detector):
+    return detector.registry.load(ISOLATION_FOREST_MODEL)
+
+
+def test_saved_model_round_trips(detector_for):
+    df = population()
+    detector, features = detector_for(df)
+    first = detector.isolation_forest_detection(features)
+    bundle = saved_bundle(detector)
+    assert bundle.feature_names == detector.feature_names
+    assert bundle.contamination == 0.1
+    assert bundle.n_samples == len(df)
+
+    detector, features = detector_for(df)
+    second = detector.isolation_forest_detection(features)
+    assert detector.model_bundle.trained_at == bundle.trained_at
+    np.testing.assert_array_equal(first['is_anomaly'], second['is_anomaly'])
+    np.testing.assert_allclose(first['anomaly_score'], second['anomaly_score'])
+
+
+def test_contamination_change_retrains(detector_for):
+    df = population()
+    detector, features = detector_for(df)
+    detector.isolation_forest_detection(features)
+    trained_at = saved_bundle(detector).trained_at
+
+    detector, features = detector_for(df)
+    detector.isolation_forest_detection(features, contamination=0.05)
+    bundle = saved_bundle(detector)
+    assert bundle.contamination == 0.05
+    assert bundle.trained_at != trained_at
+
+
+def test_unchanged_users_are_not_rescored(detector_for):
+    df = population()
+    detector, features = detector_for(df)
+    detector.isolation_forest_detection(features)
+
+    df.loc[:9, 'total_access_count'] += 1
+    detector, features = detector_for(df)
+    result = detector.score_new_users(features)
+    assert list(result['features']['user_name']) == [f'user{i}' for i in range(10)]
+
+
+def test_old_model_is_retrained(detector_for):
+    df = population()
+    detector, features = detector_for(df)
+    detector.isolation_forest_detection(features)
+    bundle = saved_bundle(detector)
+    trained_at = datetime.fromisoformat(bundle.trained_at)
+    assert retrain_reason(bundle, bundle.feature_names,
+                          now=trained_at + timedelta(days=RETRAIN_AFTER_DAYS - 1)) is None
+    assert 'days old' in retrain_reason(bundle, bundle.feature_names,
+                                        now=trained_at + timedelta(days=RETRAIN_AFTER_DAYS + 1))
+
+    old = (datetime.now(timezone.utc) - timedelta(days=RETRAIN_AFTER_DAYS + 1)).isoformat()
+    detector.registry.save(ISOLATION_FOREST_MODEL, bundle._replace(trained_at=old))
+    detector, features = detector_for(df)
+    result = detector.score_new_users(features)
+    assert len(result['features']) == len(df)
+    assert saved_bundle(detector).trained_at > old
+
+
+@pytest.mark.parametrize('shift', [0, 3])
+def test_drift_retrains(detector_for, shift):
+    detector, features = detector_for(population())
+    detector.isolation_forest_detection(features)
+    trained_at = saved_bundle(detector).trained_at
+
+    drifted = population(shift=shift, seed=2)
+    detector, features = detector_for(drifted)
+    reason = retrain_reason(saved_bundle(detector), detector.feature_names,
+                            features[detector.feature_names].to_numpy(dtype=np.float32))
+    detector.score_new_users(features)
+    if shift:
+        assert reason.startswith('drift in total_access_count')
+        assert saved_bundle(detector).trained_at != trained_at
+    else:
+        assert reason is None
+        assert saved_bundle(detector).trained_at == trained_at
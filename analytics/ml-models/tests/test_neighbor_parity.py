@@ -0,0 +1,54 @@
+"""NeighborLOF and ChunkedDBSCAN agree with sklearn's LocalOutlierFactor and DBSCAN"""
+
+import numpy as np
+import pytest
+from sklearn.cluster import DBSCAN
+from sklearn.neighbors import LocalOutlierFactor
+
+from density_clustering import ChunkedDBSCAN
+from neighbor_lof import NeighborLOF
+
+
+@pytest.fixture(scope='module')
+def continuous():
+    rng = np.random.default_rng(7)
+    return np.vstack([rng.normal(size=(1500, 5)), rng.normal(6, 1, size=(20, 5))])
+
+
+@pytest.fixture(scope='module')
+def counts():
+    """Small-count features like the security ones, so many users share a feature row"""
+    rng = np.random.default_rng(3)
+    return np.vstack([rng.poisson(3, size=(3000, 4)), rng.poisson(12, size=(30, 4))]).astype(np.float64)
+
+
+# memory_mb=1 forces many chunks and no cached neighbor graph
+@pytest.mark.parametrize('memory_mb, n_jobs', [(2048, None), (1, None), (1, 3)])
+@pytest.mark.parametrize('index', ['kd_tree', 'ball_tree'])
+def test_lof_matches_sklearn(continuous, memory_mb, n_jobs, index):
+    expected = LocalOutlierFactor(n_neighbors=20, contamination=0.05).fit(continuous)
+    model = NeighborLOF(n_neighbors=20, contamination=0.05, index=index, memory_mb=memory_mb, n_jobs=n_jobs)
+    labels = model.fit_predict(continuous)
+    np.testing.assert_allclose(model.negative_outlier_factor_, expected.negative_outlier_factor_, rtol=1e-6)
+    assert model.offset_ == pytest.approx(expected.offset_)
+    np.testing.assert_array_equal(labels, expected.fit_predict(continuous))
+
+
+def test_lof_novelty_matches_sklearn(continuous):
+    train, new = continuous[:1200], continuous[1200:]
+    expected = LocalOutlierFactor(n_neighbors=20, novelty=True).fit(train)
+    model = NeighborLOF(n_neighbors=20).fit(train)
+    np.testing.assert_allclose(model.score_samples(new), expected.score_samples(new), rtol=1e-6)
+    np.testing.assert_array_equal(model.predict(new), expected.predict(new))
+
+
+@pytest.mark.parametrize('memory_mb, n_jobs', [(2048, None), (1, None), (1, 2)])
+@pytest.mark.parametrize('eps, min_samples', [(0.9, 5), (1.5, 20)])
+def test_dbscan_matches_sklearn(counts, memory_mb, n_jobs, eps, min_samples):
+    expected = DBSCAN(eps=eps, min_samples=min_samples).fit(counts)
+    model = ChunkedDBSCAN(eps=eps, min_samples=min_samples, memory_mb=memory_mb, n_jobs=n_jobs).fit(counts)
+    np.testing.assert_array_equal(model.core_sample_indices_, expected.core_sample_indices_)
+    np.testing.assert_array_equal(model.labels_ == -1, expected.labels_ == -1)
+    core = expected.core_sample_indices_
+    np.testing.assert_array_equal(model.labels_[core], expected.labels_[core])
+    assert model.n_clusters_ == expected.labels_.max() + 1
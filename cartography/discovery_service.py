@@ -0,0 +1,292 @@
+"""
+Discovery job service behind the dashboard's /discover endpoint
+
+POST /discover queues a discovery job, or joins the one already queued or
+running with the same options, so concurrent users never start duplicate
+full re-discoveries. Jobs run on a small worker pool. Each job keeps the
+ordered list of progress events its run publishes; GET /jobs/<id>/events
+replays them and then streams new ones as server-sent events until the job
+ends. GET /jobs/<id> returns the job's current status.
+
+The service knows nothing about Neo4j: it is given a `run` callable that
+performs one discovery, passing each progress event to the publish function
+it receives, and returns the final summary.
+"""
+
+import json
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Callable, Dict, Iterator, List, Optional
+
+DISCOVERY_SERVICE_PORT = 8080
+# Finished jobs kept for status queries
+JOB_HISTORY = 50
+# Seconds between SSE keep-alive comments while a job is quiet
+KEEPALIVE_SECONDS = 15
+# Options a discover request may set; anything else in the body is ignored
+JOB_OPTIONS = {'sweep': bool}
+
+ACTIVE_STATES = ('queued', 'running')
+
+
+def _now() -> str:
+    return time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime())
+
+
+class DiscoveryJob:
+    """One discovery run and everything it has published so far"""
+
+    def __init__(self, options: dict):
+        self.id = uuid.uuid4().hex[:12]
+        self.options = options
+        self.key = json.dumps(options, sort_keys=True)
+        self.status = 'queued'
+        self.created_at = _now()
+        self.started_at: Optional[str] = None
+        self.finished_at: Optional[str] = None
+        self.events: List[dict] = []
+        self.progress: Dict[str, Any] = {}  # latest phase, completed and total phases, counts
+        self.summary: Optional[dict] = None
+        self.error: Optional[str] = None
+        self._changed = threading.Condition()
+
+    @property
+    def done(self) -> bool:
+        return self.status not in ACTIVE_STATES
+
+    def publish(self, event: dict) -> None:
+        """Record a progress event and wake every stream following the job"""
+        with self._changed:
+            self.events.append(dict(event, job_id=self.id))
+            self.progress.update({key: value for key, value in event.items() if key != 'type'})
+            self._changed.notify_all()
+
+    def transition(self, status: str, **fields) -> None:
+        with self._changed:
+            self.status = status
+            for name, value in fields.items():
+                setattr(self, name, value)
+            self.events.append({'type': 'status', 'job_id': self.id, 'status': status,
+                                **({'error': self.error} if self.error else {})})
+            self._changed.notify_all()
+
+    def follow(self, keepalive: float = KEEPALIVE_SECONDS) -> Iterator[Optional[dict]]:
+        """Yield every event from the first, then new ones as they arrive, until the job ends
+
+        Yields None after `keepalive` seconds without news, so a stream can
+        send a comment and notice a closed connection.
+        """
+        position = 0
+        while True:
+            with self._changed:
+                if position == len(self.events) and not self.done:
+                    self._changed.wait(keepalive)
+                events = self.events[position:]
+                finished = self.done
+            position += len(events)
+            yield from events
+            if finished and position == len(self.events):
+                return
+            if not events:
+                yield None
+
+    def to_dict(self) -> dict:
+        with self._changed:
+            return {
+                'id': self.id,
+                'status': self.status,
+                'options': self.options,
+                'created_at': self.created_at,
+                'started_at': self.started_at,
+                'finished_at': self.finished_at,
+                'progress': dict(self.progress),
+                'summary': self.summary,
+                'error': self.error
+            }
+
+
+class DiscoveryService:
+    """Job queue with request deduplication in front of a worker pool"""
+
+    def __init__(self, run: Callable[[dict, Callable[[dict], None]], dict], workers: int = 1):
+        self.run = run
+        self._lock = threading.Lock()
+        self._pool = ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix='discovery-job')
+        self.jobs: Dict[str, DiscoveryJob] = {}
+        self.last_summary: Optional[dict] = None
+        self.last_finished: Optional[str] = None
+
+    def submit(self, options: dict) -> tuple:
+        """Queue a job, or return the active job with the same options; returns (job, deduplicated)"""
+        job = DiscoveryJob(options)
+        with self._lock:
+            for active in self.jobs.values():
+                if active.key == job.key and not active.done:
+                    return active, True
+            self.jobs[job.id] = job
+            self._trim()
+        self._pool.submit(self._execute, job)
+        return job, False
+
+    def _trim(self) -> None:
+        finished = [job_id for job_id, job in self.jobs.items() if job.done]
+        for job_id in finished[:max(0, len(finished) - JOB_HISTORY)]:
+            del self.jobs[job_id]
+
+    def _execute(self, job: DiscoveryJob) -> None:
+        job.transition('running', started_at=_now())
+        print(f"🔍 Discovery job {job.id} started {job.options}", flush=True)
+        try:
+            summary = self.run(job.options, job.publish)
+        except Exception as e:
+            job.transition('failed', error=str(e), finished_at=_now())
+            print(f"❌ Discovery job {job.id} failed: {e}", flush=True)
+            return
+        with self._lock:
+            self.last_summary = summary
+            self.last_finished = _now()
+        job.transition('succeeded', summary=summary, finished_at=self.last_finished)
+        print(f"✅ Discovery job {job.id} finished", flush=True)
+
+    def job(self, job_id: str) -> Optional[DiscoveryJob]:
+        with self._lock:
+            return self.jobs.get(job_id)
+
+    def list_jobs(self) -> List[dict]:
+        with self._lock:
+            jobs = list(self.jobs.values())
+        return [job.to_dict() for job in jobs]
+
+    def stats(self) -> dict:
+        """Totals of the last successful run, in the shape the dashboard's getDiscoveryStats() reads"""
+        with self._lock:
+            summary = self.last_summary or {}
+            return {
+                'totalAssets': sum(summary.get('assets', {}).values()),
+                'totalRelationships': summary.get('writes', {}).get('relationships_created', 0),
+                'securityFindings': sum(summary.get('risks', {}).values()),
+                'lastDiscovery': self.last_finished
+            }
+
+    def shutdown(self) -> None:
+        self._pool.shutdown(wait=False, cancel_futures=True)
+
+
+def parse_options(body: bytes) -> dict:
+    """The JOB_OPTIONS present in a discover request body, coerced to their types"""
+    try:
+        request = json.loads(body or b'{}')
+    except ValueError:
+        raise ValueError("Request body is not valid JSON")
+    if not isinstance(request, dict):
+        raise ValueError("Request body must be a JSON object")
+    return {name: kind(request[name]) for name, kind in JOB_OPTIONS.items() if name in request}
+
+
+class DiscoveryHandler(BaseHTTPRequestHandler):
+    service: DiscoveryService  # set by make_server
+
+    def _cors(self):
+        self.send_header('Access-Control-Allow-Origin', '*')
+
+    def _json(self, status: int, payload) -> None:
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self._cors()
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_OPTIONS(self):
+        self.send_response(204)
+        self._cors()
+        self.send_header('Access-Control-Allow-Methods', 'GET, POST, OPTIONS')
+        self.send_header('Access-Control-Allow-Headers', 'Content-Type')
+        self.end_headers()
+
+    def do_POST(self):
+        if self.path.rstrip('/') != '/discover':
+            self._json(404, {'error': 'Not found'})
+            return
+        try:
+            options = parse_options(self.rfile.read(int(self.headers.get('Content-Length') or 0)))
+        except ValueError as e:
+            self._json(400, {'error': str(e)})
+            return
+        job, deduplicated = self.service.submit(options)
+        self._json(202, {
+            'job_id': job.id,
+            'status': job.status,
+            'deduplicated': deduplicated,
+            'status_url': f"/jobs/{job.id}",
+            'events_url': f"/jobs/{job.id}/events"
+        })
+
+    def do_GET(self):
+        parts = [part for part in self.path.split('?', 1)[0].split('/') if part]
+        if parts == ['jobs']:
+            self._json(200, {'jobs': self.service.list_jobs()})
+        elif parts == ['stats']:
+            self._json(200, self.service.stats())
+        elif len(parts) in (2, 3) and parts[0] == 'jobs' and parts[2:] in ([], ['events']):
+            job = self.service.job(parts[1])
+            if job is None:
+                self._json(404, {'error': f"Unknown job {parts[1]}"})
+            elif len(parts) == 2:
+                self._json(200, job.to_dict())
+            else:
+                self._stream(job)
+        else:
+            self._json(404, {'error': 'Not found'})
+
+    def _stream(self, job: DiscoveryJob) -> None:
+        """Server-sent events: one `event: <type>` message per job event, then close"""
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream')
+        self.send_header('Cache-Control', 'no-cache')
+        self._cors()
+        self.end_headers()
+        position = 0
+        try:
+            for event in job.follow():
+                if event is None:
+                    self.wfile.write(b": keep-alive\n\n")
+                else:
+                    self.wfile.write(f"event: {event['type']}\nid: {position}\n"
+                                     f"data: {json.dumps(event)}\n\n".encode())
+                    position += 1
+                self.wfile.flush()
+        except (BrokenPipeError, ConnectionResetError):
+            pass  # the browser went away; the job carries on
+
+    def log_message(self, format, *args):
+        pass  # progress is reported by the jobs themselves
+
+
+def make_server(service: DiscoveryService, port: int = DISCOVERY_SERVICE_PORT,
+                host: str = '') -> ThreadingHTTPServer:
+    handler = type('BoundDiscoveryHandler', (DiscoveryHandler,), {'service': service})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    return server
+
+
+def serve(run: Callable[[dict, Callable[[dict], None]], dict], workers: int = 1,
+          port: int = DISCOVERY_SERVICE_PORT) -> None:
+    """Run the discovery service until interrupted"""
+    service = DiscoveryService(run, workers)
+    server = make_server(service, port)
+    print(f"🌐 Discovery API server running on port {port} ({workers} worker{'s' if workers != 1 else ''})",
+          flush=True)
+    print("💡 POST /discover to run discovery; follow GET /jobs/<id>/events for progress", flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        service.shutdown()
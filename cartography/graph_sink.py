@@ -0,0 +1,699 @@
+"""
+Graph sinks: where discovery writes its nodes and relationships
+
+Discovery expresses every write as one of a few batch operations (upsert
+nodes, upsert edges, sweep stale ones, set risk flags). Neo4jGraphSink runs
+them as UNWIND statements in managed transactions, optionally keeping
+several batches in flight on the async driver. InMemoryGraph applies them
+to a compact in-process graph (interned labels and relationship types,
+integer node ids, edge arrays with a CSR adjacency view), so the discovery,
+posture and feature code can be profiled and tested without a database.
+
+Every operation returns (first record, summary) where the summary carries
+the same counters as a Neo4j result summary, so callers count and time
+writes the same way for either backend.
+"""
+
+import asyncio
+import threading
+import time
+from array import array
+from concurrent.futures import Future
+from datetime import datetime, timezone
+from typing import Any, Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+import numpy as np
+from neo4j import AsyncGraphDatabase, GraphDatabase
+from neo4j.exceptions import ClientError
+
+# Counters a write summary carries, as on neo4j.SummaryCounters
+SUMMARY_COUNTERS = ('nodes_created', 'nodes_deleted', 'relationships_created', 'relationships_deleted',
+                    'properties_set')
+
+
+class RiskRule(NamedTuple):
+    """Flag every `label` node whose properties match, with a risk level and reason
+
+    Conditions map a property to a value, or to a tuple of accepted values.
+    A node matches when all `all_of` conditions hold and, if `any_of` is
+    given, at least one of those does.
+    """
+    label: str
+    level: str
+    reason: str
+    all_of: Dict[str, Any] = {}
+    any_of: Dict[str, Any] = {}
+
+
+def build_ingest_query(spec) -> str:
+    """Build the UNWIND statement that writes one chunk of rows for a resource type
+
+    Every row refreshes the node's update_tag so the stale sweep can tell it
+    was seen, and re-links the node to its parent, which a sweep may have
+    removed and a later run brought back. Parents are matched, never
+    created: a parent missing from the graph leaves the row dangling rather
+    than adding a placeholder node that no row of its own keeps current. The
+    property map is only written when the row's content_hash differs from the
+    one stored on the node. Returns the number of new or changed rows and of
+    rows whose parent was not found.
+    """
+    query = f"""
+        UNWIND $rows AS row
+        MERGE (n:{spec.label} {{{spec.key}: row.props.{spec.key}}})
+        ON CREATE SET n.discovered_via_cartography = true,
+                      n.discovery_time = datetime()
+        SET n.update_tag = $update_tag
+    """
+    if spec.parent:
+        parent = spec.parent
+        query += f"""
+        WITH n, row
+        OPTIONAL MATCH (parent:{parent.label} {{{parent.key}: row.parent_id}})
+        FOREACH (_ IN CASE WHEN parent IS NULL THEN [] ELSE [1] END |
+            MERGE (parent)-[:{parent.relationship}]->(n))
+        WITH n, row, parent IS NULL AND coalesce(row.parent_id, '') <> '' AS dangling
+    """
+    else:
+        query += """
+        WITH n, row, false AS dangling
+    """
+    return query + """
+        WITH n, row, dangling, n.content_hash IS NULL OR n.content_hash <> row.content_hash AS changed
+        FOREACH (_ IN CASE WHEN changed THEN [1] ELSE [] END |
+            SET n += row.props,
+                n.content_hash = row.content_hash,
+                n.cartography_lastupdated = datetime())
+        RETURN count(CASE WHEN changed THEN 1 END) AS changed,
+               count(CASE WHEN dangling THEN 1 END) AS dangling
+    """
+
+
+def build_schema_statements(specs: Iterable) -> List[tuple]:
+    """Uniqueness constraints on every identity key plus the lookup indexes discovery relies on
+
+    Returns (statement, fallback) pairs; the fallback is a plain index on the
+    same key for graphs whose existing duplicates prevent the constraint.
+    """
+    statements = []
+    for spec in specs:
+        name = spec.label.lower()
+        statements.append((
+            f"CREATE CONSTRAINT {name}_{spec.key}_unique IF NOT EXISTS "
+            f"FOR (n:{spec.label}) REQUIRE n.{spec.key} IS UNIQUE",
+            f"CREATE INDEX {name}_{spec.key} IF NOT EXISTS FOR (n:{spec.label}) ON (n.{spec.key})"
+        ))
+        # The stale sweep filters every label on update_tag
+        statements.append((
+            f"CREATE INDEX {name}_update_tag IF NOT EXISTS FOR (n:{spec.label}) ON (n.update_tag)",
+            None
+        ))
+    return statements
+
+
+def build_relationship_query(source, target, relationship: str) -> str:
+    """Build the UNWIND statement that writes one chunk of [source key, target key] edges
+
+    Every edge of the chunk gets the same $properties map.
+    """
+    return f"""
+        UNWIND $edges AS edge
+        MATCH (a:{source.label} {{{source.key}: edge[0]}})
+        MATCH (b:{target.label} {{{target.key}: edge[1]}})
+        MERGE (a)-[r:{relationship}]->(b)
+        ON CREATE SET r.discovered_via_cartography = true,
+                      r.discovery_time = datetime()
+        SET r += $properties,
+            r.update_tag = $update_tag
+        RETURN count(r) AS written
+    """
+
+
+def build_relationship_sweep_query(source, target, relationship: str) -> str:
+    """Build the statement that deletes one batch of derived edges the current run did not see"""
+    return f"""
+        MATCH (:{source.label})-[r:{relationship}]->(:{target.label})
+        WHERE r.update_tag < $update_tag
+        WITH r LIMIT $limit
+        DELETE r
+        RETURN count(*) AS deleted
+    """
+
+
+def build_sweep_query(spec) -> str:
+    """Build the statement that deletes one batch of nodes the current run did not see"""
+    return f"""
+        MATCH (n:{spec.label})
+        WHERE n.update_tag < $update_tag
+        WITH n LIMIT $limit
+        DETACH DELETE n
+        RETURN count(*) AS deleted
+    """
+
+
+def build_flag_update_query(label: str, key: str) -> str:
+    """Build the UNWIND statement that writes one chunk of precomputed risk flag rows"""
+    return f"""
+        UNWIND $rows AS row
+        MATCH (n:{label} {{{key}: row.{key}}})
+        SET n += row,
+            n.risk_analysis_time = datetime()
+        RETURN count(n) AS updated
+    """
+
+
+def build_rule_query(rule: RiskRule) -> Tuple[str, dict]:
+    """Build the statement (and its parameters) that flags every node matching a RiskRule"""
+    parameters = {'level': rule.level, 'reason': rule.reason}
+
+    def conditions(values: Dict[str, Any], prefix: str) -> List[str]:
+        clauses = []
+        for position, (field, value) in enumerate(values.items()):
+            name = f"{prefix}{position}"
+            parameters[name] = list(value) if isinstance(value, tuple) else value
+            clauses.append(f"n.{field} {'IN' if isinstance(value, tuple) else '='} ${name}")
+        return clauses
+
+    where = conditions(rule.all_of, 'all')
+    alternatives = conditions(rule.any_of, 'any')
+    if alternatives:
+        where.append("(" + " OR ".join(alternatives) + ")")
+    return f"""
+        MATCH (n:{rule.label})
+        {"WHERE " + " AND ".join(where) if where else ""}
+        SET n.security_risk = $level,
+            n.risk_reason = $reason,
+            n.risk_analysis_time = datetime()
+        RETURN count(n) AS flagged
+    """, parameters
+
+
+def run_write(tx, query: str, parameters: dict) -> tuple:
+    """Managed transaction function: run one statement, returning (first record, result summary)"""
+    result = tx.run(query, parameters)
+    record = result.single()
+    return (dict(record) if record else {}), result.consume()
+
+
+async def run_write_async(tx, query: str, parameters: dict) -> tuple:
+    """run_write for the async driver"""
+    result = await tx.run(query, parameters)
+    record = await result.single()
+    return (dict(record) if record else {}), await result.consume()
+
+
+class GraphSink:
+    """Batch write operations discovery needs from a graph backend
+
+    Batch operations take the chunk of rows or edges as their last argument
+    and return (record, summary). submit() runs one of them and returns a
+    Future resolving to (record, summary, seconds); backends that can keep
+    several batches in flight set `pipelined` and return before the write
+    finishes.
+    """
+
+    pipelined = False
+
+    def ensure_schema(self, specs: Iterable) -> None:
+        raise NotImplementedError
+
+    def write_nodes(self, spec, update_tag: int, rows: List[dict]) -> tuple:
+        raise NotImplementedError
+
+    def write_relationships(self, source, target, relationship: str, properties: dict, update_tag: int,
+                            edges: List[list]) -> tuple:
+        raise NotImplementedError
+
+    def sweep_nodes(self, spec, update_tag: int, limit: int) -> tuple:
+        raise NotImplementedError
+
+    def sweep_relationships(self, source, target, relationship: str, update_tag: int, limit: int) -> tuple:
+        raise NotImplementedError
+
+    def update_flags(self, label: str, key: str, rows: List[dict]) -> tuple:
+        raise NotImplementedError
+
+    def flag_matching(self, rule: RiskRule) -> tuple:
+        raise NotImplementedError
+
+    def submit(self, operation: str, *args) -> Future:
+        future = Future()
+        started = time.monotonic()
+        try:
+            record, summary = getattr(self, operation)(*args)
+            future.set_result((record, summary, time.monotonic() - started))
+        except Exception as e:
+            future.set_exception(e)
+        return future
+
+    def close(self) -> None:
+        pass
+
+
+class AsyncBatchWriter:
+    """Runs write batches on the async driver from a background event loop
+
+    `in_flight` worker tasks, each with its own session, take batches from a
+    queue holding at most `in_flight` more. Discovery threads keep reading
+    and preparing rows while earlier batches are written; once the queue is
+    full, submit() blocks, so a slow database holds back the readers instead
+    of letting prepared batches pile up in memory.
+    """
+
+    def __init__(self, in_flight: int, uri: str, auth: tuple, retry_seconds: float):
+        self.in_flight = in_flight
+        self.loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self.loop.run_forever, name='discovery-writes', daemon=True)
+        self._thread.start()
+        self._call(self._start(uri, auth, retry_seconds))
+
+    def _call(self, coroutine):
+        return asyncio.run_coroutine_threadsafe(coroutine, self.loop).result()
+
+    async def _start(self, uri: str, auth: tuple, retry_seconds: float):
+        self.driver = AsyncGraphDatabase.driver(uri, auth=auth, max_transaction_retry_time=retry_seconds)
+        self.queue = asyncio.Queue(maxsize=self.in_flight)
+        self.workers = [asyncio.ensure_future(self._work()) for _ in range(self.in_flight)]
+
+    async def _work(self):
+        async with self.driver.session() as session:
+            while True:
+                batch = await self.queue.get()
+                if batch is None:
+                    return
+                query, parameters, future = batch
+                if not future.set_running_or_notify_cancel():
+                    continue
+                started = time.monotonic()
+                try:
+                    record, summary = await session.execute_write(run_write_async, query, parameters)
+                    future.set_result((record, summary, time.monotonic() - started))
+                except BaseException as e:
+                    future.set_exception(e)
+
+    def submit(self, query: str, parameters: dict) -> Future:
+        """Queue one batch, blocking while the queue is full; resolves to (record, summary, seconds)"""
+        future = Future()
+        self._call(self.queue.put((query, parameters, future)))
+        return future
+
+    async def _stop(self):
+        for _ in self.workers:
+            await self.queue.put(None)
+        await asyncio.gather(*self.workers, return_exceptions=True)
+        await self.driver.close()
+
+    def close(self):
+        self._call(self._stop())
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self._thread.join()
+        self.loop.close()
+
+
+class Neo4jGraphSink(GraphSink):
+    """Writes through the Neo4j driver, one managed transaction per batch
+
+    The driver retries a transaction on transient errors, lost connections
+    and leader changes, backing off for up to `retry_seconds`. With
+    `async_writes` > 0, submitted batches go through an AsyncBatchWriter.
+    """
+
+    def __init__(self, uri: str, auth: tuple, retry_seconds: float = 30.0, async_writes: int = 0):
+        self.driver = GraphDatabase.driver(uri, auth=auth, max_transaction_retry_time=retry_seconds)
+        self.async_writer = AsyncBatchWriter(async_writes, uri, auth, retry_seconds) if async_writes > 0 else None
+        self.pipelined = self.async_writer is not None
+        self._queries: Dict[tuple, str] = {}
+
+    def _query(self, build, *args) -> str:
+        key = (build.__name__, *args)
+        if key not in self._queries:
+            self._queries[key] = build(*args)
+        return self._queries[key]
+
+    def _write(self, query: str, parameters: dict) -> tuple:
+        with self.driver.session() as session:
+            return session.execute_write(run_write, query, parameters)
+
+    def statement(self, operation: str, *args) -> Tuple[str, dict]:
+        """The (query, parameters) pair a batch operation runs"""
+        if operation == 'write_nodes':
+            spec, update_tag, rows = args
+            return self._query(build_ingest_query, spec), {'rows': rows, 'update_tag': update_tag}
+        if operation == 'write_relationships':
+            source, target, relationship, properties, update_tag, edges = args
+            return (self._query(build_relationship_query, source, target, relationship),
+                    {'edges': edges, 'properties': properties, 'update_tag': update_tag})
+        if operation == 'sweep_nodes':
+            spec, update_tag, limit = args
+            return self._query(build_sweep_query, spec), {'update_tag': update_tag, 'limit': limit}
+        if operation == 'sweep_relationships':
+            source, target, relationship, update_tag, limit = args
+            return (self._query(build_relationship_sweep_query, source, target, relationship),
+                    {'update_tag': update_tag, 'limit': limit})
+        if operation == 'update_flags':
+            label, key, rows = args
+            return self._query(build_flag_update_query, label, key), {'rows': rows}
+        if operation == 'flag_matching':
+            return build_rule_query(*args)
+        raise ValueError(f"Unknown graph operation {operation!r}")
+
+    def ensure_schema(self, specs: Iterable) -> None:
+        with self.driver.session() as session:
+            for statement, fallback in build_schema_statements(specs):
+                try:
+                    session.run(statement).consume()
+                except ClientError as e:
+                    if not fallback:
+                        raise
+                    # Usually duplicates left by older runs; an index still serves MERGE
+                    print(f"   ⚠️ {e.message.splitlines()[0] if e.message else e}; using a plain index instead",
+                          flush=True)
+                    session.run(fallback).consume()
+
+    def write_nodes(self, spec, update_tag: int, rows: List[dict]) -> tuple:
+        return self._write(*self.statement('write_nodes', spec, update_tag, rows))
+
+    def write_relationships(self, source, target, relationship: str, properties: dict, update_tag: int,
+                            edges: List[list]) -> tuple:
+        return self._write(*self.statement('write_relationships', source, target, relationship, properties,
+                                           update_tag, edges))
+
+    def sweep_nodes(self, spec, update_tag: int, limit: int) -> tuple:
+        return self._write(*self.statement('sweep_nodes', spec, update_tag, limit))
+
+    def sweep_relationships(self, source, target, relationship: str, update_tag: int, limit: int) -> tuple:
+        return self._write(*self.statement('sweep_relationships', source, target, relationship, update_tag, limit))
+
+    def update_flags(self, label: str, key: str, rows: List[dict]) -> tuple:
+        return self._write(*self.statement('update_flags', label, key, rows))
+
+    def flag_matching(self, rule: RiskRule) -> tuple:
+        return self._write(*self.statement('flag_matching', rule))
+
+    def submit(self, operation: str, *args) -> Future:
+        if self.async_writer is None:
+            return super().submit(operation, *args)
+        return self.async_writer.submit(*self.statement(operation, *args))
+
+    def close(self) -> None:
+        if self.async_writer:
+            self.async_writer.close()
+        self.driver.close()
+
+
+class WriteCounters:
+    """SUMMARY_COUNTERS of one in-memory operation"""
+
+    def __init__(self):
+        for name in SUMMARY_COUNTERS:
+            setattr(self, name, 0)
+
+
+class WriteSummary:
+    """Stands in for a neo4j ResultSummary; in-memory writes have no server time"""
+
+    def __init__(self):
+        self.counters = WriteCounters()
+        self.result_available_after = 0
+        self.result_consumed_after = 0
+
+
+class InMemoryGraph(GraphSink):
+    """Compact in-process property graph implementing the sink operations
+
+    Labels and relationship types are interned to small ints. Nodes are
+    integer ids indexing a label array and a list of property dicts; each
+    node has one label. Edges are parallel source / target / type arrays
+    with a property dict each. Deleted nodes and edges leave a None in their
+    property slot, so ids stay stable. adjacency() gives the live edges
+    in CSR form for traversals.
+
+    Writes take a lock, so concurrent discovery phases can share one graph.
+    """
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._labels: List[str] = []
+        self._label_ids: Dict[str, int] = {}
+        self._types: List[str] = []
+        self._type_ids: Dict[str, int] = {}
+        self._node_label = array('q')
+        self._node_props: List[Optional[dict]] = []
+        self._node_index: Dict[tuple, int] = {}  # (label id, key property, value) -> node id
+        self._node_keys: List[Optional[tuple]] = []  # node id -> its _node_index key
+        self._edge_source = array('q')
+        self._edge_target = array('q')
+        self._edge_type = array('q')
+        self._edge_props: List[Optional[dict]] = []
+        self._edge_index: Dict[tuple, int] = {}  # (source, type id, target) -> edge id
+        self._csr = None
+
+    # Interning and plain reads
+
+    def _intern(self, names: List[str], ids: Dict[str, int], name: str) -> int:
+        if name not in ids:
+            ids[name] = len(names)
+            names.append(name)
+        return ids[name]
+
+    def label_id(self, label: str) -> Optional[int]:
+        return self._label_ids.get(label)
+
+    def type_id(self, relationship: str) -> Optional[int]:
+        return self._type_ids.get(relationship)
+
+    def label_name(self, label_id: int) -> str:
+        return self._labels[label_id]
+
+    def type_name(self, type_id: int) -> str:
+        return self._types[type_id]
+
+    @property
+    def node_count(self) -> int:
+        """Node ids issued so far, including deleted ones"""
+        return len(self._node_props)
+
+    def node_labels(self) -> np.ndarray:
+        """Label id per node id (-1 for deleted nodes)"""
+        with self._lock:
+            labels = np.frombuffer(self._node_label, dtype=np.int64).copy() if self._node_label else \
+                np.empty(0, dtype=np.int64)
+            alive = np.fromiter((props is not None for props in self._node_props), dtype=bool,
+                                count=len(self._node_props))
+        labels[~alive] = -1
+        return labels
+
+    def nodes(self, label: str) -> np.ndarray:
+        """Ids of the live nodes with `label`"""
+        label_id = self.label_id(label)
+        if label_id is None:
+            return np.empty(0, dtype=np.int64)
+        return np.flatnonzero(self.node_labels() == label_id)
+
+    def node(self, node_id: int) -> Optional[dict]:
+        return self._node_props[node_id]
+
+    def find(self, label: str, key: str, value) -> Optional[int]:
+        label_id = self.label_id(label)
+        return None if label_id is None else self._node_index.get((label_id, key, value))
+
+    def relationship(self, edge_id: int) -> Optional[dict]:
+        return self._edge_props[edge_id]
+
+    def adjacency(self) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+        """Live outgoing edges in CSR form: (indptr, targets, type ids, edge ids)
+
+        Edges of node n are targets[indptr[n]:indptr[n + 1]]. The arrays are
+        rebuilt only after edges change.
+        """
+        with self._lock:
+            if self._csr is None:
+                count = len(self._edge_props)
+                sources = np.frombuffer(self._edge_source, dtype=np.int64) if count else np.empty(0, np.int64)
+                targets = np.frombuffer(self._edge_target, dtype=np.int64) if count else np.empty(0, np.int64)
+                types = np.frombuffer(self._edge_type, dtype=np.int64) if count else np.empty(0, np.int64)
+                alive = np.fromiter((props is not None for props in self._edge_props), dtype=bool, count=count)
+                edge_ids = np.flatnonzero(alive)
+                order = edge_ids[np.argsort(sources[edge_ids], kind='stable')]
+                indptr = np.zeros(self.node_count + 1, dtype=np.int64)
+                np.cumsum(np.bincount(sources[order], minlength=self.node_count), out=indptr[1:])
+                self._csr = (indptr, targets[order].copy(), types[order].astype(np.int32), order)
+            return self._csr
+
+    # Building blocks, also used to load test graphs directly
+
+    def merge_node(self, label: str, key: str, value, summary: Optional[WriteSummary] = None) -> Tuple[int, dict]:
+        """Find or create the `label` node whose `key` is `value`; returns (id, properties)"""
+        with self._lock:
+            label_id = self._intern(self._labels, self._label_ids, label)
+            index_key = (label_id, key, value)
+            node_id = self._node_index.get(index_key)
+            if node_id is not None:
+                return node_id, self._node_props[node_id]
+            node_id = len(self._node_props)
+            props = {key: value}
+            self._node_label.append(label_id)
+            self._node_props.append(props)
+            self._node_keys.append(index_key)
+            self._node_index[index_key] = node_id
+            if summary:
+                summary.counters.nodes_created += 1
+                summary.counters.properties_set += 1
+            return node_id, props
+
+    def merge_relationship(self, source: int, target: int, relationship: str,
+                           summary: Optional[WriteSummary] = None) -> Tuple[int, dict]:
+        """Find or create the `relationship` edge from source to target; returns (id, properties)"""
+        with self._lock:
+            type_id = self._intern(self._types, self._type_ids, relationship)
+            index_key = (source, type_id, target)
+            edge_id = self._edge_index.get(index_key)
+            if edge_id is not None:
+                return edge_id, self._edge_props[edge_id]
+            edge_id = len(self._edge_props)
+            props = {}
+            self._edge_source.append(source)
+            self._edge_target.append(target)
+            self._edge_type.append(type_id)
+            self._edge_props.append(props)
+            self._edge_index[index_key] = edge_id
+            self._csr = None
+            if summary:
+                summary.counters.relationships_created += 1
+            return edge_id, props
+
+    def _delete_edge(self, edge_id: int) -> None:
+        key = (self._edge_source[edge_id], self._edge_type[edge_id], self._edge_target[edge_id])
+        del self._edge_index[key]
+        self._edge_props[edge_id] = None
+        self._csr = None
+
+    def _delete_nodes(self, node_ids: List[int], summary: WriteSummary) -> None:
+        """DETACH DELETE: drop the nodes and every edge touching them"""
+        doomed = set(node_ids)
+        for edge_id, props in enumerate(self._edge_props):
+            if props is not None and (self._edge_source[edge_id] in doomed or self._edge_target[edge_id] in doomed):
+                self._delete_edge(edge_id)
+                summary.counters.relationships_deleted += 1
+        for node_id in node_ids:
+            del self._node_index[self._node_keys[node_id]]
+            self._node_props[node_id] = None
+            self._node_keys[node_id] = None
+            summary.counters.nodes_deleted += 1
+
+    @staticmethod
+    def _is_stale(props: dict, update_tag: int) -> bool:
+        """update_tag < $update_tag as Cypher evaluates it: never true for an untagged node or edge"""
+        tag = props.get('update_tag')
+        return tag is not None and tag < update_tag
+
+    @staticmethod
+    def _set(props: dict, values: dict, summary: WriteSummary) -> None:
+        props.update(values)
+        summary.counters.properties_set += len(values)
+
+    # GraphSink operations
+
+    def ensure_schema(self, specs: Iterable) -> None:
+        pass  # every MERGE goes through the key index already
+
+    def write_nodes(self, spec, update_tag: int, rows: List[dict]) -> tuple:
+        summary = WriteSummary()
+        now = datetime.now(timezone.utc)
+        changed = dangling = 0
+        with self._lock:
+            for row in rows:
+                created = summary.counters.nodes_created
+                node_id, props = self.merge_node(spec.label, spec.key, row['props'][spec.key], summary)
+                if summary.counters.nodes_created > created:
+                    self._set(props, {'discovered_via_cartography': True, 'discovery_time': now}, summary)
+                self._set(props, {'update_tag': update_tag}, summary)
+                if spec.parent and row.get('parent_id'):
+                    parent_id = self.find(spec.parent.label, spec.parent.key, row['parent_id'])
+                    if parent_id is None:
+                        dangling += 1
+                    else:
+                        self.merge_relationship(parent_id, node_id, spec.parent.relationship, summary)
+                if props.get('content_hash') == row['content_hash']:
+                    continue
+                changed += 1
+                self._set(props, dict(row['props'], content_hash=row['content_hash'],
+                                      cartography_lastupdated=now), summary)
+        return {'changed': changed, 'dangling': dangling}, summary
+
+    def write_relationships(self, source, target, relationship: str, properties: dict, update_tag: int,
+                            edges: List[list]) -> tuple:
+        summary = WriteSummary()
+        now = datetime.now(timezone.utc)
+        written = 0
+        with self._lock:
+            for source_key, target_key in edges:
+                a = self.find(source.label, source.key, source_key)
+                b = self.find(target.label, target.key, target_key)
+                if a is None or b is None:
+                    continue
+                created = summary.counters.relationships_created
+                _, props = self.merge_relationship(a, b, relationship, summary)
+                if summary.counters.relationships_created > created:
+                    self._set(props, {'discovered_via_cartography': True, 'discovery_time': now}, summary)
+                self._set(props, dict(properties, update_tag=update_tag), summary)
+                written += 1
+        return {'written': written}, summary
+
+    def sweep_nodes(self, spec, update_tag: int, limit: int) -> tuple:
+        summary = WriteSummary()
+        with self._lock:
+            stale = [int(node_id) for node_id in self.nodes(spec.label)
+                     if self._is_stale(self._node_props[node_id], update_tag)][:limit]
+            self._delete_nodes(stale, summary)
+        return {'deleted': len(stale)}, summary
+
+    def sweep_relationships(self, source, target, relationship: str, update_tag: int, limit: int) -> tuple:
+        summary = WriteSummary()
+        type_id = self.type_id(relationship)
+        deleted = 0
+        with self._lock:
+            source_label, target_label = self.label_id(source.label), self.label_id(target.label)
+            for edge_id, props in enumerate(self._edge_props):
+                if deleted == limit:
+                    break
+                if (props is not None and self._edge_type[edge_id] == type_id
+                        and self._node_label[self._edge_source[edge_id]] == source_label
+                        and self._node_label[self._edge_target[edge_id]] == target_label
+                        and self._is_stale(props, update_tag)):
+                    self._delete_edge(edge_id)
+                    summary.counters.relationships_deleted += 1
+                    deleted += 1
+        return {'deleted': deleted}, summary
+
+    def update_flags(self, label: str, key: str, rows: List[dict]) -> tuple:
+        summary = WriteSummary()
+        now = datetime.now(timezone.utc)
+        updated = 0
+        with self._lock:
+            for row in rows:
+                node_id = self.find(label, key, row[key])
+                if node_id is None:
+                    continue
+                self._set(self._node_props[node_id], dict(row, risk_analysis_time=now), summary)
+                updated += 1
+        return {'updated': updated}, summary
+
+    def flag_matching(self, rule: RiskRule) -> tuple:
+        summary = WriteSummary()
+        now = datetime.now(timezone.utc)
+
+        def holds(props: dict, field: str, value) -> bool:
+            return props.get(field) in value if isinstance(value, tuple) else props.get(field) == value
+
+        flagged = 0
+        with self._lock:
+            for node_id in self.nodes(rule.label):
+                props = self._node_props[node_id]
+                if not all(holds(props, field, value) for field, value in rule.all_of.items()):
+                    continue
+                if rule.any_of and not any(holds(props, field, value) for field, value in rule.any_of.items()):
+                    continue
+                self._set(props, {'security_risk': rule.level, 'risk_reason': rule.reason,
+                                  'risk_analysis_time': now}, summary)
+                flagged += 1
+        return {'flagged': flagged}, summary
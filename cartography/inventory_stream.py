@@ -0,0 +1,186 @@
+"""
+Incremental JSON reader for cloud inventory exports
+
+Inventory files are a single JSON object whose values are arrays of
+resources ({"iam_users": [...], "vpcs": [...], ...}). Real exports run to
+several gigabytes, so instead of json.load we walk the top-level object
+and decode one array element at a time. Arrays that are not requested are
+skipped with a bracket-matching scan that never builds Python objects.
+"""
+
+import json
+import re
+from typing import Any, Iterator, TextIO
+
+READ_SIZE = 1 << 20  # 1 MiB of text per read
+
+_WHITESPACE = re.compile(r"[ \t\n\r]*")
+# Characters that matter while skipping a value, outside and inside strings
+_STRUCTURAL = re.compile(r'[\[\]{}"]')
+_STRING_SPECIAL = re.compile(r'["\\]')
+# What may still follow a number that was cut at the end of the buffer
+_NUMBER_TAIL = re.compile(r"[0-9.eE+\-]*")
+
+_decoder = json.JSONDecoder()
+
+
+class _StreamReader:
+    """Sliding text buffer over a file with just enough JSON tokenizing for streaming"""
+
+    def __init__(self, fp: TextIO, read_size: int = READ_SIZE):
+        self.fp = fp
+        self.read_size = read_size
+        self.buffer = ""
+        self.pos = 0
+        self.dropped = 0  # characters discarded from the front of the buffer
+        self.eof = False
+
+    @property
+    def offset(self) -> int:
+        """Absolute character offset of the read position in the file"""
+        return self.dropped + self.pos
+
+    def fill(self) -> bool:
+        """Drop consumed text and append the next block; False once the file is exhausted"""
+        if self.eof:
+            return False
+        data = self.fp.read(self.read_size)
+        if not data:
+            self.eof = True
+            return False
+        self.buffer = self.buffer[self.pos:] + data
+        self.dropped += self.pos
+        self.pos = 0
+        return True
+
+    def peek(self) -> str:
+        """Return the next non-whitespace character without consuming it ('' at EOF)"""
+        while True:
+            self.pos = _WHITESPACE.match(self.buffer, self.pos).end()
+            if self.pos < len(self.buffer):
+                return self.buffer[self.pos]
+            if not self.fill():
+                return ""
+
+    def expect(self, char: str) -> None:
+        found = self.peek()
+        if found != char:
+            raise ValueError(f"Malformed inventory: expected {char!r} but found {found or 'end of file'!r}")
+        self.pos += 1
+
+    def decode(self) -> Any:
+        """Decode the next complete JSON value, reading more text until it fits"""
+        self.peek()
+        while True:
+            try:
+                value, end = _decoder.raw_decode(self.buffer, self.pos)
+            except json.JSONDecodeError:
+                if self.fill():
+                    continue
+                raise
+            # A number cut at the buffer edge decodes as a shorter number; read on and retry
+            if (isinstance(value, (int, float)) and _NUMBER_TAIL.fullmatch(self.buffer, end)
+                    and self.fill()):
+                continue
+            self.pos = end
+            return value
+
+    def skip(self) -> None:
+        """Consume the next JSON value without decoding it"""
+        if self.peek() not in "[{":
+            self.decode()
+            return
+        depth = 0
+        in_string = False
+        while True:
+            if in_string:
+                match = _STRING_SPECIAL.search(self.buffer, self.pos)
+                if match is None:
+                    self.pos = len(self.buffer)
+                elif match.group() == "\\":
+                    # Escapes are two characters; make sure the second one is loaded
+                    if match.end() == len(self.buffer):
+                        self.pos = match.start()
+                        if not self.fill():
+                            raise ValueError("Malformed inventory: truncated string escape")
+                        continue
+                    self.pos = match.end() + 1
+                    continue
+                else:
+                    in_string = False
+                    self.pos = match.end()
+                    continue
+            else:
+                match = _STRUCTURAL.search(self.buffer, self.pos)
+                if match is None:
+                    self.pos = len(self.buffer)
+                else:
+                    self.pos = match.end()
+                    char = match.group()
+                    if char == '"':
+                        in_string = True
+                    elif char in "[{":
+                        depth += 1
+                    else:
+                        depth -= 1
+                        if depth == 0:
+                            return
+                    continue
+            if not self.fill():
+                raise ValueError("Malformed inventory: unexpected end of file")
+
+
+def iter_sections(fp: TextIO, read_size: int = READ_SIZE) -> Iterator[tuple]:
+    """Yield (key, reader) for each top-level member; the caller must consume or skip the value"""
+    reader = _StreamReader(fp, read_size)
+    reader.expect("{")
+    if reader.peek() == "}":
+        return
+    while True:
+        key = reader.decode()
+        reader.expect(":")
+        reader.peek()
+        start = reader.offset
+        yield key, reader
+        if reader.offset == start:
+            reader.skip()
+        separator = reader.peek()
+        reader.pos += 1
+        if separator == "}":
+            return
+        if separator != ",":
+            raise ValueError(f"Malformed inventory: unexpected {separator or 'end of file'!r} after {key!r}")
+
+
+def iter_array_items(reader: _StreamReader) -> Iterator[Any]:
+    """Decode the elements of the array at the reader position one at a time"""
+    if reader.peek() == "n":  # "kind": null
+        reader.decode()
+        return
+    reader.expect("[")
+    if reader.peek() == "]":
+        reader.pos += 1
+        return
+    while True:
+        yield reader.decode()
+        separator = reader.peek()
+        reader.pos += 1
+        if separator == "]":
+            return
+        if separator != ",":
+            raise ValueError(f"Malformed inventory: unexpected {separator or 'end of file'!r} in array")
+
+
+def stream_resources(path: str, kind: str, read_size: int = READ_SIZE) -> Iterator[dict]:
+    """Yield each record of the top-level `kind` array in an inventory file
+
+    Only one record is held in memory at a time; every other section of the
+    file is skipped without being decoded.
+    """
+    with open(path, "r", encoding="utf-8") as fp:
+        for key, reader in iter_sections(fp, read_size):
+            if key != kind:
+                continue
+            yield from iter_array_items(reader)
+            return
+
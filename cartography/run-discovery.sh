@@ -48,49 +48,7 @@ echo ""
 # Keep container running for manual discovery triggers
 echo "🔄 Discovery service ready for manual triggers..."
 echo "💡 POST to http://localhost:8080/discover to run discovery again"
+echo "📡 Follow progress at http://localhost:8080/jobs/<id>/events"
 
-# Simple HTTP server for manual discovery triggers
-python3 -c "
-import http.server
-import socketserver
-import subprocess
-import json
-from urllib.parse import urlparse, parse_qs
-
-class DiscoveryHandler(http.server.SimpleHTTPRequestHandler):
-    def do_POST(self):
-        if self.path == '/discover':
-            self.send_response(200)
-            self.send_header('Content-type', 'application/json')
-            self.send_header('Access-Control-Allow-Origin', '*')
-            self.end_headers()
-            
-            # Run discovery simulation
-            print('🔍 Manual discovery triggered...')
-            result = subprocess.run(['python3', '/opt/cartography/simulate-discovery.py'], 
-                                 capture_output=True, text=True)
-            
-            response = {
-                'status': 'success' if result.returncode == 0 else 'error',
-                'message': 'Discovery completed' if result.returncode == 0 else 'Discovery failed',
-                'output': result.stdout,
-                'error': result.stderr if result.returncode != 0 else None
-            }
-            
-            self.wfile.write(json.dumps(response).encode())
-        else:
-            self.send_response(404)
-            self.end_headers()
-    
-    def do_OPTIONS(self):
-        self.send_response(200)
-        self.send_header('Access-Control-Allow-Origin', '*')
-        self.send_header('Access-Control-Allow-Methods', 'POST, OPTIONS')
-        self.send_header('Access-Control-Allow-Headers', 'Content-Type')
-        self.end_headers()
-
-PORT = 8080
-with socketserver.TCPServer(('', PORT), DiscoveryHandler) as httpd:
-    print(f'🌐 Discovery API server running on port {PORT}')
-    httpd.serve_forever()
-"
\ No newline at end of file
+# Job service: deduplicates concurrent requests and streams per-phase progress
+exec python3 /opt/cartography/simulate-discovery.py --serve --port 8080
@@ -0,0 +1,141 @@
+"""
+Structured security group rules and vectorized exposure checks
+
+Ingress rules arrive in several shapes (EC2 API exports with port ranges and
+CIDR lists, or the flattened one-entry-per-source form). They are parsed once
+at ingest into (protocol, from_port, to_port, source) records and stored on
+the SecurityGroup node as parallel list properties. Posture analysis loads
+every rule into flat numpy columns and derives the exposure flags for all
+groups in a single pass, so no check depends on how the rules were spelled.
+"""
+
+import json
+from typing import Dict, Iterable, List, NamedTuple
+
+import numpy as np
+
+ALL_PORTS = (0, 65535)
+INTERNET_SOURCES = frozenset(("0.0.0.0/0", "::/0"))
+# SSH, RDP and WinRM
+ADMIN_PORTS = (22, 3389, 5985, 5986)
+
+# IANA protocol numbers used by the EC2 API in place of names
+_PROTOCOL_NAMES = {"-1": "all", "6": "tcp", "17": "udp", "1": "icmp", "58": "icmpv6"}
+
+
+class IngressRule(NamedTuple):
+    protocol: str  # tcp, udp, icmp, ... or all
+    from_port: int
+    to_port: int
+    source: str  # a CIDR block or a security group id
+
+
+def _protocol(value) -> str:
+    name = str(value if value is not None else "-1").lower()
+    return _PROTOCOL_NAMES.get(name, name)
+
+
+def _port_range(rule: dict, protocol: str) -> tuple:
+    low = rule.get("from_port", rule.get("port"))
+    high = rule.get("to_port", low)
+    if protocol == "all" or low is None or low == -1:
+        return ALL_PORTS
+    return int(low), int(high if high not in (None, -1) else low)
+
+
+def _sources(rule: dict) -> List[str]:
+    sources = list(rule.get("cidr_blocks") or []) + list(rule.get("ipv6_cidr_blocks") or [])
+    sources += [r["cidr_ip"] for r in rule.get("ip_ranges") or [] if r.get("cidr_ip")]
+    sources += [p["group_id"] for p in rule.get("user_id_group_pairs") or [] if p.get("group_id")]
+    for field in ("source_security_group_id", "source"):
+        if rule.get(field):
+            sources.append(rule[field])
+    return sources
+
+
+def parse_ingress_rules(rules) -> List[IngressRule]:
+    """One IngressRule per (rule, source), from a rule list or its JSON encoding"""
+    if isinstance(rules, str):
+        rules = json.loads(rules) if rules.strip() else []
+    parsed = []
+    for rule in rules or []:
+        protocol = _protocol(rule.get("ip_protocol", rule.get("protocol")))
+        from_port, to_port = _port_range(rule, protocol)
+        for source in _sources(rule):
+            parsed.append(IngressRule(protocol, from_port, to_port, source.strip()))
+    return parsed
+
+
+def rule_columns(rules: Iterable) -> Dict[str, list]:
+    """SecurityGroup node properties holding the rules as parallel lists
+
+    Accepts IngressRule records or plain (protocol, from_port, to_port, source)
+    tuples; Neo4j properties cannot hold maps, so each field is its own list.
+    """
+    rules = [IngressRule(*rule) for rule in rules]
+    return {
+        "ingress_protocols": [rule.protocol for rule in rules],
+        "ingress_from_ports": [rule.from_port for rule in rules],
+        "ingress_to_ports": [rule.to_port for rule in rules],
+        "ingress_sources": [rule.source for rule in rules],
+    }
+
+
+class ExposureFlags(NamedTuple):
+    """Per-group results of evaluate_exposure, aligned with the input group order"""
+    group_ids: List[str]
+    internet_open: np.ndarray
+    admin_ports_open: np.ndarray
+    reachable_from_internet_group: np.ndarray
+
+
+def evaluate_exposure(groups: Iterable[dict]) -> ExposureFlags:
+    """Compute exposure flags for every security group in one vectorized pass
+
+    `groups` are rows carrying `id` and the rule_columns() lists. A group is
+    internet-open when any rule admits 0.0.0.0/0 or ::/0, admin-exposed when
+    such a rule covers an admin port over TCP, and reachable from an
+    internet group when it admits traffic from a group that is internet-open.
+    """
+    group_ids: List[str] = []
+    owner: List[int] = []
+    protocols: List[str] = []
+    from_ports: List[int] = []
+    to_ports: List[int] = []
+    sources: List[str] = []
+    for position, group in enumerate(groups):
+        group_ids.append(group["id"])
+        count = len(group["ingress_sources"])
+        owner.extend([position] * count)
+        protocols.extend(group["ingress_protocols"])
+        from_ports.extend(group["ingress_from_ports"])
+        to_ports.extend(group["ingress_to_ports"])
+        sources.extend(group["ingress_sources"])
+
+    n_groups = len(group_ids)
+    owner_idx = np.asarray(owner, dtype=np.int64)
+    low = np.asarray(from_ports, dtype=np.int32)
+    high = np.asarray(to_ports, dtype=np.int32)
+    protocol = np.asarray(protocols, dtype=object)
+    source = np.asarray(sources, dtype=object)
+
+    def any_per_group(rule_mask: np.ndarray) -> np.ndarray:
+        return np.bincount(owner_idx[rule_mask], minlength=n_groups) > 0
+
+    from_internet = np.isin(source, list(INTERNET_SOURCES))
+    internet_open = any_per_group(from_internet)
+
+    tcp = np.isin(protocol, ["tcp", "all"])
+    ports = np.asarray(ADMIN_PORTS, dtype=np.int32)
+    covers_admin = ((low[:, None] <= ports) & (high[:, None] >= ports)).any(axis=1)
+    admin_ports_open = any_per_group(from_internet & tcp & covers_admin)
+
+    # Map source group ids to positions; -1 for CIDRs and groups not in the inventory
+    position = {group_id: i for i, group_id in enumerate(group_ids)}
+    source_idx = np.fromiter((position.get(s, -1) for s in sources), dtype=np.int64, count=len(sources))
+    from_group = source_idx >= 0
+    via_internet_group = np.zeros(len(sources), dtype=bool)
+    via_internet_group[from_group] = internet_open[source_idx[from_group]]
+    reachable = any_per_group(via_internet_group)
+
+    return ExposureFlags(group_ids, internet_open, admin_ports_open, reachable)
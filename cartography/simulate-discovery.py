@@ -4,550 +4,1974 @@ Cartography Asset Discovery Simulation
 Simulates realistic cloud asset discovery by progressively populating Neo4j graph
 """
 
+import argparse
+import csv
+import hashlib
 import json
+import os
+import shutil
+import tempfile
 import time
 import random
-from datetime import datetime, timedelta
-from neo4j import GraphDatabase
+from collections import Counter
+from concurrent.futures import FIRST_COMPLETED, Future, ProcessPoolExecutor, ThreadPoolExecutor, as_completed, wait
+from datetime import datetime, timedelta, timezone
+from itertools import chain, islice
+from typing import Any, Callable, Dict, Iterable, Iterator, List, NamedTuple, Optional, TextIO
+import numpy as np
 import sys
+import threading
+
+from discovery_service import DISCOVERY_SERVICE_PORT, serve
+from graph_sink import SUMMARY_COUNTERS, GraphSink, InMemoryGraph, Neo4jGraphSink, RiskRule
+from inventory_stream import stream_resources
+from security_group_rules import evaluate_exposure, parse_ingress_rules, rule_columns
 
 # Neo4j connection
 NEO4J_URI = "bolt://neo4j:7687"
 NEO4J_USER = "neo4j"
 NEO4J_PASSWORD = "cloudsecurity"
 
-class AssetDiscoverySimulator:
+# Rows sent per UNWIND statement
+DISCOVERY_BATCH_SIZE = int(os.environ.get("DISCOVERY_BATCH_SIZE", "1000"))
+# Phases allowed to run at the same time
+DISCOVERY_PHASE_WORKERS = int(os.environ.get("DISCOVERY_PHASE_WORKERS", "4"))
+# Worker processes for (account, region) shards; 0 discovers in-process
+DISCOVERY_SHARD_WORKERS = int(os.environ.get("DISCOVERY_SHARD_WORKERS", "0"))
+# How long a managed write keeps retrying transient failures (including a database restart)
+DISCOVERY_RETRY_SECONDS = float(os.environ.get("DISCOVERY_RETRY_SECONDS", "600"))
+# Write batches kept in flight on the async driver; 0 writes synchronously, one batch at a time
+DISCOVERY_ASYNC_WRITES = int(os.environ.get("DISCOVERY_ASYNC_WRITES", "0"))
+# Progress file that lets an interrupted run resume; unset disables checkpointing
+DISCOVERY_CHECKPOINT = os.environ.get("DISCOVERY_CHECKPOINT")
+# Per-phase telemetry report written at the end of a run; unset disables it
+DISCOVERY_TELEMETRY = os.environ.get("DISCOVERY_TELEMETRY")
+# Where --export-csv writes; docker-compose mounts ./neo4j/import as the Neo4j import volume
+BULK_IMPORT_DIR = os.environ.get("DISCOVERY_IMPORT_DIR", "neo4j/import/discovery")
+
+
+_report_lock = threading.Lock()
+
+
+def report(message: str) -> None:
+    """print() for phase progress; keeps lines from concurrent phases intact"""
+    with _report_lock:
+        print(message, flush=True)
+
+
+class DiscoveryStats:
+    """Totals gathered from write results as discovery runs, so the summary never scans the graph"""
+
     def __init__(self):
-        self.driver = GraphDatabase.driver(NEO4J_URI, auth=(NEO4J_USER, NEO4J_PASSWORD))
+        self._lock = threading.Lock()
+        self.assets = Counter()  # label -> resources written this run
+        self.writes = Counter()  # SUMMARY_COUNTERS totals
+        self.risks = Counter()   # risk level -> assets flagged this run
+        self.dangling = Counter()  # label -> resources whose parent was not in the graph
+
+    def count_assets(self, label: str, rows: int) -> None:
+        with self._lock:
+            self.assets[label] += rows
+
+    def count_writes(self, summary) -> None:
+        counters = summary.counters
+        with self._lock:
+            for name in SUMMARY_COUNTERS:
+                self.writes[name] += getattr(counters, name)
+
+    def count_dangling(self, label: str, rows: int) -> None:
+        with self._lock:
+            self.dangling[label] += rows
+
+    def count_risk(self, level: str, assets: int) -> None:
+        with self._lock:
+            self.risks[level] += assets
+
+    def to_dict(self) -> dict:
+        with self._lock:
+            return {'assets': dict(self.assets), 'writes': dict(self.writes), 'risks': dict(self.risks),
+                    'dangling': dict(self.dangling)}
+
+    def merge(self, stats: dict) -> None:
+        """Add totals reported by another process (see to_dict)"""
+        with self._lock:
+            self.assets.update(stats['assets'])
+            self.writes.update(stats['writes'])
+            self.risks.update(stats['risks'])
+            self.dangling.update(stats['dangling'])
+
+
+class DiscoveryTelemetry:
+    """Per-phase timings and write counters, for sizing batches and spotting throughput regressions
+
+    Every statement adds its rows, SUMMARY_COUNTERS and the server's
+    result_available_after / result_consumed_after (ms) to the phase it ran
+    in. With a chunk log path, each statement is also appended to that file
+    as one JSON line.
+    """
+
+    def __init__(self, chunk_log: Optional[str] = None, truncate: bool = False):
+        self._lock = threading.Lock()
+        self.phases: Dict[str, Counter] = {}
+        self._chunk_log = None
+        if chunk_log:
+            if truncate:
+                open(chunk_log, 'w').close()
+            # Append mode, so lines from shard processes sharing the file are not overwritten
+            self._chunk_log = open(chunk_log, 'a', encoding='utf-8')
+
+    def _phase(self, phase: str) -> Counter:
+        return self.phases.setdefault(phase, Counter())
+
+    def record(self, phase: str, unit: Optional[str], rows: int, summary, seconds: float) -> None:
+        entry = {name: getattr(summary.counters, name) for name in SUMMARY_COUNTERS}
+        entry['result_available_after_ms'] = summary.result_available_after or 0
+        entry['result_consumed_after_ms'] = summary.result_consumed_after or 0
+        with self._lock:
+            totals = self._phase(phase)
+            totals.update(entry)
+            totals.update(statements=1, rows=rows)
+            if self._chunk_log:
+                self._chunk_log.write(json.dumps({'phase': phase, 'unit': unit, 'rows': rows,
+                                                  'seconds': round(seconds, 4), **entry}) + "\n")
+                self._chunk_log.flush()
+
+    def time_phase(self, phase: str, seconds: float) -> None:
+        with self._lock:
+            self._phase(phase)['seconds'] += seconds
+
+    def to_dict(self) -> dict:
+        with self._lock:
+            return {phase: dict(totals) for phase, totals in self.phases.items()}
+
+    def merge(self, phases: dict) -> None:
+        """Add counters reported by another process (see to_dict)"""
+        with self._lock:
+            for phase, totals in phases.items():
+                self._phase(phase).update(totals)
+
+    def report(self, **run) -> dict:
+        """The JSON report: run settings, then per-phase totals with throughput"""
+        phases = {}
+        for phase, totals in self.to_dict().items():
+            seconds = totals.get('seconds', 0.0)
+            phases[phase] = {
+                'seconds': round(seconds, 3),
+                'statements': totals.get('statements', 0),
+                'rows': totals.get('rows', 0),
+                **{name: totals.get(name, 0) for name in SUMMARY_COUNTERS},
+                'result_available_after_ms': totals.get('result_available_after_ms', 0),
+                'result_consumed_after_ms': totals.get('result_consumed_after_ms', 0),
+                'rows_per_second': round(totals.get('rows', 0) / seconds, 1) if seconds else None
+            }
+        return {**run, 'phases': phases}
+
+    def close(self) -> None:
+        if self._chunk_log:
+            self._chunk_log.close()
+
+
+class Checkpoint:
+    """Progress of one discovery run, rewritten atomically after every committed chunk
+
+    Holds the run's update_tag, the phases that finished and, per unit of
+    work (a resource type, a relationship spec, a shard), how many rows are
+    committed. A restarted run given the same file reuses the update_tag, so
+    the stale sweep keeps what the first attempt wrote, and skips committed
+    rows. Without a path the progress is only kept in memory.
+    """
+
+    def __init__(self, path: Optional[str] = None, inventories: Optional[list] = None):
+        self.path = path
+        self._lock = threading.Lock()
+        self.state = {'inventories': inventories, 'update_tag': None, 'phases': [], 'offsets': {}}
+        if path and os.path.exists(path):
+            with open(path, encoding='utf-8') as checkpoint:
+                saved = json.load(checkpoint)
+            if saved.get('inventories') != inventories:
+                raise ValueError(f"Checkpoint {path} belongs to a run over other inventories; "
+                                 "remove it to start over")
+            self.state = saved
+
+    @property
+    def resumed(self) -> bool:
+        return bool(self.state['phases'] or self.state['offsets'])
+
+    def offset(self, unit: str) -> int:
+        with self._lock:
+            return self.state['offsets'].get(unit, 0)
+
+    def advance(self, unit: str, rows: int) -> None:
+        """Record `rows` more committed rows for a unit of work"""
+        with self._lock:
+            self.state['offsets'][unit] = self.state['offsets'].get(unit, 0) + rows
+            self._save()
+
+    def finished(self, phase: str) -> bool:
+        with self._lock:
+            return phase in self.state['phases']
+
+    def finish(self, phase: str) -> None:
+        with self._lock:
+            self.state['phases'].append(phase)
+            self._save()
+
+    def _save(self) -> None:
+        if not self.path:
+            return
+        # Write-then-rename, so a crash mid-write leaves the previous checkpoint intact
+        temporary = f"{self.path}.tmp"
+        with open(temporary, 'w', encoding='utf-8') as checkpoint:
+            json.dump(self.state, checkpoint)
+            checkpoint.flush()
+            os.fsync(checkpoint.fileno())
+        os.replace(temporary, self.path)
+
+    def clear(self) -> None:
+        """Forget the progress once the run has completed"""
+        if self.path and os.path.exists(self.path):
+            os.remove(self.path)
+
+
+class ParentSpec(NamedTuple):
+    """The node that contains a resource, found by the row field holding its key"""
+    label: str
+    key: str
+    field: str
+    relationship: str
+
+
+class NodeSpec(NamedTuple):
+    """How one inventory resource type is written to the graph"""
+    label: str
+    key: str
+    properties: tuple
+    parent: Optional[ParentSpec] = None
+
+
+# Inventory key -> graph shape. Keys follow mock-data/aws-resources.json.
+NODE_SPECS: Dict[str, NodeSpec] = {
+    'accounts': NodeSpec('AWSAccount', 'id', ('id', 'name', 'arn')),
+    'regions': NodeSpec('AWSRegion', 'name', ('name',),
+                        ParentSpec('AWSAccount', 'id', 'account_id', 'CONTAINS_REGION')),
+    'iam_users': NodeSpec('IAMUser', 'arn',
+                          ('username', 'userid', 'arn', 'access_level', 'mfa_enabled', 'last_activity'),
+                          ParentSpec('AWSAccount', 'id', 'account_id', 'CONTAINS_USER')),
+    'iam_roles': NodeSpec('IAMRole', 'arn',
+                          ('name', 'arn', 'trust_policy', 'max_session_duration', 'privilege_level'),
+                          ParentSpec('AWSAccount', 'id', 'account_id', 'CONTAINS_ROLE')),
+    'vpcs': NodeSpec('VPC', 'id', ('id', 'cidr_block', 'is_default', 'state'),
+                     ParentSpec('AWSAccount', 'id', 'account_id', 'CONTAINS_VPC')),
+    'security_groups': NodeSpec('SecurityGroup', 'id',
+                                ('id', 'name', 'description', 'ingress_protocols', 'ingress_from_ports',
+                                 'ingress_to_ports', 'ingress_sources', 'vpc_id'),
+                                ParentSpec('VPC', 'id', 'vpc_id', 'CONTAINS_SECURITY_GROUP')),
+    'ec2_instances': NodeSpec('EC2Instance', 'id',
+                              ('id', 'instance_type', 'state', 'public_ip', 'private_ip',
+                               'iam_instance_profile', 'security_groups', 'vpc_id'),
+                              ParentSpec('VPC', 'id', 'vpc_id', 'CONTAINS_INSTANCE')),
+    's3_buckets': NodeSpec('S3Bucket', 'arn',
+                           ('name', 'arn', 'public_read', 'public_write', 'encryption_enabled',
+                            'versioning_enabled', 'contains_pii'),
+                           ParentSpec('AWSAccount', 'id', 'account_id', 'CONTAINS_BUCKET')),
+    'lambda_functions': NodeSpec('LambdaFunction', 'arn',
+                                 ('name', 'arn', 'runtime', 'role_arn', 'environment_variables',
+                                  'has_vpc_access'),
+                                 ParentSpec('AWSAccount', 'id', 'account_id', 'CONTAINS_LAMBDA')),
+    'api_gateways': NodeSpec('APIGateway', 'id',
+                             ('id', 'name', 'stage', 'endpoint_url', 'authentication', 'integrations'),
+                             ParentSpec('AWSAccount', 'id', 'account_id', 'CONTAINS_API')),
+
+    # Keys follow mock-azure-data.json
+    'azure_subscriptions': NodeSpec('AzureSubscription', 'id', ('id', 'name', 'state', 'tenant_id')),
+    'azure_ad_users': NodeSpec('AzureADUser', 'object_id',
+                               ('object_id', 'user_principal_name', 'display_name', 'enabled', 'user_type',
+                                'mfa_enabled', 'department', 'tenant_id', 'last_sign_in')),
+    'azure_ad_applications': NodeSpec('AzureADApplication', 'app_id',
+                                      ('app_id', 'object_id', 'display_name', 'available_to_other_tenants',
+                                       'tenant_id')),
+    'azure_ad_service_principals': NodeSpec('AzureServicePrincipal', 'object_id',
+                                            ('object_id', 'app_id', 'display_name', 'enabled',
+                                             'service_principal_type', 'tenant_id')),
+    'resource_groups': NodeSpec('AzureResourceGroup', 'id', ('id', 'name', 'location'),
+                                ParentSpec('AzureSubscription', 'id', 'subscription_id',
+                                           'CONTAINS_RESOURCE_GROUP')),
+    'virtual_machines': NodeSpec('AzureVirtualMachine', 'id',
+                                 ('id', 'name', 'location', 'vm_size', 'power_state', 'identity_principal_id',
+                                  'password_authentication'),
+                                 ParentSpec('AzureResourceGroup', 'id', 'resource_group_id', 'CONTAINS_VM')),
+    'storage_accounts': NodeSpec('AzureStorageAccount', 'id',
+                                 ('id', 'name', 'location', 'kind', 'https_traffic_only',
+                                  'allow_blob_public_access', 'minimum_tls_version'),
+                                 ParentSpec('AzureResourceGroup', 'id', 'resource_group_id',
+                                            'CONTAINS_STORAGE_ACCOUNT')),
+    'azure_functions': NodeSpec('AzureFunctionApp', 'id',
+                                ('id', 'name', 'location', 'kind', 'state', 'https_only', 'cors_allow_all',
+                                 'identity_principal_id'),
+                                ParentSpec('AzureResourceGroup', 'id', 'resource_group_id',
+                                           'CONTAINS_FUNCTION_APP')),
+    'key_vaults': NodeSpec('AzureKeyVault', 'id',
+                           ('id', 'name', 'location', 'vault_uri', 'purge_protection_enabled',
+                            'network_default_action', 'access_policy_principals'),
+                           ParentSpec('AzureResourceGroup', 'id', 'resource_group_id', 'CONTAINS_KEY_VAULT')),
+    'virtual_networks': NodeSpec('AzureVirtualNetwork', 'id',
+                                 ('id', 'name', 'location', 'address_prefixes', 'subnets'),
+                                 ParentSpec('AzureResourceGroup', 'id', 'resource_group_id', 'CONTAINS_VNET')),
+    'network_security_groups': NodeSpec('AzureNetworkSecurityGroup', 'id',
+                                        ('id', 'name', 'location', 'security_rules'),
+                                        ParentSpec('AzureResourceGroup', 'id', 'resource_group_id',
+                                                   'CONTAINS_NSG')),
+    'role_assignments': NodeSpec('AzureRoleAssignment', 'id',
+                                 ('id', 'scope', 'role_definition_name', 'principal_id', 'principal_type'),
+                                 ParentSpec('AzureSubscription', 'id', 'subscription_id',
+                                            'CONTAINS_ROLE_ASSIGNMENT')),
+
+    # Sections of mock-k8s-data.json (see KUBERNETES_SECTIONS). Namespaced
+    # objects are keyed cluster/namespace/name, cluster-scoped ones cluster/name.
+    'k8s_clusters': NodeSpec('KubernetesCluster', 'id',
+                             ('id', 'name', 'version', 'provider', 'region', 'cluster_arn', 'public_endpoint',
+                              'public_access_cidrs', 'audit_logging')),
+    'k8s_namespaces': NodeSpec('KubernetesNamespace', 'id', ('id', 'name', 'cluster_name', 'status'),
+                               ParentSpec('KubernetesCluster', 'id', 'cluster_name', 'CONTAINS_NAMESPACE')),
+    'k8s_nodes': NodeSpec('KubernetesNode', 'id',
+                          ('id', 'name', 'cluster_name', 'instance_type', 'zone', 'kubelet_version',
+                           'provider_id'),
+                          ParentSpec('KubernetesCluster', 'id', 'cluster_name', 'CONTAINS_NODE')),
+    'k8s_pods': NodeSpec('KubernetesPod', 'id',
+                         ('id', 'name', 'namespace', 'cluster_name', 'phase', 'service_account', 'node_name',
+                          'images', 'privileged', 'run_as_root', 'host_path_mounts'),
+                         ParentSpec('KubernetesNamespace', 'id', 'namespace_id', 'CONTAINS_POD')),
+    'k8s_services': NodeSpec('KubernetesService', 'id',
+                             ('id', 'name', 'namespace', 'cluster_name', 'type', 'ports', 'external_hostnames'),
+                             ParentSpec('KubernetesNamespace', 'id', 'namespace_id', 'CONTAINS_SERVICE')),
+    'k8s_service_accounts': NodeSpec('KubernetesServiceAccount', 'id',
+                                     ('id', 'name', 'namespace', 'cluster_name', 'iam_role_arn',
+                                      'automount_token'),
+                                     ParentSpec('KubernetesNamespace', 'id', 'namespace_id',
+                                                'CONTAINS_SERVICE_ACCOUNT')),
+    'k8s_secrets': NodeSpec('KubernetesSecret', 'id',
+                            ('id', 'name', 'namespace', 'cluster_name', 'type', 'data_keys'),
+                            ParentSpec('KubernetesNamespace', 'id', 'namespace_id', 'CONTAINS_SECRET')),
+    'k8s_roles': NodeSpec('KubernetesRole', 'id', ('id', 'name', 'namespace', 'cluster_name', 'rules'),
+                          ParentSpec('KubernetesNamespace', 'id', 'namespace_id', 'CONTAINS_ROLE')),
+    'k8s_role_bindings': NodeSpec('KubernetesRoleBinding', 'id',
+                                  ('id', 'name', 'namespace', 'cluster_name', 'role_kind', 'role_name',
+                                   'subjects'),
+                                  ParentSpec('KubernetesNamespace', 'id', 'namespace_id',
+                                             'CONTAINS_ROLE_BINDING')),
+    'k8s_cluster_roles': NodeSpec('KubernetesClusterRole', 'id', ('id', 'name', 'cluster_name', 'rules'),
+                                  ParentSpec('KubernetesCluster', 'id', 'cluster_name',
+                                             'CONTAINS_CLUSTER_ROLE')),
+    'k8s_cluster_role_bindings': NodeSpec('KubernetesClusterRoleBinding', 'id',
+                                          ('id', 'name', 'cluster_name', 'role_name', 'subjects'),
+                                          ParentSpec('KubernetesCluster', 'id', 'cluster_name',
+                                                     'CONTAINS_CLUSTER_ROLE_BINDING')),
+    'k8s_container_images': NodeSpec('ContainerImage', 'name',
+                                     ('name', 'registry', 'tags', 'critical_vulnerabilities',
+                                      'high_vulnerabilities')),
+}
+
+# Azure and Kubernetes resource types in write order (containers before contents)
+AZURE_KINDS = ('azure_subscriptions', 'azure_ad_users', 'azure_ad_applications', 'azure_ad_service_principals',
+               'resource_groups', 'virtual_machines', 'storage_accounts', 'azure_functions', 'key_vaults',
+               'virtual_networks', 'network_security_groups', 'role_assignments')
+KUBERNETES_KINDS = ('k8s_clusters', 'k8s_namespaces', 'k8s_nodes', 'k8s_pods', 'k8s_services',
+                    'k8s_service_accounts', 'k8s_secrets', 'k8s_roles', 'k8s_role_bindings', 'k8s_cluster_roles',
+                    'k8s_cluster_role_bindings', 'k8s_container_images')
+# Kubernetes kinds are prefixed here because the export's section names
+# (roles, nodes, secrets, ...) are too generic to share one namespace
+KUBERNETES_SECTIONS = {kind: kind[len('k8s_'):] for kind in KUBERNETES_KINDS}
+
+# Resource types written by (account, region) shard workers; the foundation
+# (accounts and regions) is written once by the coordinator beforehand.
+SHARDED_KINDS = ('iam_users', 'iam_roles', 'vpcs', 'security_groups', 'ec2_instances',
+                 's3_buckets', 'lambda_functions', 'api_gateways')
+# Shard for account-wide resources (IAM) and records without a region
+GLOBAL_REGION = 'global'
+
+
+class DiscoveryPhase(NamedTuple):
+    """One step of the discovery pipeline and the phases it must wait for"""
+    name: str
+    banner: str
+    method: str
+    requires: tuple = ()
+
+
+# Storage, serverless and compute only attach to AWSAccount/VPC, so once the
+# foundation exists they run side by side. Azure and Kubernetes share no
+# nodes with AWS and start right away when their inventories are given. Cross-service edges and posture
+# checks wait for the node phases they read.
+DISCOVERY_PHASES = (
+    DiscoveryPhase('foundation', "📍 Phase 1: Discovering AWS accounts and regions...",
+                   'discover_aws_foundation'),
+    DiscoveryPhase('iam', "🔐 Phase 2: Discovering IAM users, roles, and policies...",
+                   'discover_iam_infrastructure', ('foundation',)),
+    DiscoveryPhase('compute', "💻 Phase 3: Discovering EC2 instances and networking...",
+                   'discover_compute_network', ('foundation',)),
+    DiscoveryPhase('storage', "🗄️ Phase 4: Discovering storage and database resources...",
+                   'discover_storage_databases', ('foundation',)),
+    DiscoveryPhase('serverless', "⚡ Phase 5: Discovering Lambda functions and API Gateways...",
+                   'discover_serverless_apis', ('foundation',)),
+    DiscoveryPhase('azure', "☁️ Discovering Azure subscriptions, identities and resources...",
+                   'discover_azure'),
+    DiscoveryPhase('kubernetes', "☸️ Discovering Kubernetes clusters, workloads and RBAC...",
+                   'discover_kubernetes'),
+    DiscoveryPhase('sweep', "🧹 Removing resources that no longer exist...",
+                   'sweep_stale_resources', ('iam', 'compute', 'storage', 'serverless', 'shards', 'azure',
+                                             'kubernetes')),
+    DiscoveryPhase('relationships', "🔗 Phase 6: Discovering cross-service relationships...",
+                   'discover_relationships', ('iam', 'compute', 'storage', 'serverless', 'shards', 'azure',
+                                              'kubernetes', 'sweep')),
+    DiscoveryPhase('security', "🛡️ Phase 7: Analyzing security configurations...",
+                   'analyze_security_posture', ('iam', 'compute', 'storage', 'shards', 'sweep')),
+)
+
+# With shard workers, phases 2-5 are replaced by one fan-out over (account, region)
+SHARDED_PHASE = DiscoveryPhase('shards', "🧩 Phases 2-5: Discovering resources per account and region...",
+                               'discover_shards', ('foundation',))
+NODE_PHASES = ('iam', 'compute', 'storage', 'serverless')
+
+
+def prepare_row(row: dict, spec: NodeSpec) -> dict:
+    """Split an inventory row into graph properties, parent key and a stable hash of both"""
+    props = {name: row[name] for name in spec.properties}
+    parent_id = row.get(spec.parent.field) if spec.parent else None
+    encoded = json.dumps([props, parent_id], sort_keys=True, separators=(',', ':')).encode('utf-8')
+    return {
+        'props': props,
+        'parent_id': parent_id,
+        'content_hash': hashlib.blake2b(encoded, digest_size=16).hexdigest()
+    }
+
+
+def chunked(rows: Iterable[dict], size: int) -> Iterator[List[dict]]:
+    """Yield lists of at most `size` rows without materializing the input"""
+    iterator = iter(rows)
+    while True:
+        chunk = list(islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+# Export records (mock-data/aws-resources.json schema) -> graph rows.
+# Neo4j cannot MERGE on null, so absent values become '' / False.
+# account_id and region only place the row (parent account, shard); when an
+# export omits them they are recovered from the ARN or the inventory default.
+
+def _placement(r: dict) -> dict:
+    zone = r.get('availability_zone') or ''
+    return {
+        'account_id': r.get('account_id') or r.get('owner_id') or '',
+        'region': r.get('region') or zone[:-1]
+    }
+
+
+def _principal(trust_policy) -> str:
+    """Flatten a trust policy document to its comma-separated principals"""
+    if not isinstance(trust_policy, dict):
+        return trust_policy or ''
+    principals = []
+    for statement in trust_policy.get('Statement', []):
+        for value in (statement.get('Principal') or {}).values():
+            principals.extend(value if isinstance(value, list) else [value])
+    return ','.join(principals)
+
+
+def _arm_scope(resource_id: str, depth: int) -> str:
+    """Leading /subscriptions/<id>[/resourceGroups/<name>] of an Azure resource ID (depth 1 or 2)"""
+    parts = (resource_id or '').strip('/').split('/')
+    if len(parts) < 2 * depth or parts[0].lower() != 'subscriptions':
+        return ''
+    if depth == 2 and parts[2].lower() != 'resourcegroups':
+        return ''
+    return '/' + '/'.join(parts[:2 * depth])
+
+
+def _azure_resource(r: dict) -> dict:
+    """Fields shared by every resource inside an Azure resource group"""
+    return {
+        'id': r['id'],
+        'name': r.get('name', ''),
+        'location': r.get('location', ''),
+        'resource_group_id': _arm_scope(r['id'], 2)
+    }
+
+
+def _k8s_object(r: dict, namespaced: bool = True) -> dict:
+    """Identity of a Kubernetes object; FileInventory supplies the cluster when the export omits it"""
+    cluster = r.get('cluster', '')
+    if not namespaced:
+        return {'id': f"{cluster}/{r['name']}", 'name': r['name'], 'cluster_name': cluster}
+    namespace = r.get('namespace') or 'default'
+    return {
+        'id': f"{cluster}/{namespace}/{r['name']}",
+        'name': r['name'],
+        'namespace': namespace,
+        'cluster_name': cluster,
+        'namespace_id': f"{cluster}/{namespace}"
+    }
+
+
+def _pod(r: dict) -> dict:
+    spec = r.get('spec') or {}
+    pod_context = spec.get('security_context') or {}
+    containers = spec.get('containers') or []
+    contexts = [pod_context] + [c.get('security_context') or {} for c in containers]
+    return {
+        **_k8s_object(r),
+        'phase': (r.get('status') or {}).get('phase', ''),
+        'service_account': spec.get('service_account_name', ''),
+        'node_name': spec.get('node_name', ''),
+        'images': [c['image'] for c in containers if c.get('image')],
+        'privileged': any(bool(c.get('privileged')) for c in contexts),
+        'run_as_root': any(c.get('run_as_user') == 0 for c in contexts),
+        'host_path_mounts': any(v.get('host_path') for v in spec.get('volumes') or [])
+    }
+
+
+def _integrations(integrations) -> str:
+    """Comma-separated Lambda ARNs behind an API's integrations
+
+    Lambda integration URIs wrap the function ARN:
+    arn:aws:apigateway:<region>:lambda:path/2015-03-31/functions/<function arn>/invocations
+    """
+    arns = []
+    for integration in integrations or []:
+        uri = integration.get('uri', '')
+        if '/functions/' in uri:
+            arns.append(uri.split('/functions/', 1)[1].split('/invocations', 1)[0])
+    return ','.join(arns)
+
+
+RECORD_NORMALIZERS = {
+    'accounts': lambda r: {'id': r['id'], 'name': r.get('name', ''), 'arn': r.get('arn', '')},
+    'regions': lambda r: {'name': r['name'], 'account_id': r.get('account_id', '')},
+    'iam_users': lambda r: {
+        'username': r['username'],
+        'userid': r.get('userid', ''),
+        'arn': r['arn'],
+        'access_level': r.get('access_level', ''),
+        'mfa_enabled': bool(r.get('mfa_enabled')),
+        'last_activity': (r.get('password_last_used') or '')[:10],
+        **_placement(r)
+    },
+    'iam_roles': lambda r: {
+        'name': r['name'],
+        'arn': r['arn'],
+        'trust_policy': _principal(r.get('trust_policy')),
+        'max_session_duration': r.get('max_session_duration', 3600),
+        'privilege_level': r.get('privilege_level', ''),
+        **_placement(r)
+    },
+    'vpcs': lambda r: {
+        'id': r['vpc_id'],
+        'cidr_block': r.get('cidr_block', ''),
+        'is_default': bool(r.get('is_default')),
+        'state': r.get('state', ''),
+        **_placement(r)
+    },
+    'security_groups': lambda r: {
+        'id': r['group_id'],
+        'name': r.get('group_name', ''),
+        'description': r.get('description', ''),
+        **rule_columns(parse_ingress_rules(r.get('ingress_rules'))),
+        'vpc_id': r.get('vpc_id', ''),
+        **_placement(r)
+    },
+    'ec2_instances': lambda r: {
+        'id': r['instance_id'],
+        'instance_type': r.get('instance_type', ''),
+        'state': r.get('state', ''),
+        'public_ip': r.get('public_ip_address') or '',
+        'private_ip': r.get('private_ip_address') or '',
+        'iam_instance_profile': ((r.get('iam_instance_profile') or {}).get('arn') or '').rsplit('/', 1)[-1],
+        'security_groups': ','.join(sg['group_id'] for sg in r.get('security_groups') or []),
+        'vpc_id': r.get('vpc_id', ''),
+        **_placement(r)
+    },
+    's3_buckets': lambda r: {
+        'name': r['name'],
+        'arn': r.get('arn') or f"arn:aws:s3:::{r['name']}",
+        'public_read': bool(r.get('public_read_acp') or r.get('public_read_policy')),
+        'public_write': bool(r.get('public_write_acp') or r.get('public_write_policy')),
+        'encryption_enabled': bool((r.get('encryption') or {}).get('enabled')),
+        'versioning_enabled': (r.get('versioning') or {}).get('status') == 'Enabled',
+        'contains_pii': bool(r.get('contains_pii')),
+        **_placement(r)
+    },
+    'lambda_functions': lambda r: {
+        'name': r['function_name'],
+        'arn': r['function_arn'],
+        'runtime': r.get('runtime', ''),
+        'role_arn': r.get('role', ''),
+        'environment_variables': json.dumps((r.get('environment') or {}).get('variables') or {}),
+        'has_vpc_access': bool(r.get('vpc_config')),
+        **_placement(r)
+    },
+    'api_gateways': lambda r: {
+        'id': r['id'],
+        'name': r.get('name', ''),
+        'stage': ((r.get('stages') or [{}])[0]).get('stage_name', ''),
+        'endpoint_url': ((r.get('stages') or [{}])[0]).get('endpoint_url', ''),
+        'authentication': (r.get('authentication') or '').lower(),
+        'integrations': _integrations(r.get('integrations')),
+        **_placement(r)
+    },
+
+    'azure_subscriptions': lambda r: {
+        'id': r['subscription_id'],
+        'name': r.get('display_name', ''),
+        'state': r.get('state', ''),
+        'tenant_id': r.get('tenant_id', '')
+    },
+    'azure_ad_users': lambda r: {
+        'object_id': r['object_id'],
+        'user_principal_name': r.get('user_principal_name', ''),
+        'display_name': r.get('display_name', ''),
+        'enabled': bool(r.get('enabled')),
+        'user_type': r.get('user_type', ''),
+        'mfa_enabled': bool(r.get('mfa_enabled')),
+        'department': r.get('department') or '',
+        'tenant_id': r.get('tenant_id', ''),
+        'last_sign_in': (r.get('sign_in_activity') or {}).get('last_sign_in') or ''
+    },
+    'azure_ad_applications': lambda r: {
+        'app_id': r['app_id'],
+        'object_id': r.get('object_id', ''),
+        'display_name': r.get('display_name', ''),
+        'available_to_other_tenants': bool(r.get('available_to_other_tenants')),
+        'tenant_id': r.get('tenant_id', '')
+    },
+    'azure_ad_service_principals': lambda r: {
+        'object_id': r['object_id'],
+        'app_id': r.get('app_id', ''),
+        'display_name': r.get('display_name', ''),
+        'enabled': bool(r.get('enabled')),
+        'service_principal_type': r.get('service_principal_type', ''),
+        'tenant_id': r.get('tenant_id', '')
+    },
+    'resource_groups': lambda r: {
+        'id': r['id'],
+        'name': r.get('name', ''),
+        'location': r.get('location', ''),
+        'subscription_id': _arm_scope(r['id'], 1).rsplit('/', 1)[-1]
+    },
+    'virtual_machines': lambda r: {
+        **_azure_resource(r),
+        'vm_size': r.get('vm_size', ''),
+        'power_state': r.get('power_state', ''),
+        'identity_principal_id': (r.get('identity') or {}).get('principal_id') or '',
+        'password_authentication': not ((r.get('os_profile') or {}).get('linux_configuration') or {}).get(
+            'disable_password_authentication', False)
+    },
+    'storage_accounts': lambda r: {
+        **_azure_resource(r),
+        'kind': r.get('kind', ''),
+        'https_traffic_only': bool(r.get('https_traffic_only')),
+        'allow_blob_public_access': bool(r.get('allow_blob_public_access')),
+        'minimum_tls_version': r.get('minimum_tls_version') or ''
+    },
+    'azure_functions': lambda r: {
+        **_azure_resource(r),
+        'kind': r.get('kind', ''),
+        'state': r.get('state', ''),
+        'https_only': bool(r.get('https_only')),
+        'cors_allow_all': '*' in (((r.get('site_config') or {}).get('cors') or {}).get('allowed_origins') or []),
+        'identity_principal_id': (r.get('identity') or {}).get('principal_id') or ''
+    },
+    'key_vaults': lambda r: {
+        **_azure_resource(r),
+        'vault_uri': r.get('vault_uri', ''),
+        'purge_protection_enabled': bool(r.get('purge_protection_enabled')),
+        'network_default_action': (r.get('network_acls') or {}).get('default_action', ''),
+        'access_policy_principals': [p['object_id'] for p in r.get('access_policies') or [] if p.get('object_id')]
+    },
+    'virtual_networks': lambda r: {
+        **_azure_resource(r),
+        'address_prefixes': list((r.get('address_space') or {}).get('address_prefixes') or []),
+        'subnets': [subnet['name'] for subnet in r.get('subnets') or [] if subnet.get('name')]
+    },
+    'network_security_groups': lambda r: {
+        **_azure_resource(r),
+        'security_rules': json.dumps(r.get('security_rules') or [])
+    },
+    'role_assignments': lambda r: {
+        'id': r['id'],
+        'scope': r.get('scope', ''),
+        'role_definition_name': r.get('role_definition_name', ''),
+        'principal_id': r.get('principal_id', ''),
+        'principal_type': r.get('principal_type', ''),
+        'subscription_id': _arm_scope(r.get('scope') or r['id'], 1).rsplit('/', 1)[-1]
+    },
+
+    'k8s_clusters': lambda r: {
+        'id': r['name'],
+        'name': r['name'],
+        'version': r.get('version', ''),
+        'provider': r.get('provider', ''),
+        'region': r.get('region', ''),
+        'cluster_arn': r.get('cluster_arn') or '',
+        'public_endpoint': bool((r.get('endpoint_access') or {}).get('public')),
+        'public_access_cidrs': list((r.get('endpoint_access') or {}).get('public_access_cidrs') or []),
+        'audit_logging': bool((r.get('logging') or {}).get('audit'))
+    },
+    'k8s_namespaces': lambda r: {
+        'id': f"{r.get('cluster', '')}/{r['name']}",
+        'name': r['name'],
+        'cluster_name': r.get('cluster', ''),
+        'status': r.get('status', '')
+    },
+    'k8s_nodes': lambda r: {
+        **_k8s_object(r, namespaced=False),
+        'instance_type': (r.get('labels') or {}).get('node.kubernetes.io/instance-type', ''),
+        'zone': (r.get('labels') or {}).get('topology.kubernetes.io/zone', ''),
+        'kubelet_version': ((r.get('status') or {}).get('node_info') or {}).get('kubelet_version', ''),
+        'provider_id': (r.get('spec') or {}).get('provider_id', '')
+    },
+    'k8s_pods': _pod,
+    'k8s_services': lambda r: {
+        **_k8s_object(r),
+        'type': (r.get('spec') or {}).get('type', ''),
+        'ports': [port['port'] for port in (r.get('spec') or {}).get('ports') or [] if 'port' in port],
+        'external_hostnames': [ingress.get('hostname') or ingress.get('ip', '')
+                               for ingress in ((r.get('status') or {}).get('load_balancer') or {}).get('ingress')
+                               or []]
+    },
+    'k8s_service_accounts': lambda r: {
+        **_k8s_object(r),
+        'iam_role_arn': (r.get('annotations') or {}).get('eks.amazonaws.com/role-arn', ''),
+        'automount_token': r.get('automount_service_account_token') is not False
+    },
+    'k8s_secrets': lambda r: {
+        **_k8s_object(r),
+        'type': r.get('type', ''),
+        'data_keys': list(r.get('data_keys') or [])
+    },
+    'k8s_roles': lambda r: {**_k8s_object(r), 'rules': json.dumps(r.get('rules') or [])},
+    'k8s_role_bindings': lambda r: {
+        **_k8s_object(r),
+        'role_kind': (r.get('role_ref') or {}).get('kind', ''),
+        'role_name': (r.get('role_ref') or {}).get('name', ''),
+        'subjects': json.dumps(r.get('subjects') or [])
+    },
+    'k8s_cluster_roles': lambda r: {
+        **_k8s_object(r, namespaced=False),
+        'rules': json.dumps(r.get('rules') or [])
+    },
+    'k8s_cluster_role_bindings': lambda r: {
+        **_k8s_object(r, namespaced=False),
+        'role_name': (r.get('role_ref') or {}).get('name', ''),
+        'subjects': json.dumps(r.get('subjects') or [])
+    },
+    'k8s_container_images': lambda r: {
+        'name': r['name'],
+        'registry': r.get('registry', ''),
+        'tags': list(r.get('tags') or []),
+        'critical_vulnerabilities': (r.get('vulnerabilities') or {}).get('critical', 0),
+        'high_vulnerabilities': (r.get('vulnerabilities') or {}).get('high', 0)
+    },
+}
+
+
+def _arn_field(arn: str, index: int) -> str:
+    parts = (arn or '').split(':')
+    return parts[index] if len(parts) > 5 else ''
+
+
+def _split(value: str) -> List[str]:
+    return [part for part in (value or '').split(',') if part]
+
+
+def _bucket_names(environment_variables: str) -> List[str]:
+    """Environment values that could name an S3 bucket (plain name, s3:// URL or bucket ARN)"""
+    try:
+        variables = json.loads(environment_variables or '{}')
+    except ValueError:
+        return []
+    names = []
+    for value in variables.values():
+        if not isinstance(value, str):
+            continue
+        for prefix in ('s3://', 'arn:aws:s3:::'):
+            if value.startswith(prefix):
+                value = value[len(prefix):]
+        names.append(value.split('/', 1)[0])
+    return names
+
+
+class EdgeSpec(NamedTuple):
+    """A relationship derived by joining references held by one resource type to a field of another
+
+    `references` maps a row of `kind` to the values it points at; each is
+    looked up in an in-memory index of `target` rows by `target_field`.
+    Edges run from the `kind` row to the target unless `inbound` is set, and
+    carry `properties` alongside the discovery bookkeeping.
+    """
+    kind: str
+    references: Callable[[dict], Iterable[str]]
+    target: str
+    target_field: str
+    relationship: str
+    inbound: bool = False
+    properties: Dict[str, Any] = {}
+
+
+# Every cross-service edge, derived from fields the inventory already carries
+RELATIONSHIP_SPECS = (
+    # Trust policy principals: a user ARN, or an account root that delegates to all its users
+    EdgeSpec('iam_roles', lambda r: _split(r['trust_policy']), 'iam_users', 'arn', 'CAN_ASSUME_ROLE',
+             inbound=True),
+    EdgeSpec('iam_roles', lambda r: [_arn_field(p, 4) for p in _split(r['trust_policy']) if p.endswith(':root')],
+             'iam_users', 'account_id', 'CAN_ASSUME_ROLE', inbound=True),
+    # Instance profiles carry the name of the role they wrap, within the instance's account
+    EdgeSpec('ec2_instances',
+             lambda r: [f"arn:aws:iam::{r['account_id']}:role/{r['iam_instance_profile']}"]
+             if r['iam_instance_profile'] else [],
+             'iam_roles', 'arn', 'HAS_INSTANCE_PROFILE'),
+    EdgeSpec('ec2_instances', lambda r: _split(r['security_groups']), 'security_groups', 'id',
+             'MEMBER_OF_SECURITY_GROUP'),
+    EdgeSpec('lambda_functions', lambda r: [r['role_arn']], 'iam_roles', 'arn', 'EXECUTES_WITH_ROLE'),
+    EdgeSpec('lambda_functions', lambda r: _bucket_names(r['environment_variables']), 's3_buckets', 'name',
+             'CAN_ACCESS', properties={'permissions': 'read,write'}),
+    EdgeSpec('api_gateways', lambda r: _split(r.get('integrations')), 'lambda_functions', 'arn', 'INVOKES'),
+
+    EdgeSpec('role_assignments', lambda r: [r['principal_id']], 'azure_ad_users', 'object_id', 'GRANTED_TO'),
+    EdgeSpec('role_assignments', lambda r: [r['principal_id']], 'azure_ad_service_principals', 'object_id',
+             'GRANTED_TO'),
+
+    EdgeSpec('k8s_pods', lambda r: [f"{r['namespace_id']}/{r['service_account']}"] if r['service_account'] else [],
+             'k8s_service_accounts', 'id', 'USES_SERVICE_ACCOUNT'),
+    EdgeSpec('k8s_pods', lambda r: r['images'], 'k8s_container_images', 'name', 'RUNS_IMAGE'),
+    # IAM roles for service accounts (EKS IRSA) link the cluster to AWS
+    EdgeSpec('k8s_service_accounts', lambda r: [r['iam_role_arn']], 'iam_roles', 'arn', 'ASSUMES_IAM_ROLE'),
+)
+
+
+def build_key_index(rows: Iterable[dict], field: str, key: str) -> Dict[str, List[str]]:
+    """Map each value of `field` to the node keys of the rows holding it, in one pass"""
+    index: Dict[str, List[str]] = {}
+    for row in rows:
+        value = row.get(field)
+        if value:
+            index.setdefault(value, []).append(row[key])
+    return index
+
+
+def derive_edges(rows: Iterable[dict], edge: EdgeSpec, index: Dict[str, List[str]]) -> Iterator[List[str]]:
+    """Hash-join each row's references against a target index, yielding [source key, target key] pairs"""
+    key = NODE_SPECS[edge.kind].key
+    for row in rows:
+        for reference in edge.references(row):
+            for target_key in index.get(reference, ()) if reference else ():
+                yield [target_key, row[key]] if edge.inbound else [row[key], target_key]
+
+
+class Inventory:
+    """Source of normalized graph rows, keyed by inventory section"""
+
+    def section(self, kind: str) -> Iterator[dict]:
+        raise NotImplementedError
+
+    def records(self, kind: str) -> Iterator[dict]:
+        """Rows for one resource type, each placed in an account and region"""
+        if kind == 'regions':
+            # Regions are listed once per export; every account contains each of them
+            accounts = [account['id'] for account in self.section('accounts')]
+            for region in self.section('regions'):
+                for account_id in ([region['account_id']] if region.get('account_id') else accounts):
+                    yield dict(region, account_id=account_id)
+            return
+        if kind not in SHARDED_KINDS:
+            yield from self.section(kind)
+            return
+        for row in self.section(kind):
+            arn = row.get('arn', '')
+            if not row.get('account_id'):
+                row['account_id'] = _arn_field(arn, 4) or self.default_account
+            if not row.get('region'):
+                row['region'] = _arn_field(arn, 3) or GLOBAL_REGION
+            yield row
+
+    @property
+    def default_account(self) -> str:
+        if not hasattr(self, '_default_account'):
+            self._default_account = next((a['id'] for a in self.section('accounts')), '')
+        return self._default_account
+
+
+class DemoInventory(Inventory):
+    """The built-in demo estate"""
+
+    def section(self, kind: str) -> Iterator[dict]:
+        return (dict(row) for row in DEMO_INVENTORY.get(kind, []))
+
+
+class FileInventory(Inventory):
+    """Inventory streamed record by record from an aws-resources.json style export
+
+    Each resource type is read in its own pass over the file, so phases can
+    run in dependency order while memory stays at one record per pass.
+    """
+
+    def __init__(self, path: str):
+        if not os.path.isfile(path):
+            raise FileNotFoundError(f"Inventory file not found: {path}")
+        self.path = path
+
+    def section(self, kind: str) -> Iterator[dict]:
+        normalize = RECORD_NORMALIZERS[kind]
+        # Kubernetes exports are per cluster and only name it in `clusters`
+        cluster = self.default_cluster if kind in KUBERNETES_KINDS and kind != 'k8s_clusters' else None
+        for record in stream_resources(self.path, KUBERNETES_SECTIONS.get(kind, kind)):
+            if cluster and not record.get('cluster'):
+                record['cluster'] = cluster
+            yield normalize(record)
+
+    @property
+    def default_cluster(self) -> str:
+        if not hasattr(self, '_default_cluster'):
+            self._default_cluster = next((c['name'] for c in self.section('k8s_clusters')), '')
+        return self._default_cluster
+
+
+class ShardInventory(Inventory):
+    """Rows of one (account, region) shard, spooled to JSON lines by the coordinator"""
+
+    def __init__(self, directory: str):
+        self.directory = directory
+
+    def section(self, kind: str) -> Iterator[dict]:
+        path = os.path.join(self.directory, f"{kind}.jsonl")
+        if not os.path.exists(path):
+            return
+        with open(path, encoding='utf-8') as spool:
+            for line in spool:
+                yield json.loads(line)
+
+
+def spool_shards(inventory: Inventory, spool_dir: str, buffer_rows: int = 50000) -> Dict[tuple, str]:
+    """Partition the sharded resource types by (account, region) into per-shard spool files
+
+    One streaming pass per resource type; rows are buffered in memory only up
+    to `buffer_rows` before being appended to their shard's files.
+    """
+    shards: Dict[tuple, str] = {}
+    buffers: Dict[tuple, List[str]] = {}
+    buffered = 0
+
+    def flush():
+        for (shard, kind), lines in buffers.items():
+            with open(os.path.join(shards[shard], f"{kind}.jsonl"), 'a', encoding='utf-8') as spool:
+                spool.writelines(lines)
+        buffers.clear()
+
+    for kind in SHARDED_KINDS:
+        for row in inventory.records(kind):
+            shard = (row['account_id'], row['region'])
+            if shard not in shards:
+                shards[shard] = os.path.join(spool_dir, f"shard-{len(shards):05d}")
+                os.makedirs(shards[shard])
+            buffers.setdefault((shard, kind), []).append(json.dumps(row) + "\n")
+            buffered += 1
+            if buffered >= buffer_rows:
+                flush()
+                buffered = 0
+    flush()
+    return shards
+
+
+def _discover_shard(settings: dict, shard: tuple, directory: str) -> dict:
+    """Process-pool entry point: write one shard's resources and report what was written"""
+    started = time.monotonic()
+    simulator = AssetDiscoverySimulator(batch_size=settings['batch_size'], inventory=ShardInventory(directory),
+                                        update_tag=settings['update_tag'], chunk_log=settings['chunk_log'],
+                                        async_writes=settings['async_writes'])
+    simulator.current_phase.name = SHARDED_PHASE.name
+    try:
+        rows = {kind: simulator.ingest(kind) for kind in SHARDED_KINDS}
+        return {
+            'shard': shard,
+            'rows': rows,
+            'changed': dict(simulator.changed_counts),
+            'stats': simulator.stats.to_dict(),
+            'telemetry': simulator.telemetry.to_dict(),
+            'seconds': time.monotonic() - started
+        }
+    finally:
+        simulator.close()
+
+
+# Built-in demo estate, already in graph row shape
+DEMO_INVENTORY: Dict[str, List[dict]] = {
+    'accounts': [
+        {
+            'id': '123456789012',
+            'name': 'production-account',
+            'arn': 'arn:aws:organizations::123456789012:account/o-abc123defg/123456789012'
+        }
+    ],
+    'regions': [
+        {'name': 'us-east-1'},
+        {'name': 'us-west-2'},
+        {'name': 'eu-west-1'}
+    ],
+    'iam_users': [
+        {
+            'username': 'sarah.chen',
+            'userid': 'AIDACKCEVSQ6C2EXAMPLE',
+            'arn': 'arn:aws:iam::123456789012:user/sarah.chen',
+            'access_level': 'developer',
+            'mfa_enabled': True,
+            'last_activity': '2024-01-15'
+        },
+        {
+            'username': 'admin-service',
+            'userid': 'AIDACKCEVSQ6C3EXAMPLE',
+            'arn': 'arn:aws:iam::123456789012:user/admin-service',
+            'access_level': 'admin',
+            'mfa_enabled': False,
+            'last_activity': '2024-01-20'
+        },
+        {
+            'username': 'contractor.external',
+            'userid': 'AIDACKCEVSQ6C4EXAMPLE',
+            'arn': 'arn:aws:iam::123456789012:user/contractor.external',
+            'access_level': 'contractor',
+            'mfa_enabled': False,
+            'last_activity': '2024-01-10'
+        }
+    ],
+    'iam_roles': [
+        {
+            'name': 'EC2AdminRole',
+            'arn': 'arn:aws:iam::123456789012:role/EC2AdminRole',
+            'trust_policy': 'ec2.amazonaws.com,arn:aws:iam::123456789012:user/sarah.chen',
+            'max_session_duration': 3600,
+            'privilege_level': 'admin'
+        },
+        {
+            'name': 'LambdaExecutionRole',
+            'arn': 'arn:aws:iam::123456789012:role/LambdaExecutionRole',
+            'trust_policy': 'lambda.amazonaws.com',
+            'max_session_duration': 3600,
+            'privilege_level': 'service'
+        },
+        {
+            'name': 'CrossAccountAccessRole',
+            'arn': 'arn:aws:iam::123456789012:role/CrossAccountAccessRole',
+            'trust_policy': 'arn:aws:iam::999999999999:root',
+            'max_session_duration': 7200,
+            'privilege_level': 'cross-account'
+        }
+    ],
+    'vpcs': [
+        {
+            'id': 'vpc-0abc123def456789a',
+            'cidr_block': '10.0.0.0/16',
+            'is_default': False,
+            'state': 'available'
+        }
+    ],
+    'security_groups': [
+        {
+            'id': 'sg-0123456789abcdef0',
+            'name': 'web-servers',
+            'description': 'Security group for web servers',
+            **rule_columns([('tcp', 80, 80, '0.0.0.0/0'), ('tcp', 443, 443, '0.0.0.0/0')]),
+            'vpc_id': 'vpc-0abc123def456789a'
+        },
+        {
+            'id': 'sg-0fedcba987654321f',
+            'name': 'database-servers',
+            'description': 'Security group for database servers',
+            **rule_columns([('tcp', 3306, 3306, 'sg-0123456789abcdef0')]),
+            'vpc_id': 'vpc-0abc123def456789a'
+        },
+        {
+            'id': 'sg-0987654321fedcba0',
+            'name': 'admin-access',
+            'description': 'Administrative access',
+            **rule_columns([('tcp', 22, 22, '0.0.0.0/0')]),
+            'vpc_id': 'vpc-0abc123def456789a'
+        }
+    ],
+    'ec2_instances': [
+        {
+            'id': 'i-0123456789abcdef0',
+            'instance_type': 't3.medium',
+            'state': 'running',
+            'public_ip': '54.123.45.67',
+            'private_ip': '10.0.1.100',
+            'iam_instance_profile': 'EC2AdminRole',
+            'security_groups': 'sg-0123456789abcdef0,sg-0987654321fedcba0',
+            'vpc_id': 'vpc-0abc123def456789a'
+        },
+        {
+            'id': 'i-0fedcba987654321f',
+            'instance_type': 't3.large',
+            'state': 'running',
+            'public_ip': '',
+            'private_ip': '10.0.2.200',
+            'iam_instance_profile': '',
+            'security_groups': 'sg-0fedcba987654321f',
+            'vpc_id': 'vpc-0abc123def456789a'
+        }
+    ],
+    's3_buckets': [
+        {
+            'name': 'company-data-lake',
+            'arn': 'arn:aws:s3:::company-data-lake',
+            'public_read': False,
+            'public_write': False,
+            'encryption_enabled': True,
+            'versioning_enabled': True,
+            'contains_pii': True
+        },
+        {
+            'name': 'public-assets-bucket',
+            'arn': 'arn:aws:s3:::public-assets-bucket',
+            'public_read': True,
+            'public_write': False,
+            'encryption_enabled': False,
+            'versioning_enabled': False,
+            'contains_pii': False
+        },
+        {
+            'name': 'backup-storage-prod',
+            'arn': 'arn:aws:s3:::backup-storage-prod',
+            'public_read': False,
+            'public_write': False,
+            'encryption_enabled': True,
+            'versioning_enabled': True,
+            'contains_pii': True
+        }
+    ],
+    'lambda_functions': [
+        {
+            'name': 'user-authentication',
+            'arn': 'arn:aws:lambda:us-east-1:123456789012:function:user-authentication',
+            'runtime': 'nodejs18.x',
+            'role_arn': 'arn:aws:iam::123456789012:role/LambdaExecutionRole',
+            'environment_variables': '{"DB_HOST": "prod-db.cluster-xyz.us-east-1.rds.amazonaws.com", "API_KEY": "encrypted"}',
+            'has_vpc_access': True
+        },
+        {
+            'name': 'data-processor',
+            'arn': 'arn:aws:lambda:us-east-1:123456789012:function:data-processor',
+            'runtime': 'python3.9',
+            'role_arn': 'arn:aws:iam::123456789012:role/LambdaExecutionRole',
+            'environment_variables': '{"S3_BUCKET": "company-data-lake", "KMS_KEY": "arn:aws:kms:us-east-1:123456789012:key/12345678-1234-1234-1234-123456789012"}',
+            'has_vpc_access': False
+        }
+    ],
+    'api_gateways': [
+        {
+            'id': 'abc123defg',
+            'name': 'customer-api-gateway',
+            'stage': 'prod',
+            'endpoint_url': 'https://abc123defg.execute-api.us-east-1.amazonaws.com/prod',
+            'authentication': 'none',
+            'integrations': 'arn:aws:lambda:us-east-1:123456789012:function:user-authentication'
+        }
+    ],
+}
+
+
+class ProviderInventories:
+    """AWS inventory (demo estate by default) plus the optional Azure and Kubernetes exports"""
+
+    def __init__(self, inventory_path: Optional[str] = None, inventory: Optional[Inventory] = None,
+                 azure_inventory_path: Optional[str] = None, k8s_inventory_path: Optional[str] = None):
+        if inventory is None:
+            inventory = FileInventory(inventory_path) if inventory_path else DemoInventory()
+        self.inventory = inventory
+        # Other providers are only discovered when an export is given for them
+        self.azure_inventory = FileInventory(azure_inventory_path) if azure_inventory_path else None
+        self.k8s_inventory = FileInventory(k8s_inventory_path) if k8s_inventory_path else None
+
+    def inventory_for(self, kind: str) -> Optional[Inventory]:
+        """The inventory a resource type comes from; None for a provider without an export"""
+        if kind in AZURE_KINDS:
+            return self.azure_inventory
+        if kind in KUBERNETES_KINDS:
+            return self.k8s_inventory
+        return self.inventory
+
+    def derived_edges(self) -> Iterator[tuple]:
+        """Yield (source spec, target spec, relationship, properties, edges) for each applicable RELATIONSHIP_SPECS entry
+
+        `edges` lazily hash-joins the source rows against an index of the
+        target rows, yielding [source key, target key] pairs; consume it before
+        advancing. Each target index is built in one streaming pass and shared
+        by every edge type that joins against it, so derivation is linear in
+        the inventory.
+        """
+        indexes: Dict[tuple, Dict[str, List[str]]] = {}
+        for edge in RELATIONSHIP_SPECS:
+            source_inventory = self.inventory_for(edge.kind)
+            target_inventory = self.inventory_for(edge.target)
+            if source_inventory is None or target_inventory is None:
+                continue
+            index_key = (edge.target, edge.target_field)
+            if index_key not in indexes:
+                indexes[index_key] = build_key_index(target_inventory.records(edge.target),
+                                                     edge.target_field, NODE_SPECS[edge.target].key)
+            source, target = NODE_SPECS[edge.kind], NODE_SPECS[edge.target]
+            if edge.inbound:
+                source, target = target, source
+            yield source, target, edge.relationship, edge.properties, derive_edges(
+                source_inventory.records(edge.kind), edge, indexes[index_key])
+
+
+# Posture checks that are plain property conditions, evaluated where the graph lives
+POSTURE_RULES = (
+    RiskRule('S3Bucket', 'MEDIUM', 'Public access or unencrypted storage',
+             any_of={'public_read': True, 'encryption_enabled': False}),
+    RiskRule('IAMUser', 'HIGH', 'Privileged user without MFA',
+             all_of={'mfa_enabled': False, 'access_level': ('admin', 'contractor')}),
+)
+
+
+class AssetDiscoverySimulator(ProviderInventories):
+    def __init__(self, batch_size: int = DISCOVERY_BATCH_SIZE, inventory_path: Optional[str] = None,
+                 sweep: bool = True, phase_workers: int = DISCOVERY_PHASE_WORKERS,
+                 shard_workers: int = DISCOVERY_SHARD_WORKERS, inventory: Optional[Inventory] = None,
+                 update_tag: Optional[int] = None, azure_inventory_path: Optional[str] = None,
+                 k8s_inventory_path: Optional[str] = None, checkpoint_path: Optional[str] = None,
+                 telemetry_path: Optional[str] = None, chunk_log: Optional[str] = None,
+                 async_writes: int = DISCOVERY_ASYNC_WRITES,
+                 progress: Optional[Callable[[dict], None]] = None, sink: Optional[GraphSink] = None):
+        super().__init__(inventory_path, inventory, azure_inventory_path, k8s_inventory_path)
+        if sink is not None and shard_workers > 0:
+            # Shard processes open their own connections; an in-process graph cannot follow them
+            raise ValueError("Shard workers need the Neo4j sink; use shard_workers=0 with a custom sink")
+        # Managed transactions retry transient errors with exponential backoff for up to this long
+        self.sink = sink or Neo4jGraphSink(NEO4J_URI, (NEO4J_USER, NEO4J_PASSWORD), DISCOVERY_RETRY_SECONDS,
+                                           async_writes)
+        self.checkpoint = Checkpoint(checkpoint_path, [os.path.abspath(path) if path else None for path in
+                                                       (inventory_path, azure_inventory_path, k8s_inventory_path)])
         self.discovery_start = datetime.now()
+        self.batch_size = batch_size
+        self.sweep = sweep
+        self.phase_workers = phase_workers
+        self.shard_workers = shard_workers
+        # Every node written by this run carries this tag; older tags are stale
+        self.update_tag = update_tag or self.checkpoint.state['update_tag'] or int(time.time())
+        self.checkpoint.state['update_tag'] = self.update_tag
+        self.changed_counts: Dict[str, int] = {}
+        self.stats = DiscoveryStats()
+        # Shard processes append to the coordinator's chunk log rather than truncating it
+        self.telemetry = DiscoveryTelemetry(chunk_log, truncate=inventory is None)
+        self.telemetry_path = telemetry_path
+        self.chunk_log = chunk_log
+        self.current_phase = threading.local()  # .name: the phase running on this thread
+        self.async_writes = async_writes
+        # Receives a dict per phase start and end, e.g. for the discovery service's event streams
+        self.progress = progress
+        self._progress_lock = threading.Lock()
+        self._completed_phases = 0
         
     def close(self):
-        self.driver.close()
+        self.telemetry.close()
+        self.sink.close()
+    
+    def write(self, operation: str, *args) -> dict:
+        """Run one sink operation (see GraphSink) and return its first record
+
+        The Neo4j sink runs it as a managed write transaction, which the driver
+        retries on transient errors, lost connections and leader changes.
+        """
+        return self._execute(operation, args)
+    
+    def _execute(self, operation: str, args: tuple, unit: Optional[str] = None, rows: int = 0) -> dict:
+        started = time.monotonic()
+        record, summary = getattr(self.sink, operation)(*args)
+        self._count(unit, rows, summary, time.monotonic() - started)
+        return record
+    
+    def _count(self, unit: Optional[str], rows: int, summary, seconds: float):
+        self.stats.count_writes(summary)
+        self.telemetry.record(getattr(self.current_phase, 'name', None) or 'setup', unit, rows, summary, seconds)
+    
+    def write_chunks(self, unit: str, items: Iterable, operation: str, *args):
+        """Write `items` in batch_size chunks, one sink operation each, yielding (chunk size, record)
+
+        Each chunk is passed as the operation's last argument. Chunks a
+        previous attempt committed (per the checkpoint) are skipped without
+        being sent; every newly committed chunk advances it.
+        """
+        committed = self.checkpoint.offset(unit)
+        if committed:
+            items = islice(items, committed, None)
+        if self.sink.pipelined:
+            yield from self._write_chunks_pipelined(unit, items, operation, args)
+            return
+        for chunk in chunked(items, self.batch_size):
+            record = self._execute(operation, (*args, chunk), unit, len(chunk))
+            self.checkpoint.advance(unit, len(chunk))
+            yield len(chunk), record
+    
+    def _write_chunks_pipelined(self, unit: str, items: Iterable, operation: str, args: tuple):
+        """write_chunks for sinks with batches in flight: keep preparing chunks while earlier ones are written
+
+        Chunks may commit out of order, so the checkpoint only advances over
+        the leading run of committed chunks; a resumed run redoes at most the
+        chunks that were in flight, which the idempotent MERGEs absorb.
+        """
+        pending: Dict[Future, tuple] = {}  # future -> (sequence, rows)
+        committed: Dict[int, int] = {}     # sequence -> rows, for chunks after a gap
+        next_sequence = 0
+
+        def collect(futures):
+            nonlocal next_sequence
+            for future in futures:
+                sequence, rows = pending.pop(future)
+                record, summary, seconds = future.result()
+                self._count(unit, rows, summary, seconds)
+                committed[sequence] = rows
+                while next_sequence in committed:
+                    self.checkpoint.advance(unit, committed.pop(next_sequence))
+                    next_sequence += 1
+                yield rows, record
+
+        try:
+            for sequence, chunk in enumerate(chunked(items, self.batch_size)):
+                future = self.sink.submit(operation, *args, chunk)
+                pending[future] = (sequence, len(chunk))
+                yield from collect([future for future in list(pending) if future.done()])
+            while pending:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                yield from collect(done)
+        finally:
+            # On error, let batches already submitted settle before the caller moves on
+            wait(pending)
+    
+    def ingest(self, kind: str) -> int:
+        """Write every resource of one inventory type in UNWIND chunks, returning the row count"""
+        spec = NODE_SPECS[kind]
+        rows = (prepare_row(row, spec) for row in self.inventory_for(kind).records(kind))
+        written = self.checkpoint.offset(kind)
+        changed = dangling = 0
+        for size, record in self.write_chunks(kind, rows, 'write_nodes', spec, self.update_tag):
+            written += size
+            changed += record.get('changed', 0)
+            dangling += record.get('dangling', 0)
+        self.changed_counts[kind] = changed
+        self.stats.count_assets(spec.label, written)
+        self.stats.count_dangling(spec.label, dangling)
+        return written
+    
+    def sweep_stale_resources(self):
+        """Delete resources whose update_tag was not refreshed by this run, in batches"""
+        changed = sum(self.changed_counts.values())
+        deleted = 0
+        # Every type whose inventory was given, including types a resumed run skipped
+        for kind, spec in NODE_SPECS.items():
+            if self.inventory_for(kind) is not None:
+                deleted += self.delete_in_batches('sweep_nodes', spec)
+        
+        report(f"   ✅ {changed} new or changed resources written, {deleted} stale resources removed")
+    
+    def delete_in_batches(self, operation: str, *args) -> int:
+        """Run a batch_size-limited sweep operation until a batch comes back short; returns the total"""
+        deleted = 0
+        while True:
+            record = self.write(operation, *args, self.update_tag, self.batch_size)
+            batch = record.get('deleted', 0)
+            deleted += batch
+            if batch < self.batch_size:
+                return deleted
     
     def run_discovery_simulation(self):
         """Main discovery simulation workflow"""
         print("🔍 Starting Cartography-style asset discovery simulation...")
         print("=" * 60)
+        started = time.monotonic()
+        if self.checkpoint.resumed:
+            print(f"♻️ Resuming run {self.update_tag} from {self.checkpoint.path}")
+        self.ensure_schema()
         
-        # Phase 1: AWS Account and Region Discovery
-        print("📍 Phase 1: Discovering AWS accounts and regions...")
-        self.discover_aws_foundation()
-        time.sleep(2)
-        
-        # Phase 2: IAM Infrastructure Discovery
-        print("🔐 Phase 2: Discovering IAM users, roles, and policies...")
-        self.discover_iam_infrastructure()
-        time.sleep(3)
-        
-        # Phase 3: Compute and Network Discovery
-        print("💻 Phase 3: Discovering EC2 instances and networking...")
-        self.discover_compute_network()
-        time.sleep(2)
-        
-        # Phase 4: Storage and Database Discovery
-        print("🗄️ Phase 4: Discovering storage and database resources...")
-        self.discover_storage_databases()
-        time.sleep(2)
-        
-        # Phase 5: Serverless and API Discovery
-        print("⚡ Phase 5: Discovering Lambda functions and API Gateways...")
-        self.discover_serverless_apis()
-        time.sleep(2)
-        
-        # Phase 6: Cross-Service Relationship Discovery
-        print("🔗 Phase 6: Discovering cross-service relationships...")
-        self.discover_relationships()
-        time.sleep(2)
-        
-        # Phase 7: Security Analysis
-        print("🛡️ Phase 7: Analyzing security configurations...")
-        self.analyze_security_posture()
+        skipped = {'sweep'} if not self.sweep else set()
+        if self.azure_inventory is None:
+            skipped.add('azure')
+        if self.k8s_inventory is None:
+            skipped.add('kubernetes')
+        phases = [phase for phase in DISCOVERY_PHASES if phase.name not in skipped]
+        if self.shard_workers > 0:
+            phases = [phase for phase in phases if phase.name not in NODE_PHASES]
+            phases.insert(1, SHARDED_PHASE)
+        self.publish('plan', phases=[phase.name for phase in phases], total_phases=len(phases))
+        self.run_phases(phases)
         
         print("=" * 60)
-        print("✅ Asset discovery simulation complete!")
+        seconds = time.monotonic() - started
+        print(f"✅ Asset discovery simulation complete! ({seconds:.1f}s)")
         self.print_discovery_summary()
+        self.publish('summary', seconds=round(seconds, 3))
+        if self.telemetry_path:
+            self.write_telemetry_report(seconds)
+    
+    def publish(self, event: str, **fields):
+        """Send a progress event with the running totals to the progress callback, if any"""
+        if self.progress is None:
+            return
+        stats = self.stats.to_dict()
+        with self._progress_lock:
+            completed = self._completed_phases
+        self.progress({'type': event, **fields, 'completed_phases': completed,
+                       'assets': sum(stats['assets'].values()),
+                       'relationships': stats['writes'].get('relationships_created', 0),
+                       'risks': sum(stats['risks'].values())})
+    
+    def _phase_done(self, phase: DiscoveryPhase, status: str, seconds: float = 0.0):
+        with self._progress_lock:
+            self._completed_phases += 1
+        self.publish('phase', phase=phase.name, banner=phase.banner, status=status, seconds=round(seconds, 3))
+    
+    def write_telemetry_report(self, seconds: float):
+        """Write the per-phase telemetry as JSON to telemetry_path"""
+        telemetry = self.telemetry.report(update_tag=self.update_tag, batch_size=self.batch_size,
+                                          phase_workers=self.phase_workers, shard_workers=self.shard_workers,
+                                          seconds=round(seconds, 3))
+        with open(self.telemetry_path, 'w', encoding='utf-8') as output:
+            json.dump(telemetry, output, indent=2)
+        print(f"\n⏱️ Phase telemetry written to {self.telemetry_path}")
+        for phase, totals in telemetry['phases'].items():
+            print(f"   {phase}: {totals['seconds']:.2f}s, {totals['rows']} rows in {totals['statements']} statements")
+    
+    def ensure_schema(self):
+        """Create the uniqueness constraints and indexes that keep MERGE and lookups off label scans"""
+        self.sink.ensure_schema(NODE_SPECS.values())
+        report("🗂️ Schema ready: identity constraints and lookup indexes in place")
+    
+    def run_phases(self, phases: List[DiscoveryPhase]):
+        """Run phases on a thread pool, starting each as soon as the phases it requires finish
+
+        Phases share the sink, which must accept writes from several threads. Requirements on phases
+        that are not in the list (e.g. a disabled sweep) are ignored.
+        """
+        names = {phase.name for phase in phases}
+        pending = {phase.name: phase for phase in phases}
+        finished = set()
+        running = {}
+        with ThreadPoolExecutor(max_workers=max(1, self.phase_workers),
+                                thread_name_prefix='discovery') as pool:
+            while pending or running:
+                for name, phase in list(pending.items()):
+                    if names.intersection(phase.requires) <= finished:
+                        running[pool.submit(self._run_phase, phase)] = name
+                        del pending[name]
+                if not running:
+                    raise RuntimeError(f"Discovery phases have circular requirements: {sorted(pending)}")
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    name = running.pop(future)
+                    future.result()  # re-raise the phase's exception, if any
+                    finished.add(name)
+    
+    def _run_phase(self, phase: DiscoveryPhase):
+        if self.checkpoint.finished(phase.name):
+            report(f"⏭️ {phase.name}: already completed by the interrupted run")
+            self._phase_done(phase, 'skipped')
+            return
+        report(phase.banner)
+        self.publish('phase', phase=phase.name, banner=phase.banner, status='started')
+        self.current_phase.name = phase.name
+        started = time.monotonic()
+        try:
+            getattr(self, phase.method)()
+        finally:
+            self.telemetry.time_phase(phase.name, time.monotonic() - started)
+            self.current_phase.name = None
+        self.checkpoint.finish(phase.name)
+        self._phase_done(phase, 'finished', time.monotonic() - started)
+    
+    def security_group_exposure(self) -> List[dict]:
+        """Evaluate every security group's ingress rules at once and return the flags to write
+
+        Rules come from the inventory rows already parsed at ingest, so the
+        graph is only written to, never scanned.
+        """
+        flags = evaluate_exposure(self.inventory.records('security_groups'))
+        risk = np.where(flags.internet_open, 'HIGH',
+                        np.where(flags.reachable_from_internet_group, 'MEDIUM', ''))
+        reason = np.select(
+            [flags.admin_ports_open, flags.internet_open, flags.reachable_from_internet_group],
+            ['Administrative ports open to the internet', 'Allows inbound traffic from internet',
+             'Admits traffic from an internet-open security group'],
+            default='')
+        return [{
+            'id': group_id,
+            'internet_open': bool(flags.internet_open[i]),
+            'admin_ports_open': bool(flags.admin_ports_open[i]),
+            'reachable_from_internet_group': bool(flags.reachable_from_internet_group[i]),
+            'security_risk': str(risk[i]) or None,
+            'risk_reason': str(reason[i]) or None
+        } for i, group_id in enumerate(flags.group_ids)]
     
     def discover_aws_foundation(self):
         """Discover AWS accounts and regions"""
-        with self.driver.session() as session:
-            # Discover AWS Account
-            session.run("""
-                MERGE (account:AWSAccount {
-                    id: '123456789012',
-                    name: 'production-account',
-                    arn: 'arn:aws:organizations::123456789012:account/o-abc123defg/123456789012',
-                    discovered_via_cartography: true,
-                    discovery_time: datetime(),
-                    cartography_lastupdated: datetime()
-                })
-            """)
-            
-            # Discover Regions
-            regions = ['us-east-1', 'us-west-2', 'eu-west-1']
-            for region in regions:
-                session.run("""
-                    MERGE (region:AWSRegion {
-                        name: $region,
-                        discovered_via_cartography: true,
-                        discovery_time: datetime(),
-                        cartography_lastupdated: datetime()
-                    })
-                    WITH region
-                    MATCH (account:AWSAccount {id: '123456789012'})
-                    MERGE (account)-[:CONTAINS_REGION]->(region)
-                """, region=region)
-            
-            print("   ✅ Discovered 1 AWS account and 3 regions")
+        accounts = self.ingest('accounts')
+        regions = self.ingest('regions')
+        
+        report(f"   ✅ Discovered {accounts} AWS account and {regions} regions")
+    
+    def discover_shards(self):
+        """Fan the node phases out over (account, region) shards on a process pool
+
+        The coordinator spools each shard's rows to disk in one pass, then every
+        worker process opens its own driver and writes its shard through the
+        usual batched statements. Per-shard summaries are merged here.
+        """
+        spool_dir = tempfile.mkdtemp(prefix='discovery-shards-')
+        try:
+            shards = spool_shards(self.inventory, spool_dir)
+            # Checkpointing is per shard: a shard either committed completely or is redone
+            done = [shard for shard in shards if self.checkpoint.offset("shard:%s/%s" % shard)]
+            for shard in done:
+                del shards[shard]
+            if done:
+                report(f"   ⏭️ {len(done)} shards already completed by the interrupted run")
+            report(f"   🧩 {len(shards)} shards across {self.shard_workers} worker processes")
+            settings = {'batch_size': self.batch_size, 'update_tag': self.update_tag,
+                        'chunk_log': self.chunk_log, 'async_writes': self.async_writes}
+            totals: Dict[str, int] = {}
+            changed: Dict[str, int] = {}
+            with ProcessPoolExecutor(max_workers=self.shard_workers) as pool:
+                futures = [pool.submit(_discover_shard, settings, shard, directory)
+                           for shard, directory in shards.items()]
+                for future in as_completed(futures):
+                    summary = future.result()
+                    for kind, count in summary['rows'].items():
+                        totals[kind] = totals.get(kind, 0) + count
+                    for kind, count in summary['changed'].items():
+                        changed[kind] = changed.get(kind, 0) + count
+                    self.stats.merge(summary['stats'])
+                    self.telemetry.merge(summary['telemetry'])
+                    account_id, region = summary['shard']
+                    self.checkpoint.advance(f"shard:{account_id}/{region}", 1)
+                    report(f"   ✅ {account_id}/{region}: {sum(summary['rows'].values())} resources "
+                           f"in {summary['seconds']:.1f}s")
+        finally:
+            shutil.rmtree(spool_dir, ignore_errors=True)
+        
+        self.changed_counts.update(changed)
+        report("   ✅ Discovered " + ", ".join(f"{count} {NODE_SPECS[kind].label}"
+                                             for kind, count in totals.items() if count))
     
     def discover_iam_infrastructure(self):
         """Discover IAM users, roles, groups, and policies"""
-        with self.driver.session() as session:
-            # IAM Users
-            iam_users = [
-                {
-                    'username': 'sarah.chen',
-                    'userid': 'AIDACKCEVSQ6C2EXAMPLE',
-                    'arn': 'arn:aws:iam::123456789012:user/sarah.chen',
-                    'access_level': 'developer',
-                    'mfa_enabled': True,
-                    'last_activity': '2024-01-15'
-                },
-                {
-                    'username': 'admin-service',
-                    'userid': 'AIDACKCEVSQ6C3EXAMPLE',
-                    'arn': 'arn:aws:iam::123456789012:user/admin-service',
-                    'access_level': 'admin',
-                    'mfa_enabled': False,
-                    'last_activity': '2024-01-20'
-                },
-                {
-                    'username': 'contractor.external',
-                    'userid': 'AIDACKCEVSQ6C4EXAMPLE',
-                    'arn': 'arn:aws:iam::123456789012:user/contractor.external',
-                    'access_level': 'contractor',
-                    'mfa_enabled': False,
-                    'last_activity': '2024-01-10'
-                }
-            ]
-            
-            for user in iam_users:
-                session.run("""
-                    MERGE (user:IAMUser {
-                        username: $username,
-                        userid: $userid,
-                        arn: $arn,
-                        access_level: $access_level,
-                        mfa_enabled: $mfa_enabled,
-                        last_activity: $last_activity,
-                        discovered_via_cartography: true,
-                        discovery_time: datetime(),
-                        cartography_lastupdated: datetime()
-                    })
-                    WITH user
-                    MATCH (account:AWSAccount {id: '123456789012'})
-                    MERGE (account)-[:CONTAINS_USER]->(user)
-                """, **user)
-            
-            # IAM Roles
-            iam_roles = [
-                {
-                    'name': 'EC2AdminRole',
-                    'arn': 'arn:aws:iam::123456789012:role/EC2AdminRole',
-                    'trust_policy': 'ec2.amazonaws.com',
-                    'max_session_duration': 3600,
-                    'privilege_level': 'admin'
-                },
-                {
-                    'name': 'LambdaExecutionRole',
-                    'arn': 'arn:aws:iam::123456789012:role/LambdaExecutionRole',
-                    'trust_policy': 'lambda.amazonaws.com',
-                    'max_session_duration': 3600,
-                    'privilege_level': 'service'
-                },
-                {
-                    'name': 'CrossAccountAccessRole',
-                    'arn': 'arn:aws:iam::123456789012:role/CrossAccountAccessRole',
-                    'trust_policy': 'arn:aws:iam::999999999999:root',
-                    'max_session_duration': 7200,
-                    'privilege_level': 'cross-account'
-                }
-            ]
-            
-            for role in iam_roles:
-                session.run("""
-                    MERGE (role:IAMRole {
-                        name: $name,
-                        arn: $arn,
-                        trust_policy: $trust_policy,
-                        max_session_duration: $max_session_duration,
-                        privilege_level: $privilege_level,
-                        discovered_via_cartography: true,
-                        discovery_time: datetime(),
-                        cartography_lastupdated: datetime()
-                    })
-                    WITH role
-                    MATCH (account:AWSAccount {id: '123456789012'})
-                    MERGE (account)-[:CONTAINS_ROLE]->(role)
-                """, **role)
-            
-            print(f"   ✅ Discovered {len(iam_users)} IAM users and {len(iam_roles)} IAM roles")
+        users = self.ingest('iam_users')
+        roles = self.ingest('iam_roles')
+        
+        report(f"   ✅ Discovered {users} IAM users and {roles} IAM roles")
     
     def discover_compute_network(self):
         """Discover EC2 instances, VPCs, and security groups"""
-        with self.driver.session() as session:
-            # VPC Discovery
-            session.run("""
-                MERGE (vpc:VPC {
-                    id: 'vpc-0abc123def456789a',
-                    cidr_block: '10.0.0.0/16',
-                    is_default: false,
-                    state: 'available',
-                    discovered_via_cartography: true,
-                    discovery_time: datetime(),
-                    cartography_lastupdated: datetime()
-                })
-                WITH vpc
-                MATCH (account:AWSAccount {id: '123456789012'})
-                MERGE (account)-[:CONTAINS_VPC]->(vpc)
-            """)
-            
-            # Security Groups
-            security_groups = [
-                {
-                    'id': 'sg-0123456789abcdef0',
-                    'name': 'web-servers',
-                    'description': 'Security group for web servers',
-                    'ingress_rules': '[{"port": 80, "protocol": "tcp", "source": "0.0.0.0/0"}, {"port": 443, "protocol": "tcp", "source": "0.0.0.0/0"}]'
-                },
-                {
-                    'id': 'sg-0fedcba987654321f',
-                    'name': 'database-servers',
-                    'description': 'Security group for database servers',
-                    'ingress_rules': '[{"port": 3306, "protocol": "tcp", "source": "sg-0123456789abcdef0"}]'
-                },
-                {
-                    'id': 'sg-0987654321fedcba0',
-                    'name': 'admin-access',
-                    'description': 'Administrative access',
-                    'ingress_rules': '[{"port": 22, "protocol": "tcp", "source": "0.0.0.0/0"}]'
-                }
-            ]
-            
-            for sg in security_groups:
-                session.run("""
-                    MERGE (sg:SecurityGroup {
-                        id: $id,
-                        name: $name,
-                        description: $description,
-                        ingress_rules: $ingress_rules,
-                        discovered_via_cartography: true,
-                        discovery_time: datetime(),
-                        cartography_lastupdated: datetime()
-                    })
-                    WITH sg
-                    MATCH (vpc:VPC {id: 'vpc-0abc123def456789a'})
-                    MERGE (vpc)-[:CONTAINS_SECURITY_GROUP]->(sg)
-                """, **sg)
-            
-            # EC2 Instances
-            ec2_instances = [
-                {
-                    'id': 'i-0123456789abcdef0',
-                    'instance_type': 't3.medium',
-                    'state': 'running',
-                    'public_ip': '54.123.45.67',
-                    'private_ip': '10.0.1.100',
-                    'iam_instance_profile': 'EC2AdminRole',
-                    'security_groups': 'sg-0123456789abcdef0,sg-0987654321fedcba0'
-                },
-                {
-                    'id': 'i-0fedcba987654321f',
-                    'instance_type': 't3.large',
-                    'state': 'running',
-                    'public_ip': '',
-                    'private_ip': '10.0.2.200',
-                    'iam_instance_profile': '',
-                    'security_groups': 'sg-0fedcba987654321f'
-                }
-            ]
-            
-            for instance in ec2_instances:
-                session.run("""
-                    MERGE (instance:EC2Instance {
-                        id: $id,
-                        instance_type: $instance_type,
-                        state: $state,
-                        public_ip: $public_ip,
-                        private_ip: $private_ip,
-                        iam_instance_profile: $iam_instance_profile,
-                        security_groups: $security_groups,
-                        discovered_via_cartography: true,
-                        discovery_time: datetime(),
-                        cartography_lastupdated: datetime()
-                    })
-                    WITH instance
-                    MATCH (vpc:VPC {id: 'vpc-0abc123def456789a'})
-                    MERGE (vpc)-[:CONTAINS_INSTANCE]->(instance)
-                """, **instance)
-            
-            print(f"   ✅ Discovered 1 VPC, {len(security_groups)} security groups, and {len(ec2_instances)} EC2 instances")
+        # VPCs first so security groups and instances can attach to them
+        vpcs = self.ingest('vpcs')
+        security_groups = self.ingest('security_groups')
+        instances = self.ingest('ec2_instances')
+        
+        report(f"   ✅ Discovered {vpcs} VPC, {security_groups} security groups, and {instances} EC2 instances")
     
     def discover_storage_databases(self):
         """Discover S3 buckets and RDS instances"""
-        with self.driver.session() as session:
-            # S3 Buckets
-            s3_buckets = [
-                {
-                    'name': 'company-data-lake',
-                    'arn': 'arn:aws:s3:::company-data-lake',
-                    'public_read': False,
-                    'public_write': False,
-                    'encryption_enabled': True,
-                    'versioning_enabled': True,
-                    'contains_pii': True
-                },
-                {
-                    'name': 'public-assets-bucket',
-                    'arn': 'arn:aws:s3:::public-assets-bucket',
-                    'public_read': True,
-                    'public_write': False,
-                    'encryption_enabled': False,
-                    'versioning_enabled': False,
-                    'contains_pii': False
-                },
-                {
-                    'name': 'backup-storage-prod',
-                    'arn': 'arn:aws:s3:::backup-storage-prod',
-                    'public_read': False,
-                    'public_write': False,
-                    'encryption_enabled': True,
-                    'versioning_enabled': True,
-                    'contains_pii': True
-                }
-            ]
-            
-            for bucket in s3_buckets:
-                session.run("""
-                    MERGE (bucket:S3Bucket {
-                        name: $name,
-                        arn: $arn,
-                        public_read: $public_read,
-                        public_write: $public_write,
-                        encryption_enabled: $encryption_enabled,
-                        versioning_enabled: $versioning_enabled,
-                        contains_pii: $contains_pii,
-                        discovered_via_cartography: true,
-                        discovery_time: datetime(),
-                        cartography_lastupdated: datetime()
-                    })
-                    WITH bucket
-                    MATCH (account:AWSAccount {id: '123456789012'})
-                    MERGE (account)-[:CONTAINS_BUCKET]->(bucket)
-                """, **bucket)
-            
-            print(f"   ✅ Discovered {len(s3_buckets)} S3 buckets")
+        buckets = self.ingest('s3_buckets')
+        
+        report(f"   ✅ Discovered {buckets} S3 buckets")
     
     def discover_serverless_apis(self):
         """Discover Lambda functions and API Gateways"""
-        with self.driver.session() as session:
-            # Lambda Functions
-            lambda_functions = [
-                {
-                    'name': 'user-authentication',
-                    'arn': 'arn:aws:lambda:us-east-1:123456789012:function:user-authentication',
-                    'runtime': 'nodejs18.x',
-                    'role_arn': 'arn:aws:iam::123456789012:role/LambdaExecutionRole',
-                    'environment_variables': '{"DB_HOST": "prod-db.cluster-xyz.us-east-1.rds.amazonaws.com", "API_KEY": "encrypted"}',
-                    'has_vpc_access': True
-                },
-                {
-                    'name': 'data-processor',
-                    'arn': 'arn:aws:lambda:us-east-1:123456789012:function:data-processor',
-                    'runtime': 'python3.9',
-                    'role_arn': 'arn:aws:iam::123456789012:role/LambdaExecutionRole',
-                    'environment_variables': '{"S3_BUCKET": "company-data-lake", "KMS_KEY": "arn:aws:kms:us-east-1:123456789012:key/12345678-1234-1234-1234-123456789012"}',
-                    'has_vpc_access': False
-                }
-            ]
-            
-            for func in lambda_functions:
-                session.run("""
-                    MERGE (lambda:LambdaFunction {
-                        name: $name,
-                        arn: $arn,
-                        runtime: $runtime,
-                        role_arn: $role_arn,
-                        environment_variables: $environment_variables,
-                        has_vpc_access: $has_vpc_access,
-                        discovered_via_cartography: true,
-                        discovery_time: datetime(),
-                        cartography_lastupdated: datetime()
-                    })
-                    WITH lambda
-                    MATCH (account:AWSAccount {id: '123456789012'})
-                    MERGE (account)-[:CONTAINS_LAMBDA]->(lambda)
-                """, **func)
-            
-            # API Gateways
-            session.run("""
-                MERGE (api:APIGateway {
-                    id: 'abc123defg',
-                    name: 'customer-api-gateway',
-                    stage: 'prod',
-                    endpoint_url: 'https://abc123defg.execute-api.us-east-1.amazonaws.com/prod',
-                    authentication: 'none',
-                    discovered_via_cartography: true,
-                    discovery_time: datetime(),
-                    cartography_lastupdated: datetime()
-                })
-                WITH api
-                MATCH (account:AWSAccount {id: '123456789012'})
-                MERGE (account)-[:CONTAINS_API]->(api)
-            """)
-            
-            print(f"   ✅ Discovered {len(lambda_functions)} Lambda functions and 1 API Gateway")
+        functions = self.ingest('lambda_functions')
+        apis = self.ingest('api_gateways')
+        
+        report(f"   ✅ Discovered {functions} Lambda functions and {apis} API Gateway")
+    
+    def discover_azure(self):
+        """Discover Azure subscriptions, Entra ID identities and resource group contents"""
+        counts = {kind: self.ingest(kind) for kind in AZURE_KINDS}
+        
+        report(f"   ✅ Discovered {counts['azure_subscriptions']} Azure subscriptions, "
+               f"{counts['azure_ad_users']} AD users and "
+               f"{sum(counts.values()) - counts['azure_subscriptions'] - counts['azure_ad_users']} other resources")
+    
+    def discover_kubernetes(self):
+        """Discover Kubernetes clusters, workloads, RBAC objects and images"""
+        counts = {kind: self.ingest(kind) for kind in KUBERNETES_KINDS}
+        
+        rbac = sum(counts[kind] for kind in ('k8s_roles', 'k8s_role_bindings', 'k8s_cluster_roles',
+                                             'k8s_cluster_role_bindings'))
+        report(f"   ✅ Discovered {counts['k8s_clusters']} Kubernetes clusters, {counts['k8s_pods']} pods "
+               f"and {rbac} RBAC objects")
     
     def discover_relationships(self):
-        """Discover relationships between resources"""
-        with self.driver.session() as session:
-            # IAM User -> Role assumptions
-            session.run("""
-                MATCH (user:IAMUser {username: 'sarah.chen'})
-                MATCH (role:IAMRole {name: 'EC2AdminRole'})
-                MERGE (user)-[:CAN_ASSUME_ROLE {
-                    discovered_via_cartography: true,
-                    discovery_time: datetime()
-                }]->(role)
-            """)
-            
-            # EC2 Instance -> IAM Role
-            session.run("""
-                MATCH (instance:EC2Instance {id: 'i-0123456789abcdef0'})
-                MATCH (role:IAMRole {name: 'EC2AdminRole'})
-                MERGE (instance)-[:HAS_INSTANCE_PROFILE {
-                    discovered_via_cartography: true,
-                    discovery_time: datetime()
-                }]->(role)
-            """)
-            
-            # Lambda -> IAM Role
-            session.run("""
-                MATCH (lambda:LambdaFunction)
-                MATCH (role:IAMRole {name: 'LambdaExecutionRole'})
-                MERGE (lambda)-[:EXECUTES_WITH_ROLE {
-                    discovered_via_cartography: true,
-                    discovery_time: datetime()
-                }]->(role)
-            """)
-            
-            # API Gateway -> Lambda
-            session.run("""
-                MATCH (api:APIGateway {name: 'customer-api-gateway'})
-                MATCH (lambda:LambdaFunction {name: 'user-authentication'})
-                MERGE (api)-[:INVOKES {
-                    discovered_via_cartography: true,
-                    discovery_time: datetime()
-                }]->(lambda)
-            """)
-            
-            # Lambda -> S3 access
-            session.run("""
-                MATCH (lambda:LambdaFunction {name: 'data-processor'})
-                MATCH (bucket:S3Bucket {name: 'company-data-lake'})
-                MERGE (lambda)-[:CAN_ACCESS {
-                    permissions: 'read,write',
-                    discovered_via_cartography: true,
-                    discovery_time: datetime()
-                }]->(bucket)
-            """)
-            
-            print("   ✅ Discovered cross-service relationships and permissions")
+        """Derive cross-service relationships by joining inventory references against in-memory key indexes
+
+        Edges are written as UNWIND lists of [source key, target key] pairs,
+        one statement per relationship type, and matched on the constrained
+        identity keys; no edge needs a label-wide MATCH.
+        """
+        written: Dict[str, int] = {}
+        seen = []
+        for position, (source, target, relationship, properties, edges) in enumerate(self.derived_edges()):
+            for _, record in self.write_chunks(f"relationships:{position}:{relationship}", edges,
+                                               'write_relationships', source, target, relationship,
+                                               properties, self.update_tag):
+                written[relationship] = written.get(relationship, 0) + record.get('written', 0)
+            if (source, target, relationship) not in seen:
+                seen.append((source, target, relationship))
+        
+        deleted = 0
+        if self.sweep:
+            for source, target, relationship in seen:
+                deleted += self.delete_in_batches('sweep_relationships', source, target, relationship)
+        
+        report("   ✅ Discovered " + (", ".join(f"{count} {relationship}" for relationship, count in written.items()
+                                               if count) or "no") + " cross-service relationships"
+               + (f", {deleted} stale removed" if deleted else ""))
     
     def analyze_security_posture(self):
         """Analyze discovered infrastructure for security issues"""
-        with self.driver.session() as session:
-            # Mark high-risk configurations
-            session.run("""
-                MATCH (sg:SecurityGroup)
-                WHERE sg.ingress_rules CONTAINS '"source": "0.0.0.0/0"'
-                SET sg.security_risk = 'HIGH',
-                    sg.risk_reason = 'Allows inbound traffic from internet',
-                    sg.risk_analysis_time = datetime()
-            """)
-            
-            session.run("""
-                MATCH (bucket:S3Bucket)
-                WHERE bucket.public_read = true OR bucket.encryption_enabled = false
-                SET bucket.security_risk = 'MEDIUM',
-                    bucket.risk_reason = 'Public access or unencrypted storage',
-                    bucket.risk_analysis_time = datetime()
-            """)
-            
-            session.run("""
-                MATCH (user:IAMUser)
-                WHERE user.mfa_enabled = false AND user.access_level IN ['admin', 'contractor']
-                SET user.security_risk = 'HIGH',
-                    user.risk_reason = 'Privileged user without MFA',
-                    user.risk_analysis_time = datetime()
-            """)
-            
-            print("   ✅ Completed security posture analysis")
+        groups = self.security_group_exposure()
+        # Flags for every group are written back, so fixed groups lose their risk
+        written = sum(size for size, _ in self.write_chunks('security_groups:flags', groups, 'update_flags',
+                                                            'SecurityGroup', 'id'))
+        risks = Counter(group['security_risk'] for group in groups if group['security_risk'])
+        report(f"   🛡️ Flagged {sum(risks.values())} of {len(groups)} security groups ({written} flag rows written)")
+        for level, count in risks.items():
+            self.stats.count_risk(level, count)
+        
+        for rule in POSTURE_RULES:
+            record = self.write('flag_matching', rule)
+            self.stats.count_risk(rule.level, record.get('flagged', 0))
+        
+        report("   ✅ Completed security posture analysis")
     
     def print_discovery_summary(self):
-        """Print summary of discovered assets"""
-        with self.driver.session() as session:
-            # Count discovered assets
-            result = session.run("""
-                MATCH (n)
-                WHERE n.discovered_via_cartography = true
-                RETURN labels(n)[0] as AssetType, count(n) as Count
-                ORDER BY Count DESC
-            """)
-            
-            print("📊 Discovery Summary:")
-            print("-" * 30)
-            total_assets = 0
-            for record in result:
-                asset_type = record["AssetType"]
-                count = record["Count"]
-                total_assets += count
+        """Print summary of discovered assets from the counts gathered while writing"""
+        stats = self.stats.to_dict()
+        writes = stats['writes']
+        
+        print("📊 Discovery Summary:")
+        print("-" * 30)
+        for asset_type, count in sorted(stats['assets'].items(), key=lambda item: -item[1]):
+            if count:
                 print(f"   {asset_type}: {count}")
-            
-            print("-" * 30)
-            print(f"   Total Assets: {total_assets}")
-            
-            # Count relationships
-            rel_result = session.run("""
-                MATCH ()-[r]->()
-                WHERE r.discovered_via_cartography = true
-                RETURN count(r) as RelationshipCount
-            """)
-            
-            rel_count = rel_result.single()["RelationshipCount"]
-            print(f"   Relationships: {rel_count}")
-            
-            # Security risks
-            risk_result = session.run("""
-                MATCH (n)
-                WHERE n.security_risk IS NOT NULL
-                RETURN n.security_risk as RiskLevel, count(n) as Count
-                ORDER BY Count DESC
-            """)
-            
-            print("\n🔍 Security Analysis:")
-            print("-" * 30)
-            for record in risk_result:
-                risk_level = record["RiskLevel"]
-                count = record["Count"]
-                print(f"   {risk_level} Risk: {count} assets")
+        
+        print("-" * 30)
+        print(f"   Total Assets: {sum(stats['assets'].values())}")
+        print(f"   New Assets: {writes.get('nodes_created', 0)}, "
+              f"removed: {writes.get('nodes_deleted', 0)}")
+        print(f"   New Relationships: {writes.get('relationships_created', 0)}, "
+              f"removed: {writes.get('relationships_deleted', 0)}")
+        dangling = sum(stats['dangling'].values())
+        if dangling:
+            print(f"   ⚠️ {dangling} parent relationships skipped: parent not in the graph")
+        
+        print("\n🔍 Security Analysis:")
+        print("-" * 30)
+        for risk_level, count in sorted(stats['risks'].items(), key=lambda item: -item[1]):
+            print(f"   {risk_level} Risk: {count} assets")
+
+
+# Rows sampled per resource type to choose the neo4j-admin column types
+CSV_TYPE_SAMPLE = 1000
+CSV_ARRAY_DELIMITER = ';'
+
+
+def csv_type(value) -> Optional[str]:
+    """neo4j-admin column type for a property value; None when the value does not tell"""
+    if isinstance(value, bool):
+        return 'boolean'
+    if isinstance(value, int):
+        return 'long'
+    if isinstance(value, float):
+        return 'double'
+    if isinstance(value, (list, tuple)):
+        element = csv_type(value[0]) if value else None
+        return f"{element}[]" if element else None
+    return 'string' if value is not None else None
+
+
+def csv_value(value) -> str:
+    if value is None:
+        return ''
+    if isinstance(value, bool):
+        return 'true' if value else 'false'
+    if isinstance(value, (list, tuple)):
+        return CSV_ARRAY_DELIMITER.join(csv_value(item) for item in value)
+    return str(value)
+
+
+class RelationshipFile(NamedTuple):
+    path: str
+    handle: TextIO
+    writer: Any
+    relationship: str
+    properties: Dict[str, Any]
+    written: set  # (start key, end key) pairs already exported
+
+
+class BulkImportExporter(ProviderInventories):
+    """Offline alternative to AssetDiscoverySimulator for first loads of very large estates
+
+    Streams the inventories into header and data CSVs for
+    `neo4j-admin database import full`, one pair per label and per
+    (start label, type, end label), plus an import.sh that runs the import.
+    Nodes are deduplicated by identity key and relationships by endpoints;
+    only the sets of exported keys are held in memory.
+    """
+
+    def __init__(self, output_dir: str = BULK_IMPORT_DIR, inventory_path: Optional[str] = None,
+                 azure_inventory_path: Optional[str] = None, k8s_inventory_path: Optional[str] = None,
+                 update_tag: Optional[int] = None):
+        super().__init__(inventory_path, None, azure_inventory_path, k8s_inventory_path)
+        self.output_dir = output_dir
+        # Same bookkeeping properties the online writer sets, so later runs can update and sweep
+        self.update_tag = update_tag or int(time.time())
+        self.discovery_time = datetime.now(timezone.utc).isoformat(timespec='seconds')
+        self.node_files: List[str] = []
+        # (start label, type, end label) -> RelationshipFile, kept open until the export ends
+        self.relationship_files: Dict[tuple, RelationshipFile] = {}
+        self.exported_keys: Dict[str, set] = {}
+        self.counts = Counter()
+
+    def export(self):
+        print("📦 Exporting inventory for neo4j-admin bulk import...")
+        print("=" * 60)
+        started = time.monotonic()
+        os.makedirs(self.output_dir, exist_ok=True)
+        try:
+            for kind, spec in NODE_SPECS.items():
+                inventory = self.inventory_for(kind)
+                if inventory is not None:
+                    self.export_nodes(spec, inventory.records(kind))
+            for source, target, relationship, properties, edges in self.derived_edges():
+                self.export_relationships(source, target, relationship, properties, edges)
+        finally:
+            for relationship_file in self.relationship_files.values():
+                relationship_file.handle.close()
+        self.write_import_script()
+
+        print("=" * 60)
+        print(f"✅ Exported {self.counts['nodes']} nodes and {self.counts['relationships']} relationships "
+              f"to {self.output_dir} ({time.monotonic() - started:.1f}s)")
+        if self.counts['duplicates']:
+            print(f"   ♻️ {self.counts['duplicates']} duplicate records skipped")
+        if self.counts['dangling']:
+            print(f"   ⚠️ {self.counts['dangling']} parent relationships skipped: parent not in the inventory")
+
+    def export_nodes(self, spec: NodeSpec, rows: Iterable[dict]):
+        """Write one label's node CSV and the CSV of relationships to its parents"""
+        rows = iter(rows)
+        sample = list(islice(rows, CSV_TYPE_SAMPLE))
+        if not sample:
+            return
+        columns = [name for name in spec.properties if name != spec.key]
+        header = [f"{spec.key}:ID({spec.label})"]
+        for name in columns:
+            column_type = next(filter(None, (csv_type(row[name]) for row in sample)), None)
+            if column_type is None:
+                column_type = 'string[]' if any(isinstance(row[name], list) for row in sample) else 'string'
+            header.append(name if column_type == 'string' else f"{name}:{column_type}")
+        header += ['discovered_via_cartography:boolean', 'discovery_time:datetime', 'update_tag:long',
+                   'content_hash', ':LABEL']
+        data_path = self._write_header(f"{spec.label}.nodes", header)
+        self.node_files.append(data_path)
+
+        keys = self.exported_keys.setdefault(spec.label, set())
+        parent = spec.parent
+        if parent:
+            parent_keys = self.exported_keys.get(parent.label, set())
+            relationship_file = self._relationship_file(parent.label, parent.relationship, spec.label)
+        written = 0
+        with open(data_path, 'w', newline='', encoding='utf-8') as data:
+            writer = csv.writer(data)
+            for row in chain(sample, rows):
+                prepared = prepare_row(row, spec)
+                key = prepared['props'][spec.key]
+                if key not in keys:
+                    keys.add(key)
+                    writer.writerow([csv_value(key)] + [csv_value(prepared['props'][name]) for name in columns]
+                                    + ['true', self.discovery_time, self.update_tag, prepared['content_hash'],
+                                       spec.label])
+                    written += 1
+                else:
+                    self.counts['duplicates'] += 1
+                # Regions repeat per account, so every row still contributes its parent edge
+                if parent and prepared['parent_id']:
+                    if prepared['parent_id'] in parent_keys:
+                        self._write_relationship(relationship_file, prepared['parent_id'], key)
+                    else:
+                        self.counts['dangling'] += 1
+        self.counts['nodes'] += written
+        print(f"   ✅ {spec.label}: {written} nodes")
+
+    def export_relationships(self, source: NodeSpec, target: NodeSpec, relationship: str,
+                             properties: Dict[str, Any], edges: Iterable[List[str]]):
+        relationship_file = self._relationship_file(source.label, relationship, target.label, properties)
+        before = self.counts['relationships']
+        for source_key, target_key in edges:
+            self._write_relationship(relationship_file, source_key, target_key)
+        print(f"   🔗 {relationship} ({source.label} → {target.label}): "
+              f"{self.counts['relationships'] - before} relationships")
+
+    def _write_header(self, name: str, header: List[str]) -> str:
+        with open(os.path.join(self.output_dir, f"{name}.header.csv"), 'w', newline='',
+                  encoding='utf-8') as header_file:
+            csv.writer(header_file).writerow(header)
+        return os.path.join(self.output_dir, f"{name}.csv")
+
+    def _relationship_file(self, start_label: str, relationship: str, end_label: str,
+                           properties: Optional[Dict[str, Any]] = None) -> RelationshipFile:
+        """The open CSV for one (start label, type, end label), created on first use
+
+        `properties` are constant for the relationship type and become extra string columns.
+        """
+        properties = properties or {}
+        file_key = (start_label, relationship, end_label)
+        if file_key not in self.relationship_files:
+            data_path = self._write_header(f"{start_label}-{relationship}-{end_label}.relationships", [
+                f":START_ID({start_label})", f":END_ID({end_label})", ':TYPE',
+                'discovered_via_cartography:boolean', 'discovery_time:datetime', 'update_tag:long',
+                *properties
+            ])
+            handle = open(data_path, 'w', newline='', encoding='utf-8')
+            self.relationship_files[file_key] = RelationshipFile(data_path, handle, csv.writer(handle),
+                                                                 relationship, properties, set())
+        return self.relationship_files[file_key]
+
+    def _write_relationship(self, relationship_file: RelationshipFile, start_key: str, end_key: str):
+        if (start_key, end_key) in relationship_file.written:
+            return
+        relationship_file.written.add((start_key, end_key))
+        relationship_file.writer.writerow([start_key, end_key, relationship_file.relationship, 'true',
+                                           self.discovery_time, self.update_tag,
+                                           *map(csv_value, relationship_file.properties.values())])
+        self.counts['relationships'] += 1
+
+    def write_import_script(self):
+        """Write import.sh next to the CSVs with the matching neo4j-admin command"""
+        def pair(data_path):
+            name = os.path.basename(data_path)
+            return f"{name[:-len('.csv')]}.header.csv,{name}"
+
+        arguments = [f"    --nodes={pair(path)}" for path in self.node_files]
+        arguments += [f"    --relationships={pair(relationship_file.path)}"
+                      for relationship_file in self.relationship_files.values() if relationship_file.written]
+        script = "\n".join([
+            "#!/bin/sh",
+            "# Bulk-load the exported discovery CSVs into a new database. Neo4j must be stopped, e.g.:",
+            "#   docker compose stop neo4j",
+            f"#   docker compose run --rm neo4j sh /var/lib/neo4j/import/{os.path.basename(self.output_dir)}/import.sh",
+            "# Start Neo4j again and run simulate-discovery.py once to create the constraints and indexes.",
+            'cd "$(dirname "$0")"',
+            "exec neo4j-admin database import full neo4j --overwrite-destination \\",
+            f"    --array-delimiter='{CSV_ARRAY_DELIMITER}' --multiline-fields=true \\",
+            " \\\n".join(arguments),
+            ""
+        ])
+        path = os.path.join(self.output_dir, 'import.sh')
+        with open(path, 'w', encoding='utf-8') as script_file:
+            script_file.write(script)
+        os.chmod(path, 0o755)
+        print(f"   📝 {path}")
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Cartography-style asset discovery simulation")
+    parser.add_argument("--batch-size", type=int, default=DISCOVERY_BATCH_SIZE,
+                        help="rows per UNWIND write statement (default: %(default)s)")
+    parser.add_argument("--inventory", metavar="PATH",
+                        help="stream resources from an inventory export such as "
+                             "mock-data/aws-resources.json instead of the built-in demo estate")
+    parser.add_argument("--azure-inventory", metavar="PATH",
+                        help="also discover Azure from an export such as mock-azure-data.json")
+    parser.add_argument("--k8s-inventory", metavar="PATH",
+                        help="also discover Kubernetes from an export such as mock-k8s-data.json")
+    parser.add_argument("--export-csv", metavar="DIR", nargs="?", const=BULK_IMPORT_DIR,
+                        help="write neo4j-admin bulk import CSVs instead of writing to Neo4j "
+                             "(default directory: %(const)s)")
+    parser.add_argument("--checkpoint", metavar="PATH", default=DISCOVERY_CHECKPOINT,
+                        help="Record committed chunks here so an interrupted run resumes where it stopped")
+    parser.add_argument("--telemetry", metavar="PATH", default=DISCOVERY_TELEMETRY,
+                        help="Write per-phase timings and write counters to this JSON file")
+    parser.add_argument("--chunk-log", metavar="PATH",
+                        help="Append one JSON line per written chunk to this file")
+    parser.add_argument("--async-writes", metavar="N", type=int, default=DISCOVERY_ASYNC_WRITES,
+                        help="Keep N write batches in flight on the async driver while reading continues "
+                             "(default: %(default)s, synchronous)")
+    parser.add_argument("--in-memory", action="store_true",
+                        help="discover into an in-process graph instead of Neo4j, e.g. to profile discovery")
+    parser.add_argument("--no-sweep", dest="sweep", action="store_false",
+                        help="keep resources that were not seen in this run")
+    parser.add_argument("--phase-workers", type=int, default=DISCOVERY_PHASE_WORKERS,
+                        help="discovery phases allowed to run concurrently (default: %(default)s)")
+    parser.add_argument("--shard-workers", type=int, default=DISCOVERY_SHARD_WORKERS,
+                        help="worker processes for per-(account, region) shards; "
+                             "0 runs the phases in this process (default: %(default)s)")
+    parser.add_argument("--serve", action="store_true",
+                        help="run the discovery job service behind POST /discover instead of discovering once")
+    parser.add_argument("--port", type=int, default=DISCOVERY_SERVICE_PORT,
+                        help="--serve port (default: %(default)s)")
+    parser.add_argument("--serve-workers", type=int, default=1,
+                        help="--serve jobs allowed to run at the same time (default: %(default)s)")
+    return parser.parse_args(argv)
+
+
+def serve_discovery(args):
+    """Answer /discover with jobs that run the simulator configured by the command line"""
+    def run(options: dict, publish: Callable[[dict], None]) -> dict:
+        simulator = AssetDiscoverySimulator(batch_size=args.batch_size, inventory_path=args.inventory,
+                                            sweep=options.get('sweep', args.sweep),
+                                            phase_workers=args.phase_workers, shard_workers=args.shard_workers,
+                                            azure_inventory_path=args.azure_inventory,
+                                            k8s_inventory_path=args.k8s_inventory, telemetry_path=args.telemetry,
+                                            async_writes=args.async_writes, progress=publish)
+        try:
+            simulator.run_discovery_simulation()
+            return simulator.stats.to_dict()
+        finally:
+            simulator.close()
+    
+    serve(run, workers=args.serve_workers, port=args.port)
+
 
 def main():
     """Main execution function"""
-    simulator = AssetDiscoverySimulator()
+    args = parse_args()
+    if args.export_csv:
+        try:
+            BulkImportExporter(args.export_csv, inventory_path=args.inventory,
+                               azure_inventory_path=args.azure_inventory,
+                               k8s_inventory_path=args.k8s_inventory).export()
+        except Exception as e:
+            print(f"❌ Bulk import export failed: {e}")
+            sys.exit(1)
+        return
+    if args.serve:
+        serve_discovery(args)
+        return
+    
+    simulator = AssetDiscoverySimulator(batch_size=args.batch_size, inventory_path=args.inventory,
+                                        sweep=args.sweep, phase_workers=args.phase_workers,
+                                        shard_workers=args.shard_workers,
+                                        azure_inventory_path=args.azure_inventory,
+                                        k8s_inventory_path=args.k8s_inventory,
+                                        checkpoint_path=args.checkpoint, telemetry_path=args.telemetry,
+                                        chunk_log=args.chunk_log, async_writes=args.async_writes,
+                                        sink=InMemoryGraph() if args.in_memory else None)
     
     try:
         simulator.run_discovery_simulation()
+        simulator.checkpoint.clear()
         print("\n🎯 Asset discovery complete!")
+        if args.in_memory:
+            print(f"🧠 In-memory graph holds {simulator.sink.node_count} nodes; nothing was written to Neo4j")
+            return
         print("💡 Use Neo4j Browser to explore discovered infrastructure")
         print("🔍 Try queries like:")
         print("   MATCH (n) WHERE n.discovered_via_cartography = true RETURN n LIMIT 25")
@@ -555,6 +1979,8 @@ def main():
         
     except Exception as e:
         print(f"❌ Discovery simulation failed: {e}")
+        if args.checkpoint:
+            print(f"💾 Progress saved to {args.checkpoint}; rerun with the same --checkpoint to resume")
         sys.exit(1)
     finally:
         simulator.close()
@@ -0,0 +1,19 @@
+"""Puts the cartography scripts on sys.path and loads simulate-discovery.py, whose name is not importable"""
+
+import importlib.util
+import os
+import sys
+
+import pytest
+
+CARTOGRAPHY_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, CARTOGRAPHY_DIR)
+
+
+@pytest.fixture(scope='session')
+def discovery():
+    spec = importlib.util.spec_from_file_location(
+        'simulate_discovery', os.path.join(CARTOGRAPHY_DIR, 'simulate-discovery.py'))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
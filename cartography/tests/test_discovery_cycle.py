@@ -0,0 +1,69 @@
+"""Ingest, re-ingest and sweep the mock AWS export on the in-memory graph"""
+
+import json
+import os
+from collections import Counter
+
+import pytest
+
+from graph_sink import InMemoryGraph
+
+MOCK_INVENTORY = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                              'mock-data', 'aws-resources.json')
+
+
+@pytest.fixture
+def inventories(tmp_path):
+    """The mock export, and a copy with the last EC2 instance and S3 bucket removed"""
+    with open(MOCK_INVENTORY) as f:
+        inventory = json.load(f)
+    removed = {'EC2Instance': inventory['ec2_instances'][-1]['instance_id'],
+               'S3Bucket': inventory['s3_buckets'][-1]['arn']}
+    full, reduced = tmp_path / 'full.json', tmp_path / 'reduced.json'
+    full.write_text(json.dumps(inventory))
+    inventory['ec2_instances'].pop()
+    inventory['s3_buckets'].pop()
+    reduced.write_text(json.dumps(inventory))
+    return str(full), str(reduced), removed
+
+
+def discover(discovery, graph, inventory_path, update_tag):
+    simulator = discovery.AssetDiscoverySimulator(sink=graph, shard_workers=0, inventory_path=inventory_path,
+                                                  update_tag=update_tag)
+    simulator.run_discovery_simulation()
+    simulator.close()
+    return simulator
+
+
+def labels(graph):
+    return Counter(graph.label_name(label) for label in graph.node_labels() if label >= 0)
+
+
+def edges(graph):
+    _, targets, _, _ = graph.adjacency()
+    return len(targets)
+
+
+def test_ingest_reingest_sweep(discovery, inventories):
+    full, reduced, removed = inventories
+    graph = InMemoryGraph()
+
+    first = discover(discovery, graph, full, 100)
+    ingested, linked = labels(graph), edges(graph)
+    assert ingested['EC2Instance'] == 2 and ingested['S3Bucket'] == 3
+    assert sum(first.changed_counts.values()) == sum(ingested.values())
+
+    # Nothing changed: every row hashes the same, and nothing is stale
+    second = discover(discovery, graph, full, 200)
+    assert sum(second.changed_counts.values()) == 0
+    assert labels(graph) == ingested and edges(graph) == linked
+    assert all(graph.node(int(node))['update_tag'] == 200 for node in graph.nodes('EC2Instance'))
+
+    # The removed resources are swept with their relationships; the rest stay
+    discover(discovery, graph, reduced, 300)
+    swept = labels(graph)
+    assert swept == ingested - Counter(removed.keys())
+    assert edges(graph) < linked
+    assert graph.find('EC2Instance', 'id', removed['EC2Instance']) is None
+    assert graph.find('S3Bucket', 'arn', removed['S3Bucket']) is None
+    assert all(graph.node(int(node))['update_tag'] == 300 for label in swept for node in graph.nodes(label))
@@ -0,0 +1,82 @@
+"""DiscoveryService joins requests for a job that is already queued or running"""
+
+import json
+import threading
+import urllib.request
+
+import pytest
+
+from discovery_service import DiscoveryService, make_server
+
+
+@pytest.fixture
+def release():
+    return threading.Event()
+
+
+@pytest.fixture
+def service(release):
+    """A service whose jobs block until `release` is set, publishing one event first"""
+    def run(options, publish):
+        publish({'type': 'phase', 'phase': 'accounts'})
+        release.wait(5)
+        return {'assets': {'AWSAccount': 1}, 'options': options}
+
+    service = DiscoveryService(run, workers=2)
+    yield service
+    release.set()
+    service.shutdown()
+
+
+def finish(job):
+    for _ in job.follow(keepalive=1):
+        pass
+
+
+def test_same_options_join_the_active_job(service, release):
+    job, deduplicated = service.submit({'sweep': True})
+    assert not deduplicated
+    again, deduplicated = service.submit({'sweep': True})
+    assert deduplicated and again is job
+
+    other, deduplicated = service.submit({'sweep': False})
+    assert not deduplicated and other is not job
+    assert len(service.list_jobs()) == 2
+
+    release.set()
+    finish(job)
+    finish(other)
+    assert job.status == 'succeeded' and job.summary['options'] == {'sweep': True}
+    assert [event['type'] for event in job.events] == ['status', 'phase', 'status']
+
+
+def test_finished_job_is_not_joined(service, release):
+    release.set()
+    job, _ = service.submit({})
+    finish(job)
+    rerun, deduplicated = service.submit({})
+    assert not deduplicated and rerun is not job
+    finish(rerun)
+    assert service.stats()['totalAssets'] == 1
+
+
+def test_discover_requests_are_deduplicated_over_http(service):
+    server = make_server(service, port=0, host='127.0.0.1')
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f"http://127.0.0.1:{server.server_address[1]}/discover"
+
+    def post(body):
+        request = urllib.request.Request(url, data=json.dumps(body).encode(), method='POST',
+                                         headers={'Content-Type': 'application/json'})
+        with urllib.request.urlopen(request, timeout=5) as response:
+            return response.status, json.load(response)
+
+    try:
+        status, first = post({'sweep': True, 'ignored': 1})
+        _, second = post({'sweep': 1})
+        assert status == 202
+        assert not first['deduplicated'] and second['deduplicated']
+        assert second['job_id'] == first['job_id']
+    finally:
+        server.shutdown()
+        server.server_close()
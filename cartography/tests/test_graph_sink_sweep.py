@@ -0,0 +1,86 @@
+"""The stale sweep behaves the same on the in-memory graph and on Neo4j
+
+The Neo4j case runs only when NEO4J_TEST_URI points at a scratch database
+(NEO4J_TEST_USER / NEO4J_TEST_PASSWORD default to the docker-compose ones).
+"""
+
+import os
+
+import pytest
+
+from graph_sink import InMemoryGraph, Neo4jGraphSink
+
+NEO4J_TEST_URI = os.environ.get('NEO4J_TEST_URI')
+LABELS = ('SweepTestAccount', 'SweepTestVPC')
+
+
+@pytest.fixture(params=['memory', 'neo4j'])
+def sink(request):
+    if request.param == 'memory':
+        yield InMemoryGraph()
+        return
+    if not NEO4J_TEST_URI:
+        pytest.skip('NEO4J_TEST_URI is not set')
+    sink = Neo4jGraphSink(NEO4J_TEST_URI, (os.environ.get('NEO4J_TEST_USER', 'neo4j'),
+                                           os.environ.get('NEO4J_TEST_PASSWORD', 'cloudsecurity')))
+    clear = [f"MATCH (n:{label}) DETACH DELETE n" for label in LABELS]
+    with sink.driver.session() as session:
+        for statement in clear:
+            session.run(statement).consume()
+        yield sink
+        for statement in clear:
+            session.run(statement).consume()
+    sink.close()
+
+
+@pytest.fixture
+def specs(discovery):
+    account = discovery.NodeSpec('SweepTestAccount', 'id', ('id',))
+    vpc = discovery.NodeSpec('SweepTestVPC', 'id', ('id',),
+                             discovery.ParentSpec('SweepTestAccount', 'id', 'account_id', 'CONTAINS_VPC'))
+    return account, vpc
+
+
+def rows(spec, *keys, parent_id=None):
+    return [{'props': {spec.key: key}, 'content_hash': key, 'parent_id': parent_id} for key in keys]
+
+
+def add_untagged(sink, account, vpc):
+    """An account and a PEERS_WITH edge written by something other than discovery, so without update_tag"""
+    if isinstance(sink, InMemoryGraph):
+        a, _ = sink.merge_node(account.label, account.key, 'manual')
+        b, _ = sink.merge_node(vpc.label, vpc.key, 'vpc-1')
+        sink.merge_relationship(b, a, 'PEERS_WITH')
+        return
+    with sink.driver.session() as session:
+        session.run(f"""
+            CREATE (a:{account.label} {{id: 'manual'}})
+            WITH a MATCH (b:{vpc.label} {{id: 'vpc-1'}})
+            CREATE (b)-[:PEERS_WITH]->(a)
+        """).consume()
+
+
+def keys(sink, spec):
+    if isinstance(sink, InMemoryGraph):
+        return {sink.node(int(node_id))[spec.key] for node_id in sink.nodes(spec.label)}
+    with sink.driver.session() as session:
+        return {record['key'] for record in session.run(f"MATCH (n:{spec.label}) RETURN n.{spec.key} AS key")}
+
+
+def test_sweep_keeps_untagged_nodes_and_edges(sink, specs):
+    account, vpc = specs
+    sink.write_nodes(account, 1, rows(account, 'acct-1', 'acct-2'))
+    sink.write_nodes(vpc, 1, rows(vpc, 'vpc-1', parent_id='acct-1'))
+    sink.write_relationships(vpc, account, 'PEERS_WITH', {}, 1, [['vpc-1', 'acct-2']])
+    add_untagged(sink, account, vpc)
+
+    sink.write_nodes(account, 2, rows(account, 'acct-1'))
+    sink.write_nodes(vpc, 2, rows(vpc, 'vpc-1', parent_id='acct-1'))
+
+    edges, _ = sink.sweep_relationships(vpc, account, 'PEERS_WITH', 2, 100)
+    nodes, _ = sink.sweep_nodes(account, 2, 100)
+
+    assert edges['deleted'] == 1
+    assert nodes['deleted'] == 1
+    assert keys(sink, account) == {'acct-1', 'manual'}
+    assert keys(sink, vpc) == {'vpc-1'}
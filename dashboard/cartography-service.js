@@ -9,42 +9,49 @@ class CartographyService {
         this.discoveryInProgress = false;
         this.discoveryPhases = [
             { 
+                key: 'foundation',
                 name: 'Foundation Discovery', 
                 duration: 2000, 
                 message: 'Discovering AWS accounts and regions...',
                 detail: 'Cartography scans AWS API endpoints to enumerate accounts, regions, and availability zones. Uses boto3 SDK with read-only permissions.'
             },
             { 
+                key: 'iam',
                 name: 'Identity Discovery', 
                 duration: 3000, 
                 message: 'Mapping IAM users, roles, and policies...',
                 detail: 'Enumerating IAM entities using list_users(), list_roles(), and get_role_policy() calls. Analyzing trust relationships and permissions.'
             },
             { 
+                key: 'compute',
                 name: 'Compute Discovery', 
                 duration: 2000, 
                 message: 'Discovering EC2 instances and networking...',
                 detail: 'Scanning EC2 instances, VPCs, security groups, and networking configurations. Identifying instance profiles and metadata access.'
             },
             { 
+                key: 'storage',
                 name: 'Storage Discovery', 
                 duration: 2000, 
                 message: 'Mapping S3 buckets and databases...',
                 detail: 'Enumerating S3 buckets, analyzing bucket policies, and discovering RDS instances. Checking for public access and encryption settings.'
             },
             { 
+                key: 'serverless',
                 name: 'Serverless Discovery', 
                 duration: 2000, 
                 message: 'Discovering Lambda functions and APIs...',
                 detail: 'Mapping Lambda functions, API Gateway endpoints, and serverless execution roles. Analyzing environment variables and trigger configurations.'
             },
             { 
+                key: 'relationships',
                 name: 'Relationship Discovery', 
                 duration: 2000, 
                 message: 'Analyzing resource relationships...',
                 detail: 'Building graph relationships between discovered resources. Mapping IAM role assumptions, resource access patterns, and trust relationships.'
             },
             { 
+                key: 'security',
                 name: 'Security Analysis', 
                 duration: 1000, 
                 message: 'Performing security posture analysis...',
@@ -66,22 +73,13 @@ class CartographyService {
         this.updateDiscoveryUI('starting');
 
         try {
-            // Simulate progressive discovery phases
-            for (let i = 0; i < this.discoveryPhases.length; i++) {
-                const phase = this.discoveryPhases[i];
-                const progress = ((i + 1) / this.discoveryPhases.length) * 100;
-                
-                this.updateDiscoveryPhase(phase.name, phase.message, progress);
-                
-                // Simulate phase duration
-                await this.sleep(phase.duration);
-                
-                // Update asset counts as discovery progresses
-                this.updateAssetCounts(i + 1);
+            // Run discovery on the Cartography service and follow its real progress
+            const job = await this.triggerCartographySimulation();
+            if (job) {
+                await this.followDiscoveryJob(job);
+            } else {
+                await this.simulateDiscoveryPhases();
             }
-
-            // Trigger the actual Cartography simulation
-            await this.triggerCartographySimulation();
             
             this.updateDiscoveryUI('completed');
             this.discoveryInProgress = false;
@@ -94,7 +92,75 @@ class CartographyService {
     }
 
     /**
-     * Trigger the actual Cartography container simulation
+     * Timed walk through the phases, used when the Cartography service is unreachable
+     */
+    async simulateDiscoveryPhases() {
+        for (let i = 0; i < this.discoveryPhases.length; i++) {
+            const phase = this.discoveryPhases[i];
+            const progress = ((i + 1) / this.discoveryPhases.length) * 100;
+            
+            this.updateDiscoveryPhase(phase.name, phase.message, progress);
+            
+            // Simulate phase duration
+            await this.sleep(phase.duration);
+            
+            // Update asset counts as discovery progresses
+            this.updateAssetCounts(i + 1);
+        }
+    }
+
+    /**
+     * Follow a discovery job's server-sent events until it succeeds or fails
+     * (a job started by another user is joined rather than started twice)
+     */
+    followDiscoveryJob(job) {
+        return new Promise((resolve, reject) => {
+            const events = new EventSource(`${this.cartographyApiUrl}${job.events_url}`);
+            let totalPhases = this.discoveryPhases.length;
+            
+            events.addEventListener('plan', (event) => {
+                totalPhases = JSON.parse(event.data).total_phases || totalPhases;
+            });
+            
+            events.addEventListener('phase', (event) => {
+                const data = JSON.parse(event.data);
+                const known = this.discoveryPhases.find(phase => phase.key === data.phase);
+                const progress = (data.completed_phases / totalPhases) * 100;
+                const message = data.status === 'started'
+                    ? (known ? known.message : data.banner)
+                    : `${data.status} (${data.assets} assets so far)`;
+                
+                this.updateDiscoveryPhase(known ? known.name : data.phase, message, progress);
+                this.setDiscoveredCounts(data.assets, data.relationships);
+            });
+            
+            events.addEventListener('summary', (event) => {
+                const data = JSON.parse(event.data);
+                this.setDiscoveredCounts(data.assets, data.relationships);
+            });
+            
+            events.addEventListener('status', (event) => {
+                const data = JSON.parse(event.data);
+                if (data.status === 'succeeded') {
+                    events.close();
+                    resolve(data);
+                } else if (data.status === 'failed') {
+                    events.close();
+                    reject(new Error(data.error || 'Discovery job failed'));
+                }
+            });
+            
+            events.onerror = () => {
+                // The service closes the stream after the final status, which is handled above
+                events.close();
+                reject(new Error('Lost connection to the discovery service'));
+            };
+        });
+    }
+
+    /**
+     * Start (or join) a discovery job on the Cartography container
+     * Returns the job, or null when the service is not available
      */
     async triggerCartographySimulation() {
         try {
@@ -111,15 +177,17 @@ class CartographyService {
 
             if (!response.ok) {
                 console.warn('Cartography API not available, using simulation mode');
-                return;
+                return null;
             }
 
-            const result = await response.json();
-            console.log('Cartography discovery result:', result);
+            const job = await response.json();
+            console.log(job.deduplicated ? 'Joined running discovery job:' : 'Started discovery job:', job.job_id);
+            return job;
             
         } catch (error) {
             // Cartography container might not be running, continue with UI simulation
             console.warn('Could not connect to Cartography API, using simulation mode:', error);
+            return null;
         }
     }
 
@@ -173,6 +241,22 @@ class CartographyService {
         }
     }
 
+    /**
+     * Show the asset and relationship counts reported by the discovery service
+     */
+    setDiscoveredCounts(assetCount, relationshipCount) {
+        const discoveredCountElement = document.getElementById('discoveredCount');
+        const relationshipCountElement = document.getElementById('relationshipCount');
+        
+        if (discoveredCountElement && assetCount !== undefined) {
+            this.animateCount(discoveredCountElement, assetCount);
+        }
+        
+        if (relationshipCountElement && relationshipCount !== undefined) {
+            this.animateCount(relationshipCountElement, relationshipCount);
+        }
+    }
+
     /**
      * Animate counter updates
      */